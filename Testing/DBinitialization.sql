@@ -51,7 +51,8 @@ CREATE TABLE daily_price ( id int NOT NULL AUTO_INCREMENT,
                           close_price decimal(19,4) NULL, 
                           adj_factor decimal(19,10) NULL, 
                           volume bigint NULL, 
-                          PRIMARY KEY (id), KEY index_data_vendor_id (data_vendor_id), KEY index_symbol_id (symbol_id)) 
+                          PRIMARY KEY (id), KEY index_data_vendor_id (data_vendor_id), KEY index_symbol_id (symbol_id), 
+                          UNIQUE KEY index_symbol_price_date (symbol_id, price_date)) 
                           ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8;
 
 #-------------------------------------------------------------------------------------------------------------------------
@@ -114,4 +115,6 @@ CREATE TABLE daily_price (
             ON UPDATE CASCADE
             ON DELETE CASCADE
         );
+
+CREATE UNIQUE INDEX idx_daily_price_symbol_date ON daily_price (symbol_id, price_date);
         
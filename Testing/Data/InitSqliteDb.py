@@ -71,6 +71,8 @@ def main(path:str ="~/Thanatos/Data/securities_master.db"):
             ON DELETE CASCADE
         );
         """ )
+    # One bar per symbol and day; also serves the (symbol_id, price_date BETWEEN ...) lookups of the data handlers
+    cur.execute("CREATE UNIQUE INDEX idx_daily_price_symbol_date ON daily_price (symbol_id, price_date);")
         
     con.commit()
     
@@ -1,2 +1,8 @@
 CREATE UNIQUE INDEX idx_symbol ON symbol (ticker);
 CREATE UNIQUE INDEX idx_exchange ON exchange (id);
+-- Run remove_daily_price_dup.sql first on existing dbs, or use migrate_daily_price_index.py which also reports timings
+CREATE UNIQUE INDEX idx_daily_price_symbol_date ON daily_price (symbol_id, price_date);
+-- Optional covering index for the data handler query
+-- CREATE INDEX idx_daily_price_covering ON daily_price (symbol_id, price_date, open_price, high_price, low_price, close_price, volume, adj_factor);
+-- MySQL equivalent:
+-- ALTER TABLE daily_price ADD UNIQUE KEY index_symbol_price_date (symbol_id, price_date);
@@ -1,13 +1,16 @@
+import os
+import sys
 import pandas as pd
 from datetime import datetime as dt
 import sqlite3
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from price_ingest import frame_to_price_rows, upsert_daily_prices, format_upsert_stats
 
-con = sqlite3.connect("~/Thanatos/Data/securities_master.db")
-cur = con.cursor()
 
+CSV_COLUMNS = ['price_date', 'ticker', 'open_price', 'high_price', 'low_price', 'close_price', 'volume', 'adj_factor']
+CSV_DTYPES = {'ticker': str, 'open_price': 'float64', 'high_price': 'float64', 'low_price': 'float64', 'close_price': 'float64', 'volume': 'float64', 'adj_factor': 'float64'}
 
-prices = []
 symbol_list = ['600000','600004','600009','600010','600011','600015','600016','600018','600019','600023','600025','600027','600028','600029','600030','600031',
  '600036','600038','600048','600050','600061','600066','600068','600085','600089','600100','600104','600109','600111','600115','600118','600153','600170','600176',
  '600177','600183','600188','600196','600208','600219','600221','600233','600271','600276','600297','600299','600309','600332','600340','600346','600352','600362',
@@ -26,35 +29,35 @@ symbol_list = ['600000','600004','600009','600010','600011','600015','600016','6
  '002601','002602','002607','002624','002673','002714','002736','002739','002773','002841','002916','002938','002939','002945','002958','300003','300015','300017',
  '300024','300033','300059','300070','300122','300124','300136','300142','300144','300347','300408','300413','300433','300498']
 
- 
-sym = pd.read_sql_query("SELECT id, ticker from symbol;",con = con, index_col='ticker')
-
-for i in symbol_list:
-    data = pd.read_csv(i+".csv",header=0)
-    data.price_date = pd.to_datetime(data.price_date,format="%Y-%m-%d")
-    sym_id = int(sym.at[i,'id'])
-    for j, day in enumerate(data.price_date):
-        prices.append(
-            (
-            3,
-            sym_id,
-            day.to_pydatetime(),
-            dt.utcnow(),
-            dt.utcnow(),
-            data.iat[j,2], # d1, open_price
-            data.iat[j,3], # d2, high_price
-            data.iat[j,4], # d3, low_price
-            data.iat[j,5], # d4, close_price
-            int(data.iat[j,6]), # d5, volume
-            data.iat[j,7] # d6, adj_factor
-            )
-        )
-        
-column_str = (
-        "data_vendor_id, symbol_id, price_date, created_date, last_updated_date, open_price, high_price, low_price, close_price, volume, adj_factor"
-    )
-insert_str = ("?, " * 11)[:-2]
-final_str = ("INSERT INTO daily_price (%s) VALUES (%s)" % (column_str, insert_str))
-cur.executemany(final_str, prices)
-con.commit()
-con.close()
+
+
+def read_price_csv(path):
+    """
+    Reads one symbol's CSV with typed columns, parsing price_date for the whole column at once.
+    """
+    return pd.read_csv(path, header=0, names=CSV_COLUMNS, dtype=CSV_DTYPES, parse_dates=['price_date'])
+
+
+def main(path:str ="~/Thanatos/Data/securities_master.db", csv_dir:str ="./", data_vendor_id:int =3, batch_size:int =20000):
+    """
+    Streams the CSV of every symbol in symbol_list into daily_price.
+    Only one symbol is held in memory at a time and rows are committed in chunks of batch_size, so peak memory stays flat.
+    Existing bars are updated in place, no need to run remove_daily_price_dup.sql afterwards.
+    """
+    con = sqlite3.connect(path)
+    sym = pd.read_sql_query("SELECT id, ticker from symbol;",con = con, index_col='ticker')
+    totals = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'seconds': 0.0}
+    for i in symbol_list:
+        data = read_price_csv(os.path.join(csv_dir, i + ".csv"))
+        sym_id = int(sym.at[i,'id'])
+        stats = upsert_daily_prices(con, frame_to_price_rows(data, data_vendor_id, sym_id, now=dt.utcnow()), engine="SQLite", batch_size=batch_size)
+        for k in totals:
+            totals[k] += stats[k]
+    totals['inserted_per_second'] = totals['inserted'] / totals['seconds'] if totals['seconds'] > 0 else 0.0
+    totals['updated_per_second'] = totals['updated'] / totals['seconds'] if totals['seconds'] > 0 else 0.0
+    print(format_upsert_stats(totals))
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import sqlite3
+import time
+
+
+UNIQUE_INDEX = "idx_daily_price_symbol_date"
+COVERING_INDEX = "idx_daily_price_covering"
+
+# The query issued by the SQLite data handlers, see TuShare.get_daily_universe_sqlite()
+HANDLER_SQL = (
+    "SELECT sym.ticker, dp.price_date, dp.open_price, dp.high_price, dp.low_price, dp.close_price, dp.volume, dp.adj_factor "
+    "FROM daily_price AS dp INNER JOIN symbol AS sym ON sym.id = dp.symbol_id "
+    "WHERE sym.ticker IN (%s) AND dp.price_date BETWEEN ? AND ? "
+    "ORDER BY sym.ticker, dp.price_date ASC;"
+)
+
+
+def list_indexes(con):
+    """
+    Returns the names of the indexes defined on daily_price.
+    """
+    return [r[1] for r in con.execute("PRAGMA index_list(daily_price);").fetchall()]
+
+
+def query_plan(con, tickers, startdate, enddate):
+    """
+    Returns the EXPLAIN QUERY PLAN lines of the handler query as a list of str.
+    """
+    sql = "EXPLAIN QUERY PLAN " + HANDLER_SQL % ", ".join(["?"] * len(tickers))
+    return [r[-1] for r in con.execute(sql, list(tickers) + [startdate, enddate]).fetchall()]
+
+
+def time_query(con, tickers, startdate, enddate, repeat=3):
+    """
+    Returns the best wall time in seconds and the row count of the handler query.
+    """
+    sql = HANDLER_SQL % ", ".join(["?"] * len(tickers))
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = len(con.execute(sql, list(tickers) + [startdate, enddate]).fetchall())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, rows
+
+
+def remove_duplicates(con):
+    """
+    Keeps the first row of every (symbol_id, price_date) pair, as remove_daily_price_dup.sql does.
+    Required before the unique index can be created. Returns the number of deleted rows.
+    """
+    cur = con.execute("""
+        DELETE FROM daily_price
+        WHERE id NOT IN (
+            SELECT MIN(id)
+            FROM daily_price
+            GROUP BY symbol_id, price_date
+        );
+        """)
+    con.commit()
+    return cur.rowcount
+
+
+def migrate(con, covering=False):
+    """
+    Adds the unique composite index on (symbol_id, price_date), optionally the covering index, and refreshes the planner statistics.
+    The unique index also stops duplicate bars from being inserted again.
+    Returns the number of duplicate rows removed.
+    """
+    removed = remove_duplicates(con)
+    con.execute("CREATE UNIQUE INDEX IF NOT EXISTS %s ON daily_price (symbol_id, price_date);" % UNIQUE_INDEX)
+    if covering:
+        # Lets the handler query be answered from the index alone, at the cost of roughly doubling the table size on disk
+        con.execute(
+            "CREATE INDEX IF NOT EXISTS %s ON daily_price "
+            "(symbol_id, price_date, open_price, high_price, low_price, close_price, volume, adj_factor);" % COVERING_INDEX
+        )
+    con.execute("ANALYZE;")
+    con.commit()
+    return removed
+
+
+def report(con, tickers, startdate, enddate, label):
+    """
+    Prints the query plan and timing of the handler query.
+    """
+    elapsed, rows = time_query(con, tickers, startdate, enddate)
+    print("%s: %d rows in %.4f s" % (label, rows, elapsed))
+    for line in query_plan(con, tickers, startdate, enddate):
+        print("    " + line)
+    return elapsed
+
+
+def main(path:str ="./securities_master.db", covering:bool =False, n_tickers:int =300, startdate:str ='2000-01-01 00:00:00', enddate:str ='2030-01-01 00:00:00'):
+    """
+    Migrates daily_price of the SQLite db at path and reports the handler query before and after.
+    """
+    con = sqlite3.connect(path)
+    tickers = [r[0] for r in con.execute("SELECT ticker FROM symbol ORDER BY id LIMIT ?;", (n_tickers,)).fetchall()]
+    print("Indexes before: %s" % list_indexes(con))
+    before = report(con, tickers, startdate, enddate, "Before")
+    removed = migrate(con, covering=covering)
+    print("Removed %d duplicate rows" % removed)
+    print("Indexes after: %s" % list_indexes(con))
+    after = report(con, tickers, startdate, enddate, "After")
+    print("Speed-up: %.1fx" % (before / after if after > 0 else float('inf')))
+    con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add the (symbol_id, price_date) indexes to daily_price")
+    parser.add_argument('path', nargs='?', default="./securities_master.db")
+    parser.add_argument('--covering', action='store_true', help="Also add the covering index for the OHLCV + adj_factor columns")
+    parser.add_argument('--tickers', type=int, default=300, help="Number of tickers used in the benchmark query")
+    args = parser.parse_args()
+    main(path=args.path, covering=args.covering, n_tickers=args.tickers)
@@ -1,3 +1,4 @@
+-- Only needed for dbs created before the unique (symbol_id, price_date) index, see migrate_daily_price_index.py
 DELETE FROM daily_price
 WHERE id NOT IN (
     SELECT MIN(id)
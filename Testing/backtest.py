@@ -6,11 +6,16 @@ except ImportError:
     import queue
 import time
 
+from bar_source import BarSource
+from data import BarDataHandler
+from event import EventBus, EventType
+from progress import ConsoleProgress
+
 class Backtest(object):
     """
     Enscapsulates the settings and components for carrying out an event-driven backtest.
     """
-    def __init__(self, csv_dir, symbol_list, initial_capital, heartbeat, startdate, enddate, data_handler, execution_handler, portfolio, strategy, window):
+    def __init__(self, csv_dir, symbol_list, initial_capital, heartbeat, startdate, enddate, data_handler, execution_handler, portfolio, strategy, window, event_bus=True, progress=None, stop_when=None):
         """
         Initialises the backtest.
 
@@ -21,11 +26,15 @@ class Backtest(object):
         heartbeat - Backtest "heartbeat" in seconds.
         start_date - The start datetime of the strategy.
         end_date - The end datetime of the strategy.
-        data_handler - (Class) Handles the market data feed.
+        data_handler - (Class) Handles the market data feed, or a BarSource instance served through BarDataHandler.
         execution_handler - (Class) Handles the orders/fills for trades.
         portfolio - (Class) Keeps track of portfolio current and prior positions.
         strategy - (Class) Generates signals based on market data.
         window = Params needed for Strategy Class
+        event_bus - If True, events go through a single-threaded EventBus. If False, through a thread-safe queue.Queue, e.g. when another thread puts events.
+        progress - A ProgressSink receiving progress, messages, orders and fills. Defaults to ConsoleProgress(), use ProgressSink() for a quiet run.
+        stop_when - Optional early-stopping rule, called with the portfolio's OnlineStats after every bar. The run ends as soon as it returns True,
+            e.g. stop_when=lambda stats: stats.drawdown > 0.2
         """
         self.csv_dir = csv_dir
         self.symbol_list = symbol_list
@@ -38,83 +47,149 @@ class Backtest(object):
         self.portfolio_cls = portfolio
         self.strategy_cls = strategy
         self.window = window
+        self.progress = ConsoleProgress() if progress is None else progress
+        self.stop_when = stop_when
+        self.stopped_early = False
 
-        self.events = queue.Queue()
+        # The bus always holds the dispatch table, in queue mode it is only used to dispatch the events taken from the queue
+        self.bus = EventBus()
+        self.events = self.bus if event_bus else queue.Queue()
 
-        self.signals = 0
-        self.orders = 0
-        self.fills = 0
         self.num_strats = 1
 
         self._generate_trading_instances()
+        self._register_handlers()
+
+    @property
+    def signals(self):
+        return self.bus.counts[EventType.SIGNAL]
+
+    @property
+    def targets(self):
+        return self.bus.counts[EventType.TARGET]
+
+    @property
+    def orders(self):
+        return self.bus.counts[EventType.ORDER]
+
+    @property
+    def fills(self):
+        return self.bus.counts[EventType.FILL]
+
+    @property
+    def cancels(self):
+        return self.bus.counts[EventType.CANCEL]
 
     def _generate_trading_instances(self):
         """
         Generates the trading instance objects from their class types.
         """
-        print( "Creating DataHandler, Strategy, Portfolio and ExecutionHandler")
-        self.data_handler = self.data_handler_cls(self.events, self.csv_dir, self.symbol_list, self.start_date.strftime('%Y-%m-%d %H:%M:%S'), self.end_date.strftime('%Y-%m-%d %H:%M:%S'))
+        self.progress.message("Creating DataHandler, Strategy, Portfolio and ExecutionHandler")
+        startdate = self.start_date.strftime('%Y-%m-%d %H:%M:%S')
+        enddate = self.end_date.strftime('%Y-%m-%d %H:%M:%S')
+        if isinstance(self.data_handler_cls, BarSource):
+            self.data_handler = BarDataHandler(self.events, self.data_handler_cls, self.symbol_list, startdate, enddate)
+        else:
+            self.data_handler = self.data_handler_cls(self.events, self.csv_dir, self.symbol_list, startdate, enddate)
         self.strategy = self.strategy_cls(self.data_handler, self.events, self.window)
         self.portfolio = self.portfolio_cls(self.data_handler, self.events, self.start_date, self.initial_capital)
-        self.execution_handler = self.execution_handler_cls(self.events)
+        # Handlers configured with functools.partial are recognised by the class they wrap
+        handler_cls = getattr(self.execution_handler_cls, 'func', self.execution_handler_cls)
+        if getattr(handler_cls, 'requires_bars', False):
+            self.execution_handler = self.execution_handler_cls(self.events, self.data_handler)
+        else:
+            self.execution_handler = self.execution_handler_cls(self.events)
+
+    def _register_handlers(self):
+        """
+        Registers the components into the dispatch table. On a MarketEvent the portfolio is marked to market first,
+        then the orders remaining from earlier signals are released and finally the strategy computes its signals.
+        The released orders are thus counted as queued before a TargetEvent of the same bar nets them.
+        """
+        self.bus.register(EventType.MARKET, self.portfolio.update_timeindex)
+        self.bus.register(EventType.MARKET, self.portfolio.historical_signal) # Execute remaining orders due to lag and smoothing
+        self.bus.register(EventType.MARKET, self.strategy.calculate_signals)
+        if hasattr(self.execution_handler, 'on_market'):
+            self.bus.register(EventType.MARKET, self.execution_handler.on_market)
+        self.bus.register(EventType.SIGNAL, self.portfolio.update_signal)
+        if hasattr(self.portfolio, 'update_target'):
+            self.bus.register(EventType.TARGET, self.portfolio.update_target)
+        if hasattr(self.portfolio, 'update_order'):
+            self.bus.register(EventType.ORDER, self.portfolio.update_order)
+        self.bus.register(EventType.ORDER, self.execution_handler.execute_order)
+        self.bus.register(EventType.FILL, self.portfolio.update_fill)
+        if hasattr(self.portfolio, 'update_cancel'):
+            self.bus.register(EventType.CANCEL, self.portfolio.update_cancel)
+        self.bus.register(EventType.ORDER, self.progress.order)
+        self.bus.register(EventType.FILL, self.progress.fill)
+        self.bus.register(EventType.CANCEL, self.progress.cancel)
 
     def _run_backtest(self):
         """
         Executes the backtest.
         """
+        # Historical data needs no pacing, only live handlers sleep between bars
+        sleep = self.heartbeat > 0.0 and not getattr(self.data_handler, 'historical', False)
         i = 0
         while True:
             i += 1
-            print(i)
             # Update the market bars
             if self.data_handler.continue_backtest == True:
                 self.data_handler.update_bars()
             else:
                 break
+            self.progress.bar(i, self.data_handler.get_latest_bar_datetime(self.symbol_list[0]))
 
             # Handle the events
-            while True:
-                try:
-                    event = self.events.get(False)
-                except queue.Empty:
-                    break
-                else:
-                    if event is not None:
-                        if event.type == 'MARKET':
-                            self.portfolio.update_timeindex(event)
-                            self.strategy.calculate_signals(event)
-                            self.portfolio.historical_signal(event) # Execute remaining orders due to lag and smoothing
-                        elif event.type == 'SIGNAL':
-                            self.signals += 1
-                            self.portfolio.update_signal(event)
-                        elif event.type == 'ORDER':
-                            self.orders += 1
-                            self.execution_handler.execute_order(event)
-                        elif event.type == 'FILL':
-                            self.fills += 1
-                            self.portfolio.update_fill(event)                        
-            time.sleep(self.heartbeat)
+            if self.events is self.bus:
+                self.bus.dispatch()
+            else:
+                while True:
+                    try:
+                        event = self.events.get(False)
+                    except queue.Empty:
+                        break
+                    else:
+                        if event is not None:
+                            self.bus.handle(event)
+            if self.stop_when is not None and self.stop_when(self.portfolio.stats):
+                self.stopped_early = True
+                self.progress.message("Stopped early at bar %d: %s" % (i, self.portfolio.stats.summary()))
+                break
+            if sleep:
+                time.sleep(self.heartbeat)
+        self.progress.close()
 
     def _output_performance(self, frequency = 252):
         """
-        Outputs the strategy performance from the backtest.
+        Outputs the strategy performance from the backtest through the progress sink, a quiet ProgressSink prints nothing.
+        Returns the summary stats of Portfolio.output_summary_stats().
         """
         self.portfolio.create_equity_curve_dataframe()
 
-        print("Creating summary stats...")
+        self.progress.message("Creating summary stats...")
         stats = self.portfolio.output_summary_stats(frequency=frequency)
-        print("Creating equity curve...")
-        print(self.portfolio.equity_curve.tail(10))
-        pprint.pprint(stats)
+        self.progress.message("Creating equity curve...")
+        self.progress.message(str(self.portfolio.equity_curve.tail(10)))
+        self.progress.message(pprint.pformat(stats))
 
-        print("Signals: %s" % self.signals)
-        print("Orders: %s" % self.orders)
-        print("Fills: %s" % self.fills)
+        self.progress.message("Signals: %s" % self.signals)
+        self.progress.message("Orders: %s" % self.orders)
+        self.progress.message("Fills: %s" % self.fills)
+        return stats
 
-    def simulate_trading(self, frequency=252):
+    def simulate_trading(self, frequency=252, report=None):
         """
-        Simulates the backtest and outputs portfolio performance.
+        Simulates the backtest and outputs portfolio performance. Returns the summary stats.
+
+        Parameters:
+        frequency - Periods per year, used to annualise the Sharpe ratio.
+        report - Optional reporting.Reporter writing the equity curve and the plot. Without one nothing is written to disk
+            and no plotting backend is loaded, e.g. for headless batch runs.
         """
         self._run_backtest()
-        self._output_performance(frequency=frequency)
-        self.portfolio.plot_summary()
+        stats = self._output_performance(frequency=frequency)
+        if report is not None:
+            for path in report.report(self.portfolio):
+                self.progress.message("Writing %s" % path)
+        return stats
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import numpy as np
+
+from bar_store import BarStore
+from tu_share import TuShare
+
+# Bump whenever the on-disk layout or the alignment rules change, so old caches get rebuilt
+CACHE_VERSION = 2
+MANIFEST = 'manifest.json'
+
+
+def universe_fingerprint(tickers, startdate, enddate, source="./Data/securities_master.db", chunk_size=500):
+    """
+    Hashes the row count and the last_updated_date range of daily_price for every ticker in the date range.
+    Any insert, delete or re-download of a bar in the range changes the fingerprint.
+
+    Parameters:
+    tickers - A list of symbol strings.
+    startdate, enddate - str, '%Y-%m-%d %H:%M:%S'
+    source - Path of the SQLite securities_master db.
+    """
+    tickers = sorted(tickers)
+    digest = hashlib.sha1()
+    con = sqlite3.connect(source)
+    try:
+        for i in range(0, len(tickers), chunk_size):
+            chunk = tickers[i:i + chunk_size]
+            sql = (
+                "SELECT sym.ticker, COUNT(dp.id), MIN(dp.last_updated_date), MAX(dp.last_updated_date) "
+                "FROM daily_price AS dp INNER JOIN symbol AS sym ON sym.id = dp.symbol_id "
+                "WHERE sym.ticker IN (" + ", ".join(['?'] * len(chunk)) + ") AND dp.price_date BETWEEN ? AND ? "
+                "GROUP BY sym.ticker ORDER BY sym.ticker;"
+            )
+            for row in con.execute(sql, chunk + [startdate, enddate]):
+                digest.update(repr(row).encode('utf-8'))
+    finally:
+        con.close()
+    return digest.hexdigest()
+
+
+def cache_key(tickers, startdate, enddate, fingerprint):
+    """
+    Returns the directory name of a cache: a hash of the universe and date range, followed by the content fingerprint.
+    """
+    universe = json.dumps([CACHE_VERSION, list(tickers), startdate, enddate])
+    return "%s-%s" % (hashlib.sha1(universe.encode('utf-8')).hexdigest()[:16], fingerprint[:16])
+
+
+def write_bar_cache(path, store, manifest):
+    """
+    Writes every field matrix of store as a .npy file plus the datetime index and a JSON manifest into directory path.
+    The directory is written under a temporary name and renamed, so concurrent readers never see a partial cache.
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    tmp_path = tempfile.mkdtemp(dir=parent)
+    np.save(os.path.join(tmp_path, 'index.npy'), store.index.values.astype('datetime64[ns]'))
+    for field, values in store.fields.items():
+        np.save(os.path.join(tmp_path, '%s.npy' % field), values)
+    manifest = dict(manifest)
+    manifest.update({
+        'version': CACHE_VERSION,
+        'symbols': store.symbol_list,
+        'fields': sorted(store.fields),
+        'shape': [len(store), len(store.symbol_list)],
+    })
+    with open(os.path.join(tmp_path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another process published the same cache first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def open_bar_cache(path):
+    """
+    Opens a cache directory as a BarStore whose matrices are read-only np.memmap arrays.
+    Pages are loaded lazily and shared between processes through the OS page cache.
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != CACHE_VERSION:
+        raise ValueError("Bar cache %s has version %s, expected %s" % (path, manifest.get('version'), CACHE_VERSION))
+    index = np.load(os.path.join(path, 'index.npy'))
+    fields = {}
+    for field in manifest['fields']:
+        fields[field] = np.load(os.path.join(path, '%s.npy' % field), mmap_mode='r')
+    return BarStore(index, manifest['symbols'], fields)
+
+
+def build_bar_cache(cache_dir, tickers, startdate, enddate, source="./Data/securities_master.db", fingerprint=None):
+    """
+    Loads the universe from the SQLite db, aligns it and writes it to cache_dir.
+    Older caches of the same universe and date range are removed. Returns the path of the new cache.
+    """
+    if fingerprint is None:
+        fingerprint = universe_fingerprint(tickers, startdate, enddate, source=source)
+    key = cache_key(tickers, startdate, enddate, fingerprint)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    prefix = key.split('-')[0] + '-'
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name != key:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+    tu = TuShare()
+    universe = tu.get_daily_universe_sqlite(tickers=tickers, startdate=startdate, enddate=enddate, source=source)
+    store = BarStore.from_long_frame(universe, tickers)
+    path = os.path.join(cache_dir, key)
+    manifest = {'startdate': startdate, 'enddate': enddate, 'fingerprint': fingerprint, 'source': os.path.abspath(source)}
+    write_bar_cache(path, store, manifest)
+    return path
+
+
+def load_bar_cache(cache_dir, tickers, startdate, enddate, source="./Data/securities_master.db"):
+    """
+    Returns a memory-mapped BarStore for the universe and date range, (re)building the cache first if it is missing or stale.
+    """
+    fingerprint = universe_fingerprint(tickers, startdate, enddate, source=source)
+    path = os.path.join(cache_dir, cache_key(tickers, startdate, enddate, fingerprint))
+    if not os.path.exists(os.path.join(path, MANIFEST)):
+        path = build_bar_cache(cache_dir, tickers, startdate, enddate, source=source, fingerprint=fingerprint)
+    return open_bar_cache(path)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build the memory-mapped bar cache for a universe")
+    parser.add_argument('cache_dir')
+    parser.add_argument('--db', default="./Data/securities_master.db")
+    parser.add_argument('--start', default='2000-01-01 00:00:00')
+    parser.add_argument('--end', default='2020-01-01 00:00:00')
+    parser.add_argument('--tickers', nargs='*', help="Defaults to every ticker in table symbol")
+    args = parser.parse_args()
+    tickers = args.tickers
+    if not tickers:
+        con = sqlite3.connect(args.db)
+        tickers = [t[0] for t in con.execute("SELECT ticker FROM symbol ORDER BY id").fetchall()]
+        con.close()
+    print("Bar cache written to %s" % build_bar_cache(args.cache_dir, tickers, args.start, args.end, source=args.db))
@@ -0,0 +1,157 @@
+from abc import ABCMeta, abstractmethod
+import os, os.path
+import numpy as np
+import pandas as pd
+from tu_share import TuShare
+from bar_store import BarStore
+from bar_cache import load_bar_cache
+
+
+class BarSource(object):
+    """
+    BarSource is an abstract base class for everything that can supply the bars of a universe to BarDataHandler.
+    A source only has to load and align the data into a BarStore; storage, cursor and the get_latest_bar* access are shared by all sources.
+    Third-party sources subclass BarSource and build their store with BarStore.from_frames(), from_long_frame() or from_wide().
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def load(self, symbol_list, startdate, enddate):
+        """
+        Returns a BarStore holding the aligned bars of symbol_list between startdate and enddate.
+
+        Parameters:
+        symbol_list - A list of symbol strings. e.g. ['601988','601000']
+        startdate: str, '2000-01-01 00:00:00'
+        enddate: str, '2020-01-01 00:00:00'
+        """
+        raise NotImplementedError("Should implement load()")
+
+
+class CSVBarSource(BarSource):
+    """
+    Reads one CSV file per symbol, of the form 'symbol.csv' under csv_dir.
+    For this source it will be assumed that the data is taken from AlphaVantage. Thus its format will be respected.
+    """
+    def __init__(self, csv_dir):
+        """
+        Parameters:
+        csv_dir - Absolute directory path to the CSV files.
+        """
+        self.csv_dir = csv_dir
+
+    def load(self, symbol_list, startdate, enddate):
+        # The whole file is used, startdate and enddate are kept for compatibility
+        symbol_data = {}
+        for s in symbol_list:
+            # Load the CSV file with no header information, indexed on date
+            symbol_data[s] = pd.read_csv(
+                os.path.join(self.csv_dir, '%s.csv' % s), header=0, index_col=0, parse_dates=True, names=[ 'price_date', 'ticker', 'open_price', 'high_price', 'low_price', 'close_price', 'volume','adj_factor']
+                )
+        return BarStore.from_frames(symbol_data, symbol_list)
+
+
+class SQLiteBarSource(BarSource):
+    """
+    Loads the universe from the SQLite securities_master db with one bulk query.
+    """
+    def __init__(self, source="./Data/securities_master.db"):
+        """
+        Parameters:
+        source - Path of the SQLite *.db file.
+        """
+        self.source = source
+
+    def load(self, symbol_list, startdate, enddate):
+        universe = TuShare().get_daily_universe_sqlite(tickers=symbol_list, startdate=startdate, enddate=enddate, source=self.source)
+        return BarStore.from_long_frame(universe, symbol_list)
+
+
+class MySQLBarSource(BarSource):
+    """
+    Loads the universe from a locally installed MySQL securities_master db with one bulk query.
+    """
+    def load(self, symbol_list, startdate, enddate):
+        universe = TuShare().get_daily_universe_sql(tickers=symbol_list, startdate=startdate, enddate=enddate)
+        return BarStore.from_long_frame(universe, symbol_list)
+
+
+class MemmapBarSource(BarSource):
+    """
+    Opens the memory-mapped bar cache of bar_cache.py, building it from the SQLite db first if it is missing or stale.
+    """
+    def __init__(self, cache_dir, source="./Data/securities_master.db"):
+        """
+        Parameters:
+        cache_dir - Directory holding the bar caches.
+        source - Path of the SQLite *.db file the cache is built from.
+        """
+        self.cache_dir = cache_dir
+        self.source = source
+
+    def load(self, symbol_list, startdate, enddate):
+        return load_bar_cache(self.cache_dir, symbol_list, startdate, enddate, source=self.source)
+
+
+class InMemoryBarSource(BarSource):
+    """
+    Serves an already loaded BarStore, e.g. to run many backtests over the same data. Each load() gets its own cursor over the shared matrices.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def load(self, symbol_list, startdate, enddate):
+        return self.store.select(symbol_list)
+
+
+class SyntheticBarSource(BarSource):
+    """
+    Generates random-walk business-day bars, useful for benchmarks and for checking strategies without a db.
+    """
+    def __init__(self, seed=0, volatility=0.02, missing=0.0):
+        """
+        Parameters:
+        seed - Seed of the random generator, the same seed gives the same bars.
+        volatility - Daily standard deviation of the log returns.
+        missing - Fraction of bars randomly dropped per symbol, to exercise the pad-forward alignment.
+        """
+        self.seed = seed
+        self.volatility = volatility
+        self.missing = missing
+
+    def load(self, symbol_list, startdate, enddate):
+        return BarStore.from_wide(self._wide(symbol_list, startdate, enddate), symbol_list)
+
+    def load_frames(self, symbol_list, startdate, enddate):
+        """
+        Returns the same bars as load() as a dict of symbol to DataFrame, holding only the bars kept for that symbol as a db query would.
+        """
+        wide = self._wide(symbol_list, startdate, enddate)
+        frames = {}
+        for s in symbol_list:
+            frame = pd.DataFrame(dict((field, values[s]) for field, values in wide.items()))
+            frames[s] = frame[frame['close_price'].notna()]
+        return frames
+
+    def _wide(self, symbol_list, startdate, enddate):
+        rng = np.random.RandomState(self.seed)
+        index = pd.bdate_range(pd.Timestamp(startdate).normalize(), pd.Timestamp(enddate))
+        shape = (len(index), len(symbol_list))
+        close = 10.0 * np.exp(np.cumsum(rng.normal(0.0, self.volatility, shape), axis=0))
+        spread = np.abs(rng.normal(0.0, self.volatility / 2, shape))
+        high = close * (1.0 + spread)
+        low = close * (1.0 - spread)
+        raw = {
+            'open_price': np.clip(close * (1.0 + rng.normal(0.0, self.volatility / 4, shape)), low, high),
+            'high_price': high,
+            'low_price': low,
+            'close_price': close,
+            'volume': rng.randint(100000, 10000000, shape).astype(np.float64),
+            'adj_factor': np.ones(shape),
+        }
+        keep = rng.uniform(size=shape) >= self.missing
+        keep[0] = True
+        wide = {}
+        for field, values in raw.items():
+            wide[field] = pd.DataFrame(np.where(keep, values, np.nan), index=index, columns=symbol_list)
+        return wide
@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+
+# Numeric fields kept by the store, in the order of the handler output format.
+# Non-numeric columns such as 'ticker' are dropped, the symbol is known from the column position.
+FIELDS = ('open_price', 'high_price', 'low_price', 'close_price', 'volume', 'adj_factor', 'adj_close', 'returns', 'traded')
+
+
+class Bar(object):
+    """
+    Lightweight view of a single bar inside a BarStore.
+    Attribute or item access reads straight from the field matrices, so no pandas Series is created per bar.
+    """
+    __slots__ = ('_store', '_row', '_col')
+
+    def __init__(self, store, row, col):
+        self._store = store
+        self._row = row
+        self._col = col
+
+    def __getattr__(self, name):
+        if name == 'ticker':
+            return self._store.symbol_list[self._col]
+        try:
+            return self._store.fields[name][self._row, self._col]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __repr__(self):
+        return "Bar(%s, %s)" % (self._store.symbol_list[self._col], self._store.index[self._row])
+
+
+class BarStore(object):
+    """
+    BarStore holds the aligned bars of a whole universe in columnar form.
+    Every field is one contiguous float64 matrix of shape (bars, symbols), stored in Fortran order so that the history of a single symbol is contiguous in memory.
+    A cursor marks the latest bar that has been "dripped" into the backtest, thus advancing the feed costs a single integer increment.
+    """
+    def __init__(self, index, symbol_list, fields):
+        """
+        Initialises the store from already aligned matrices.
+
+        Parameters:
+        index - Sorted datetime-like index of the bars, length equals the number of rows of each matrix.
+        symbol_list - A list of symbol strings, one per column.
+        fields - dict of field name to 2d float64 array of shape (bars, symbols).
+        """
+        self.index = pd.DatetimeIndex(index)
+        self.datetimes = self.index.values
+        self.symbol_list = list(symbol_list)
+        self.symbol_index = dict((s, i) for i, s in enumerate(self.symbol_list))
+        self.fields = fields
+        for values in self.fields.values():
+            # Views handed out by latest_values() must not be able to alter the shared data
+            values.flags.writeable = False
+        self.cursor = -1
+
+    @classmethod
+    def from_frames(cls, symbol_data, symbol_list):
+        """
+        Builds a store from a dict of per-symbol DataFrames indexed on date.
+        Frames are aligned on the union of their indexes and padded forward, then adj_close and returns are derived.
+        Output fields are: ('open_price', 'high_price', 'low_price', 'close_price', 'volume', 'adj_factor', 'adj_close', 'returns', 'traded')
+
+        Parameters:
+        symbol_data - dict of symbol to DataFrame with at least close_price and adj_factor columns.
+        symbol_list - A list of symbol strings, giving the column order.
+        """
+        frames = {}
+        for s in symbol_list:
+            # set_axis copies, the caller's frame keeps its index
+            frame = symbol_data[s].set_axis(pd.to_datetime(symbol_data[s].index)).sort_index()
+            frames[s] = frame[~frame.index.duplicated(keep='last')]
+        wide = {}
+        for field in FIELDS[:6]:
+            wide[field] = pd.DataFrame(dict((s, frames[s][field]) for s in symbol_list), columns=symbol_list)
+        return cls.from_wide(wide, symbol_list)
+
+    @classmethod
+    def from_long_frame(cls, frame, symbol_list, symbol_column='ticker', date_column='price_date'):
+        """
+        Builds a store from a single long-format DataFrame holding one row per (symbol, date), as returned by a bulk universe query.
+        The frame is pivoted into (dates x symbols) matrices in one vectorized step and then aligned like from_frames().
+
+        Parameters:
+        frame - DataFrame with symbol_column, date_column and the raw OHLCV + adj_factor columns.
+        symbol_list - A list of symbol strings, giving the column order.
+        """
+        frame = frame.assign(**{date_column: pd.to_datetime(frame[date_column])})
+        frame = frame.drop_duplicates(subset=[symbol_column, date_column], keep='last')
+        pivot = frame.pivot(index=date_column, columns=symbol_column, values=list(FIELDS[:6]))
+        wide = {}
+        for field in FIELDS[:6]:
+            wide[field] = pivot[field].astype(np.float64)
+        return cls.from_wide(wide, symbol_list)
+
+    @classmethod
+    def from_wide(cls, wide, symbol_list):
+        """
+        Builds a store from wide (dates x symbols) DataFrames of the raw fields, aligning, padding forward and deriving adj_close and returns.
+        The traded field is 1.0 where the symbol has a bar with a close and non-zero volume before padding, 0.0 on suspended or missing bars.
+
+        Parameters:
+        wide - dict of field name to DataFrame, for the fields ('open_price', 'high_price', 'low_price', 'close_price', 'volume', 'adj_factor').
+        symbol_list - A list of symbol strings, giving the column order.
+        """
+        index = None
+        for frame in wide.values():
+            index = frame.index if index is None else index.union(frame.index)
+        fields = {}
+        close = wide['close_price'].reindex(index=index, columns=symbol_list)
+        volume = wide['volume'].reindex(index=index, columns=symbol_list)
+        traded = close.notna().values & (volume.fillna(0.0).values != 0.0)
+        fields['traded'] = np.asfortranarray(traded, dtype=np.float64)
+        for field, frame in wide.items():
+            # Be careful if the start day value is 0. Incorrect signal may be triggered in this case
+            frame = frame.reindex(index=index, columns=symbol_list).ffill()
+            fields[field] = np.asfortranarray(frame.values, dtype=np.float64)
+        fields['adj_close'] = np.asfortranarray(fields['close_price'] * fields['adj_factor'])
+        returns = np.empty_like(fields['adj_close'])
+        returns[0] = np.nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.divide(fields['adj_close'][1:], fields['adj_close'][:-1], out=returns[1:])
+        returns[1:] -= 1.0
+        fields['returns'] = returns
+        return cls(index, symbol_list, fields)
+
+    def view(self):
+        """
+        Returns a new store sharing the matrices of this one but with its own cursor, e.g. to replay the same data in another backtest.
+        """
+        return BarStore(self.index, self.symbol_list, self.fields)
+
+    def slice(self, start, stop):
+        """
+        Returns a store over the bars [start, stop) without copying; every matrix of the result is a view.
+        """
+        fields = dict((field, values[start:stop]) for field, values in self.fields.items())
+        return BarStore(self.index[start:stop], self.symbol_list, fields)
+
+    def select(self, symbol_list):
+        """
+        Returns a store restricted to symbol_list, in that order. Shares the matrices if symbol_list is the full universe.
+        """
+        symbol_list = list(symbol_list)
+        if symbol_list == self.symbol_list:
+            return self.view()
+        cols = [self.symbol_index[s] for s in symbol_list]
+        fields = dict((field, np.asfortranarray(values[:, cols])) for field, values in self.fields.items())
+        return BarStore(self.index, symbol_list, fields)
+
+    def __len__(self):
+        return len(self.datetimes)
+
+    def advance(self):
+        """
+        Moves the cursor to the next bar. Returns False once the data set is exhausted.
+        """
+        if self.cursor + 1 < len(self.datetimes):
+            self.cursor += 1
+            return True
+        return False
+
+    def reset(self):
+        """
+        Rewinds the cursor so that the store can be replayed.
+        """
+        self.cursor = -1
+
+    def latest_datetime(self):
+        """
+        Returns the Timestamp of the latest bar.
+        """
+        if self.cursor < 0:
+            raise IndexError("No bar has been updated yet.")
+        return self.index[self.cursor]
+
+    def latest_bar(self, symbol):
+        """
+        Returns the latest bar of symbol as a (datetime, Bar) tuple.
+        """
+        col = self.symbol_index[symbol]
+        return (self.latest_datetime(), Bar(self, self.cursor, col))
+
+    def latest_bars(self, symbol, N=1):
+        """
+        Returns the last N bars of symbol as a list of (datetime, Bar) tuples, or N-k if less available.
+        """
+        col = self.symbol_index[symbol]
+        start = max(self.cursor + 1 - N, 0)
+        return [(self.index[i], Bar(self, i, col)) for i in range(start, self.cursor + 1)]
+
+    def latest_value(self, symbol, field):
+        """
+        Returns the value of field for the latest bar of symbol.
+        """
+        if self.cursor < 0:
+            raise IndexError("No bar has been updated yet.")
+        return self.fields[field][self.cursor, self.symbol_index[symbol]]
+
+    def latest_values(self, symbol, field, N=1):
+        """
+        Returns a read-only view on the last N values of field for symbol, or N-k if less available.
+        As the matrices are in Fortran order the view is a contiguous slice, obtained without copying or looping over bars.
+        """
+        col = self.symbol_index[symbol]
+        start = max(self.cursor + 1 - N, 0)
+        return self.fields[field][start:self.cursor + 1, col]
+
+    def latest_window(self, field, N=1):
+        """
+        Returns a read-only (N x symbols) view on the last N values of field for every symbol, or N-k rows if less available.
+        """
+        start = max(self.cursor + 1 - N, 0)
+        return self.fields[field][start:self.cursor + 1]
+
+    def latest_cross_section(self, field):
+        """
+        Returns a read-only view on the latest value of field for every symbol, in symbol_list order.
+        """
+        if self.cursor < 0:
+            raise IndexError("No bar has been updated yet.")
+        return self.fields[field][self.cursor]
@@ -0,0 +1,835 @@
+"""
+Benchmarks for the performance critical paths of Thanatos.
+Every benchmark can run offline against a synthetic securities_master db, e.g.:
+    python benchmark.py load --symbols 300 --days 2500
+"""
+import argparse
+import datetime as dt
+import functools
+import os
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest import Backtest
+from bar_source import InMemoryBarSource, SQLiteBarSource, SyntheticBarSource
+from bar_store import BarStore
+from data import BarDataHandler
+from event import EventBus, EventType, MarketEvent, OrderEvent, SignalEvent
+from execution import LimitOrderExecutionHandler, RealisticExecutionHandler, SimulatedExecutionHandler
+from features import build_features, load_features
+from performance import create_drawdowns, performance_summary
+from portfolio import Portfolio
+from price_ingest import PRICE_COLUMNS, upsert_daily_prices, format_upsert_stats
+from progress import ProgressSink
+from strategy import CrossSectionalMomentum, CrossSectionalStrategy, MovingAverageCrossStrategy, Strategy, TargetPositionStrategy, VectorizedMovingAverageCross
+from sweep import ParameterSweep, product_grid
+from tu_share import TuShare
+from tushare_downloader import ConcurrentDownloader, LocalTushareApi, TokenBucket, tushare_frames_to_rows
+from vectorized_backtest import VectorizedBacktest, check_parity
+from walk_forward import WalkForward
+
+
+def build_synthetic_db(path, n_symbols=300, n_days=2500, seed=0, indexed=True):
+    """
+    Creates a SQLite securities_master db at path with random-walk daily prices for n_symbols tickers.
+    The schema matches Data/InitSqliteDb.py, set indexed to False to get a db predating the daily_price indexes.
+    Returns the list of tickers.
+    """
+    rng = np.random.RandomState(seed)
+    con = sqlite3.connect(path)
+    cur = con.cursor()
+    cur.execute("""
+        CREATE TABLE symbol (
+        id INTEGER PRIMARY KEY,
+        exchange_id int,
+        ticker varchar(32) NOT NULL,
+        instrument varchar(64) NOT NULL,
+        name varchar(255),
+        sector varchar(255),
+        currency varchar(32),
+        created_date datetime NOT NULL,
+        last_updated_date datetime NOT NULL
+        );
+        """)
+    cur.execute("""
+        CREATE TABLE daily_price (
+        id INTEGER PRIMARY KEY,
+        data_vendor_id int NOT NULL,
+        symbol_id int NOT NULL,
+        price_date datetime NOT NULL,
+        created_date datetime NOT NULL,
+        last_updated_date datetime NOT NULL,
+        open_price decimal(19,4),
+        high_price decimal(19,4),
+        low_price decimal(19,4),
+        close_price decimal(19,4),
+        adj_factor decimal(19,10),
+        volume bigint
+        );
+        """)
+    if indexed:
+        cur.execute("CREATE UNIQUE INDEX idx_daily_price_symbol_date ON daily_price (symbol_id, price_date);")
+    now = dt.datetime.utcnow()
+    days = pd.bdate_range('2010-01-04', periods=n_days).to_pydatetime()
+    tickers = ['%06d' % (600000 + i) for i in range(n_symbols)]
+    for i, ticker in enumerate(tickers):
+        cur.execute(
+            "INSERT INTO symbol (id, exchange_id, ticker, instrument, name, sector, currency, created_date, last_updated_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (i + 1, 3, ticker, 'equity', ticker, 'TBD', 'CNY', now, now)
+        )
+        close = 10.0 * np.exp(np.cumsum(rng.normal(0.0, 0.02, n_days)))
+        volume = rng.randint(100000, 10000000, n_days)
+        # Roughly 3% of the days are missing to exercise the pad-forward alignment
+        keep = rng.uniform(size=n_days) > 0.03
+        rows = [
+            (3, i + 1, days[k], now, now, close[k] * 0.995, close[k] * 1.01, close[k] * 0.99, close[k], int(volume[k]), 1.0)
+            for k in np.nonzero(keep)[0]
+        ]
+        cur.executemany(
+            "INSERT INTO daily_price (data_vendor_id, symbol_id, price_date, created_date, last_updated_date, open_price, high_price, low_price, close_price, volume, adj_factor) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+    con.commit()
+    con.close()
+    return tickers
+
+
+def _timeit(func, repeat):
+    """
+    Returns the best wall time of repeat calls to func, and the result of the last call.
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_universe_load(db_path, tickers, startdate, enddate, repeat=3):
+    """
+    Compares loading a universe symbol by symbol (one connection and query per ticker) against the single bulk query.
+    """
+    tu = TuShare()
+
+    def per_symbol():
+        symbol_data = {}
+        for s in tickers:
+            symbol_data[s] = tu.get_daily_data_sqlite(ticker=s, startdate=startdate, enddate=enddate, source=db_path)
+        return BarStore.from_frames(symbol_data, tickers)
+
+    def bulk():
+        universe = tu.get_daily_universe_sqlite(tickers=tickers, startdate=startdate, enddate=enddate, source=db_path)
+        return BarStore.from_long_frame(universe, tickers)
+
+    t_old, old = _timeit(per_symbol, repeat)
+    t_new, new = _timeit(bulk, repeat)
+    print("Universe load: %d symbols x %d bars" % (len(tickers), len(new)))
+    print("  per-symbol queries: %8.3f s" % t_old)
+    print("  bulk query:         %8.3f s  (%.1fx)" % (t_new, t_old / t_new))
+    return {'per_symbol': t_old, 'bulk': t_new}
+
+
+def bench_ingest(n_symbols=300, n_days=2500, repeat=1):
+    """
+    Compares a full re-ingestion of the same bars as blind INSERT followed by remove_daily_price_dup.sql against upsert_daily_prices().
+    """
+    tmp_dir = tempfile.mkdtemp()
+    now = dt.datetime.utcnow()
+    days = pd.bdate_range('2010-01-04', periods=n_days).to_pydatetime()
+    rows = [(3, s + 1, d, now, now, 10.0, 10.1, 9.9, 10.0, 1000, 1.0) for s in range(n_symbols) for d in days]
+    insert_sql = "INSERT INTO daily_price (%s) VALUES (%s)" % (", ".join(PRICE_COLUMNS), ", ".join(["?"] * len(PRICE_COLUMNS)))
+    dedupe_sql = "DELETE FROM daily_price WHERE id NOT IN (SELECT MIN(id) FROM daily_price GROUP BY symbol_id, price_date)"
+
+    def insert_then_dedupe():
+        path = os.path.join(tmp_dir, 'legacy.db')
+        if os.path.exists(path):
+            os.remove(path)
+        build_synthetic_db(path, n_symbols=0, n_days=0, indexed=False)
+        con = sqlite3.connect(path)
+        con.executemany(insert_sql, rows)
+        con.commit()
+        start = time.perf_counter()
+        con.executemany(insert_sql, rows)
+        con.execute(dedupe_sql)
+        con.commit()
+        elapsed = time.perf_counter() - start
+        con.close()
+        return elapsed
+
+    def upsert():
+        path = os.path.join(tmp_dir, 'upsert.db')
+        if os.path.exists(path):
+            os.remove(path)
+        build_synthetic_db(path, n_symbols=0, n_days=0)
+        con = sqlite3.connect(path)
+        upsert_daily_prices(con, rows)
+        stats = upsert_daily_prices(con, rows)
+        con.close()
+        return stats
+
+    t_old = min(insert_then_dedupe() for _ in range(repeat))
+    t_new, stats = _timeit(upsert, 1)
+    print("Re-ingesting %d rows:" % len(rows))
+    print("  insert + dedupe:    %8.3f s" % t_old)
+    print("  upsert:             %8.3f s  (%s)" % (stats['seconds'], format_upsert_stats(stats)))
+    return {'insert_dedupe': t_old, 'upsert': stats['seconds']}
+
+
+def bench_download(n_symbols=50, latency=0.05, rate=20.0, workers=8, failure_rate=0.0):
+    """
+    Measures ConcurrentDownloader against the sequential download loop, both talking to LocalTushareApi and writing to a temporary db.
+    Then checks that missing adj_factor frames and bars without volume are cleaned, and that a ticker whose frames cannot be converted
+    is reported as failed while the others are stored.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    todo = [(i + 1, '%06d.SH' % (600000 + i), '20150101') for i in range(n_symbols)]
+    end_date = '20191231'
+
+    def connect(name):
+        path = os.path.join(tmp_dir, name)
+        if not os.path.exists(path):
+            build_synthetic_db(path, n_symbols=0, n_days=0)
+        return sqlite3.connect(path)
+
+    def sequential():
+        api = LocalTushareApi(latency=latency)
+        bucket = TokenBucket(rate, 1)
+        con = connect('sequential.db')
+        for symbol_id, tick, start_date in todo:
+            bucket.acquire()
+            bars = api.pro_bar(tick, start_date, end_date)
+            bucket.acquire()
+            factors = api.adj_factor(tick, start_date, end_date)
+            now = dt.datetime.utcnow()
+            rows = [(3, symbol_id, d[0], now, now) + tuple(d[1:]) for d in tushare_frames_to_rows(bars, factors)]
+            upsert_daily_prices(con, rows)
+        con.close()
+
+    def concurrent(name='concurrent.db', **kwargs):
+        api = LocalTushareApi(latency=latency, failure_rate=failure_rate, **kwargs)
+        downloader = ConcurrentDownloader(api, lambda: connect(name), rate=rate, burst=workers, max_workers=workers,
+                                          backoff=0.01, engine="SQLite", data_vendor_id=3)
+        return downloader.run(todo, end_date)
+
+    t_old, _ = _timeit(sequential, 1)
+    t_new, stats = _timeit(concurrent, 1)
+    broken = todo[0][1]
+    gaps = concurrent('gaps.db', gap_rate=0.2, broken_tickers=[broken])
+    assert gaps['failed'] == [broken] and gaps['tickers'] == n_symbols - 1
+    assert 0 < gaps['inserted'] < stats['inserted']
+    print("Downloading %d tickers, %.0f ms latency, %.1f calls/s limit:" % (n_symbols, latency * 1000, rate))
+    print("  sequential:         %8.3f s" % t_old)
+    print("  %2d workers:         %8.3f s  (%.1fx, %d rows, %d failed)" % (workers, t_new, t_old / t_new, stats['inserted'], len(stats['failed'])))
+    print("  with gaps:          %d rows, %d failed" % (gaps['inserted'], len(gaps['failed'])))
+    return {'sequential': t_old, 'concurrent': t_new}
+
+
+def bench_events(n_bars=200000, repeat=3):
+    """
+    Measures the per-event overhead of the backtest loop: every bar puts one MarketEvent, whose handler puts one OrderEvent,
+    and the queue is drained. The legacy loop uses queue.Queue, get(False) until queue.Empty and an if/elif chain on string types,
+    the new one EventBus.dispatch() with the EventType dispatch table. Handlers are no-ops, so only the event plumbing is timed.
+    """
+    order = OrderEvent(None, '600000', 'MKT', 100, 'BUY')
+
+    class LegacyEvent(object):
+        def __init__(self, type):
+            self.type = type
+
+    def legacy():
+        events = queue.Queue()
+        legacy_order = LegacyEvent('ORDER')
+        for _ in range(n_bars):
+            events.put(LegacyEvent('MARKET'))
+            while True:
+                try:
+                    event = events.get(False)
+                except queue.Empty:
+                    break
+                else:
+                    if event is not None:
+                        if event.type == 'MARKET':
+                            events.put(legacy_order)
+                        elif event.type == 'SIGNAL':
+                            pass
+                        elif event.type == 'ORDER':
+                            pass
+                        elif event.type == 'FILL':
+                            pass
+
+    def bus():
+        events = EventBus()
+        events.register(EventType.MARKET, lambda event: events.put(order))
+        events.register(EventType.ORDER, lambda event: None)
+        put = events.put
+        dispatch = events.dispatch
+        for _ in range(n_bars):
+            put(MarketEvent())
+            dispatch()
+
+    t_old, _ = _timeit(legacy, repeat)
+    t_new, _ = _timeit(bus, repeat)
+    n_events = 2 * n_bars
+    print("Dispatching %d events over %d bars:" % (n_events, n_bars))
+    print("  queue.Queue + if/elif: %8.3f s  %6.0f ns/event" % (t_old, t_old / n_events * 1e9))
+    print("  EventBus:              %8.3f s  %6.0f ns/event  (%.1fx)" % (t_new, t_new / n_events * 1e9, t_old / t_new))
+    return {'queue': t_old, 'bus': t_new}
+
+
+def bench_vectorized(n_symbols=50, n_days=2500):
+    """
+    Compares the event-driven Backtest with VectorizedBacktest running the same moving average cross, and checks that both agree.
+    The targets are computed once for timing, vectorized_backtest.parity_suite() checks them for look-ahead.
+    """
+    start = dt.datetime(2000, 1, 3)
+    end = start + dt.timedelta(days=int(n_days * 7 / 5))
+    symbol_list = ['%06d' % (600000 + i) for i in range(n_symbols)]
+    result = check_parity(SyntheticBarSource(seed=0), symbol_list, VectorizedMovingAverageCross(20, 60, 1000), start, end, causal=False)
+    print("Moving average cross, %d symbols x %d days (max holdings diff %.2e):" % (n_symbols, n_days, result['max_abs_diff']))
+    print("  event-driven:       %8.3f s" % result['event_driven'])
+    print("  vectorized:         %8.3f s  (%.0fx)" % (result['vectorized'], result['event_driven'] / result['vectorized']))
+    return result
+
+
+def bench_sweep(n_symbols=20, n_days=1000, processes=None):
+    """
+    Runs a grid of moving average crosses with ParameterSweep, once in a single process and once across the process pool,
+    and reports the speed-up as a share of linear scaling over the cores actually available.
+    """
+    start = dt.datetime(2000, 1, 3)
+    end = start + dt.timedelta(days=int(n_days * 7 / 5))
+    symbol_list = ['%06d' % (600000 + i) for i in range(n_symbols)]
+    store = SyntheticBarSource(seed=0).load(symbol_list, start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+    windows = [VectorizedMovingAverageCross(s, l, 1000) for s, l in product_grid([5, 10, 20, 30], [40, 60, 90, 120])]
+
+    def sweep(n):
+        return ParameterSweep(symbol_list, 1000000.0, start, end, store, SimulatedExecutionHandler, Portfolio,
+                              TargetPositionStrategy, windows, processes=n).run()
+
+    t_old, serial = _timeit(lambda: sweep(1), 1)
+    t_new, parallel = _timeit(lambda: sweep(processes), 1)
+    cores = os.cpu_count() or 1
+    n = processes or cores
+    assert serial.drop(columns=['window', 'Seconds']).equals(parallel.drop(columns=['window', 'Seconds']))
+    print("Sweeping %d windows over %d symbols x %d days on %d cores:" % (len(windows), n_symbols, len(store), cores))
+    print("  1 process:          %8.3f s" % t_old)
+    print("  %2d processes:       %8.3f s  (%.1fx, %.0f%% of linear)" % (n, t_new, t_old / t_new, 100.0 * t_old / t_new / min(n, cores)))
+    if min(n, cores) < 2:
+        print("  A single core measures the pool overhead only, run on a multi-core machine to measure the scaling.")
+    return {'serial': t_old, 'parallel': t_new}
+
+
+def bench_walk_forward(db_path, tickers, n_folds=20, processes=None):
+    """
+    Compares a walk-forward run against building a fresh Backtest, which reloads the bars from the db, for every in-sample and out-of-sample run.
+    """
+    store = SQLiteBarSource(db_path).load(tickers, '2000-01-01 00:00:00', '2030-01-01 00:00:00')
+    windows = [VectorizedMovingAverageCross(s, l, 1000) for s, l in product_grid([5, 20], [40, 60])]
+    test_bars = 60
+    train_bars = max((len(store) - test_bars) - (n_folds - 1) * test_bars, test_bars)
+    walk_forward = WalkForward(tickers, 1000000.0, store, SimulatedExecutionHandler, Portfolio, TargetPositionStrategy, windows,
+                               train_bars, test_bars, warmup=min(60, train_bars), processes=processes)
+    folds = walk_forward.folds()
+
+    def fresh():
+        for train_start, train_stop, test_start, test_stop in folds:
+            runs = [(train_start, train_stop, window) for window in windows] + [(test_start - walk_forward.warmup, test_stop, windows[0])]
+            for start, stop, window in runs:
+                startdate = store.index[start].to_pydatetime()
+                enddate = store.index[stop - 1].to_pydatetime()
+                backtest = Backtest('./', tickers, 1000000.0, 0.0, startdate, enddate, SQLiteBarSource(db_path), SimulatedExecutionHandler,
+                                    Portfolio, TargetPositionStrategy, window, progress=ProgressSink())
+                backtest.simulate_trading()
+
+    t_old, _ = _timeit(fresh, 1)
+    t_new, _ = _timeit(walk_forward.run, 1)
+    print("Walk-forward, %d folds x %d windows, %d symbols:" % (len(folds), len(windows), len(tickers)))
+    print("  fresh Backtest per run: %8.3f s" % t_old)
+    print("  WalkForward:            %8.3f s  (%.1fx)" % (t_new, t_old / t_new))
+    return {'fresh': t_old, 'walk_forward': t_new}
+
+
+def bench_ledger(n_symbols=300, n_days=2500):
+    """
+    Times Portfolio.update_timeindex() over every bar plus create_equity_curve_dataframe(), with the per-bar dicts and with the ledger arrays.
+    """
+    symbol_list = ['%06d' % (600000 + i) for i in range(n_symbols)]
+    start = dt.datetime(2000, 1, 3)
+    end = start + dt.timedelta(days=int(n_days * 7 / 5))
+    store = SyntheticBarSource(seed=0).load(symbol_list, start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+
+    def replay(ledger):
+        bars = BarDataHandler(EventBus(), InMemoryBarSource(store), symbol_list)
+        portfolio = Portfolio(bars, bars.events, start, 1000000.0, ledger=ledger)
+        for i, s in enumerate(symbol_list):
+            portfolio.current_positions[s] = float(i % 7) * 100.0
+        event = MarketEvent()
+        while bars.continue_backtest:
+            bars.update_bars()
+            portfolio.update_timeindex(event)
+        portfolio.create_equity_curve_dataframe()
+        return portfolio.equity_curve
+
+    t_old, old = _timeit(lambda: replay(False), 1)
+    t_new, new = _timeit(lambda: replay(True), 1)
+    assert np.allclose(old.values.astype(np.float64), new.values, equal_nan=True)
+    print("Marking %d symbols to market over %d bars:" % (n_symbols, len(store)))
+    print("  dict per bar:       %8.3f s" % t_old)
+    print("  ledger arrays:      %8.3f s  (%.1fx)" % (t_new, t_old / t_new))
+    return {'dict': t_old, 'ledger': t_new}
+
+
+class NaiveMovingAverageCross(Strategy):
+    """
+    MovingAverageCrossStrategy recomputing both averages with np.mean over the window for every symbol and bar, the reference of bench_indicators().
+    """
+    def __init__(self, bars, events, window=(30, 90), quantity=100):
+        self.bars = bars
+        self.events = events
+        self.symbol_list = self.bars.symbol_list
+        self.short_window, self.long_window = window[0], window[1]
+        self.quantity = quantity
+        self.invested = dict((s, False) for s in self.symbol_list)
+        self.latest_datetime = None
+
+    def calculate_signals(self, event):
+        bar_datetime = self.bars.get_latest_bar_datetime(self.symbol_list[0])
+        if bar_datetime == self.latest_datetime:
+            return
+        self.latest_datetime = bar_datetime
+        for s in self.symbol_list:
+            values = self.bars.get_latest_bars_values(s, 'adj_close', N=self.long_window)
+            above = len(values) == self.long_window and np.mean(values[-self.short_window:]) > np.mean(values)
+            if above != self.invested[s]:
+                self.events.put(SignalEvent(1, s, bar_datetime, 'LONG' if above else 'SHORT', 1.0, self.quantity))
+                self.invested[s] = above
+
+
+def bench_indicators(n_symbols=50, n_days=2500, short_window=20, long_window=120):
+    """
+    Runs the moving average cross through Backtest with the per-bar np.mean recompute and with the streaming indicators,
+    and checks both against VectorizedBacktest.
+    """
+    start = dt.datetime(2000, 1, 3)
+    end = start + dt.timedelta(days=int(n_days * 7 / 5))
+    symbol_list = ['%06d' % (600000 + i) for i in range(n_symbols)]
+    store = SyntheticBarSource(seed=0, missing=0.02).load(symbol_list, start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+
+    def run(strategy):
+        backtest = Backtest('./', symbol_list, 1000000.0, 0.0, start, end, InMemoryBarSource(store), SimulatedExecutionHandler, Portfolio,
+                            strategy, [short_window, long_window], progress=ProgressSink())
+        backtest.simulate_trading()
+        return backtest.portfolio.holdings_frame()
+
+    t_old, old = _timeit(lambda: run(NaiveMovingAverageCross), 1)
+    t_new, new = _timeit(lambda: run(MovingAverageCrossStrategy), 1)
+    vectorized = VectorizedBacktest(symbol_list, 1000000.0, start, end, store.view(), VectorizedMovingAverageCross(short_window, long_window, 100))
+    vectorized.run()
+    columns = list(symbol_list) + ['cash', 'commission', 'total']
+    assert np.allclose(old[columns].values.astype(np.float64), new[columns].values.astype(np.float64), rtol=1e-12, equal_nan=True)
+    assert np.allclose(vectorized.holdings[columns].values, new[columns].values.astype(np.float64), rtol=1e-9, atol=1e-6)
+    print("Moving average cross %d/%d, %d symbols x %d bars:" % (short_window, long_window, n_symbols, len(store)))
+    print("  np.mean per bar:    %8.3f s" % t_old)
+    print("  streaming SMA:      %8.3f s  (%.1fx)" % (t_new, t_old / t_new))
+    return {'naive': t_old, 'streaming': t_new}
+
+
+class CrossSectionalMovingAverageCross(CrossSectionalStrategy):
+    """
+    NaiveMovingAverageCross on the cross-sectional interface: both averages of all symbols from the window arrays, one TargetEvent of share targets per bar.
+    """
+    kind = 'QUANTITY'
+
+    def __init__(self, bars, events, window=(30, 90), quantity=100):
+        self.short_window, self.long_window = window[0], window[1]
+        self.quantity = quantity
+        CrossSectionalStrategy.__init__(self, bars, events, self.long_window)
+
+    def generate_targets(self, window):
+        close = window['adj_close']
+        if len(close) < self.long_window:
+            return np.zeros(len(self.symbol_list))
+        above = close[-self.short_window:].mean(axis=0) > close.mean(axis=0)
+        return np.where(above, float(self.quantity), 0.0)
+
+
+def bench_cross_section(n_symbols=300, n_days=1000, short_window=20, long_window=60):
+    """
+    Runs the moving average cross through Backtest with one SignalEvent per symbol and with one TargetEvent per bar,
+    checks both against VectorizedBacktest, and times CrossSectionalMomentum over the same universe.
+    """
+    start = dt.datetime(2000, 1, 3)
+    end = start + dt.timedelta(days=int(n_days * 7 / 5))
+    symbol_list = ['%06d' % (600000 + i) for i in range(n_symbols)]
+    store = SyntheticBarSource(seed=0, missing=0.02).load(symbol_list, start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+
+    def run(strategy, window):
+        backtest = Backtest('./', symbol_list, 1000000.0, 0.0, start, end, InMemoryBarSource(store), SimulatedExecutionHandler,
+                            functools.partial(Portfolio, ledger=True), strategy, window, progress=ProgressSink())
+        backtest.simulate_trading()
+        return backtest
+
+    t_old, old = _timeit(lambda: run(NaiveMovingAverageCross, [short_window, long_window]), 1)
+    t_new, new = _timeit(lambda: run(CrossSectionalMovingAverageCross, [short_window, long_window]), 1)
+    vectorized = VectorizedBacktest(symbol_list, 1000000.0, start, end, store.view(), VectorizedMovingAverageCross(short_window, long_window, 100))
+    vectorized.run()
+    columns = list(symbol_list) + ['cash', 'commission', 'total']
+    assert old.orders == new.orders == vectorized.orders
+    for backtest in (old, new):
+        assert np.allclose(vectorized.holdings[columns].values, backtest.portfolio.holdings_frame()[columns].values, rtol=1e-9, atol=1e-6)
+    t_momentum, momentum = _timeit(lambda: run(CrossSectionalMomentum, [60, 30, 20]), 1)
+    print("Moving average cross %d/%d, %d symbols x %d bars:" % (short_window, long_window, n_symbols, len(store)))
+    print("  SignalEvent per symbol: %8.3f s  (%d signals)" % (t_old, old.signals))
+    print("  TargetEvent per bar:    %8.3f s  (%d targets)  (%.1fx)" % (t_new, new.targets, t_old / t_new))
+    print("Momentum top 30 of %d, rebalanced every 20 bars: %.3f s, %d orders" % (n_symbols, t_momentum, momentum.orders))
+    return {'signals': t_old, 'targets': t_new, 'momentum': t_momentum}
+
+
+def _lagged_series(close, volume, lags=5):
+    """
+    The per-symbol loop of create_lagged_series() on already loaded prices, the reference of bench_features().
+    """
+    tslag = pd.DataFrame(index=close.index)
+    tslag['Today'] = close
+    tslag['Volume'] = volume
+    for i in range(0, lags):
+        tslag['Lag%s' % str(i+1)] = close.shift(i+1)
+    tsret = pd.DataFrame(index=tslag.index)
+    tsret['Volume'] = tslag['Volume']
+    tsret['Today'] = tslag['Today'].pct_change(fill_method=None) * 100.0
+    tsret.loc[tsret['Today'].abs() < 0.0001, ['Today']] = 0.0001
+    for i in range(0, lags):
+        tsret['Lag%s' % str(i+1)] = tslag['Lag%s' % str(i+1)].pct_change(fill_method=None) * 100.0
+    tsret['Direction'] = np.sign(tsret['Today'])
+    return tsret
+
+
+def bench_features(n_symbols=300, n_days=2500, repeat=3):
+    """
+    Compares create_lagged_series() run symbol by symbol on the raw rows of every symbol with build_features() over the padded store
+    of the whole universe, and with reading its npz cache. Both must give the same rows, so no suspended or missing bar becomes a row.
+    """
+    start = dt.datetime(2000, 1, 3)
+    end = start + dt.timedelta(days=int(n_days * 7 / 5))
+    symbol_list = ['%06d' % (600000 + i) for i in range(n_symbols)]
+    source = SyntheticBarSource(seed=0, missing=0.05)
+    store = source.load(symbol_list, start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+    raw = source.load_frames(symbol_list, start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+
+    def per_symbol():
+        frames = {}
+        for s in symbol_list:
+            frames[s] = _lagged_series(raw[s]['close_price'] * raw[s]['adj_factor'], raw[s]['volume']).dropna()
+        return frames
+
+    t_old, old = _timeit(per_symbol, 1)
+    t_new, new = _timeit(lambda: build_features(store), repeat)
+    cache_dir = tempfile.mkdtemp()
+    load_features(store, cache_dir)
+    t_cache, cached = _timeit(lambda: load_features(store, cache_dir), repeat)
+    assert np.array_equal(cached.X, new.X)
+    frame = new.to_frame()
+    for s in symbol_list:
+        mine = frame.xs(s, level='symbol')
+        # build_features() also drops the rows of the RelativeVolume warm-up
+        expected = old[s][old[s].index >= mine.index[0]]
+        assert mine.index.equals(expected.index)
+        assert np.allclose(mine[expected.columns].values, expected.values, rtol=1e-5, atol=1e-4)
+    print("Lagged features of %d symbols x %d bars (%d rows, %.1f MB float32):" % (n_symbols, len(store), len(new), new.X.nbytes / 1e6))
+    print("  per symbol:         %8.3f s" % t_old)
+    print("  build_features:     %8.3f s  (%.0fx)" % (t_new, t_old / t_new))
+    print("  npz cache:          %8.3f s  (%.0fx)" % (t_cache, t_old / t_cache))
+    return {'per_symbol': t_old, 'vectorized': t_new, 'cache': t_cache}
+
+
+def bench_execution(n_symbols=300, n_days=1000):
+    """
+    Runs the same moving average cross with SimulatedExecutionHandler and with RealisticExecutionHandler,
+    on bars with suspensions and limit moves, and reports the cost of the realistic fills.
+    """
+    start = dt.datetime(2000, 1, 3)
+    end = start + dt.timedelta(days=int(n_days * 7 / 5))
+    symbol_list = ['%06d' % (600000 + i) for i in range(n_symbols)]
+    store = SyntheticBarSource(seed=0, volatility=0.04, missing=0.05).load(symbol_list, start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+
+    def run(execution_handler):
+        backtest = Backtest('./', symbol_list, 10000000.0, 0.0, start, end, InMemoryBarSource(store), execution_handler,
+                            functools.partial(Portfolio, ledger=True), MovingAverageCrossStrategy, [10, 40], progress=ProgressSink())
+        backtest.simulate_trading()
+        return backtest
+
+    t_old, old = _timeit(lambda: run(SimulatedExecutionHandler), 1)
+    t_new, new = _timeit(lambda: run(RealisticExecutionHandler), 1)
+    print("Moving average cross, %d symbols x %d bars, %.1f%% suspended bars:" % (n_symbols, len(store), 100.0 * (1.0 - store.fields['traded'].mean())))
+    print("  naive fills:        %8.3f s  (%d fills, total %.0f)" % (t_old, old.fills, old.portfolio.stats.value))
+    # Carried orders stay queued in the portfolio until they are filled or expire
+    carried = np.zeros(n_symbols)
+    for order, remaining, _ in new.execution_handler.pending:
+        carried[new.portfolio.scheduler.rank[order.symbol]] += remaining if order.direction == 'BUY' else -remaining
+    assert np.allclose(carried, new.portfolio.queued)
+    print("  realistic fills:    %8.3f s  (%d fills, total %.0f, %d expired, %d orders carried at the end)  (%.2fx the time)" % (
+        t_new, new.fills, new.portfolio.stats.value, new.cancels, len(new.execution_handler.pending), t_new / t_old))
+    return {'naive': t_old, 'realistic': t_new}
+
+
+class LimitOrderLadder(Strategy):
+    """
+    Keeps a ladder of levels limit buys below and limit sells above the latest adj_close of every symbol, each resting tif bars.
+    On every bar the innermost buy of the previous bar is cancelled and its second sell is replaced at the new price.
+    """
+    def __init__(self, bars, events, window=(10, 0.005, 50)):
+        self.bars = bars
+        self.events = events
+        self.symbol_list = self.bars.symbol_list
+        self.levels, self.step, self.tif = window[0], window[1], window[2]
+        self.bar = 0
+        self.latest_datetime = None
+
+    def calculate_signals(self, event):
+        if event.type != EventType.MARKET:
+            return
+        bar_datetime = self.bars.get_latest_bar_datetime(self.symbol_list[0])
+        if bar_datetime == self.latest_datetime:
+            return
+        self.latest_datetime = bar_datetime
+        self.bar += 1
+        close = self.bars.get_latest_cross_section('adj_close')
+        put = self.events.put
+        for col in np.flatnonzero(np.isfinite(close)).tolist():
+            symbol = self.symbol_list[col]
+            price = close[col]
+            put(OrderEvent(bar_datetime, symbol, 'CXL', 0, 'BUY', order_id=(self.bar - 1, col, 'BUY', 1)))
+            put(OrderEvent(bar_datetime, symbol, 'LMT', 100, 'SELL', limit_price=price * (1.0 + 2 * self.step), time_in_force=self.tif,
+                           order_id=(self.bar - 1, col, 'SELL', 2)))
+            for k in range(1, self.levels + 1):
+                put(OrderEvent(bar_datetime, symbol, 'LMT', 100, 'BUY', limit_price=price * (1.0 - k * self.step), time_in_force=self.tif,
+                               order_id=(self.bar, col, 'BUY', k)))
+                put(OrderEvent(bar_datetime, symbol, 'LMT', 100, 'SELL', limit_price=price * (1.0 + k * self.step), time_in_force=self.tif,
+                               order_id=(self.bar, col, 'SELL', k)))
+
+
+class _ScanLimitOrderHandler(LimitOrderExecutionHandler):
+    """
+    LimitOrderExecutionHandler with the resting orders in one plain dict, checked one by one on every bar, the reference of bench_limit_orders().
+    All crossing orders are filled in full, so the fills do not depend on the matching order within a book.
+    """
+    def _add(self, entry):
+        pass
+
+    def _retire(self, entry, in_book=True):
+        entry.active = False
+
+    def on_market(self, event):
+        if event.type != EventType.MARKET:
+            return
+        row = self.store.cursor
+        if row == self.row or row < 0:
+            return
+        self.row = row
+        self.datetime = self.store.latest_datetime()
+        fields = self.store.fields
+        adj_factor = fields['adj_factor'][row]
+        bar_open = (fields['open_price'][row] * adj_factor).tolist()
+        low = (fields['low_price'][row] * adj_factor).tolist()
+        high = (fields['high_price'][row] * adj_factor).tolist()
+        traded = (fields['traded'][row] > 0.0).tolist()
+        for entry in list(self.resting.values()):
+            col, limit = entry.col, entry.order.limit_price
+            if not traded[col]:
+                continue
+            if entry.order.direction == 'BUY' and limit >= low[col]:
+                self._fill(entry, min(limit, bar_open[col]))
+            elif entry.order.direction == 'SELL' and limit <= high[col]:
+                self._fill(entry, max(limit, bar_open[col]))
+        for entry in list(self.resting.values()):
+            if entry.expires is not None and entry.expires <= row:
+                self.cancel(entry.order.order_id, reason='EXPIRED')
+
+
+class _TimedBook(object):
+    """
+    Mixin accumulating the time an execution handler spends on its books: matching the bars and taking the orders.
+    """
+    book_seconds = 0.0
+
+    def on_market(self, event):
+        start = time.perf_counter()
+        super(_TimedBook, self).on_market(event)
+        self.book_seconds += time.perf_counter() - start
+
+    def execute_order(self, event):
+        start = time.perf_counter()
+        super(_TimedBook, self).execute_order(event)
+        self.book_seconds += time.perf_counter() - start
+
+
+class _TimedHeapBook(_TimedBook, LimitOrderExecutionHandler):
+    pass
+
+
+class _TimedScanBook(_TimedBook, _ScanLimitOrderHandler):
+    pass
+
+
+def _check_books(handler):
+    """
+    Checks that the dead entry counts of the heaps are exact and that no heap holds more than twice the resting orders.
+    """
+    resting = np.zeros(len(handler.bids), dtype=np.int64)
+    for entry in handler.resting.values():
+        resting[entry.col] += 1
+    for books, dead in ((handler.bids, handler.dead_bids), (handler.asks, handler.dead_asks)):
+        for col, book in enumerate(books):
+            assert sum(1 for item in book if not item[2].active) == dead[col]
+    sizes = np.array([len(bids) + len(asks) for bids, asks in zip(handler.bids, handler.asks)])
+    assert (sizes <= 2 * resting).all()
+    assert sum(1 for item in handler.expiry if not item[2].active) == handler.dead_expiry
+    assert len(handler.expiry) <= 2 * len(handler.resting)
+    return int(sizes.sum())
+
+
+def bench_limit_orders(n_symbols=5, n_days=2500, levels=10, depths=(10, 100, 1000, 2500)):
+    """
+    Runs LimitOrderLadder with the heap books of LimitOrderExecutionHandler and with a linear pass over all resting orders on every bar,
+    and checks that both give the same fills, cancels and holdings. The book depth is set by the time in force of the ladder orders,
+    so every depth sends the same orders per bar and the difference in book time is the cost of the books alone.
+    """
+    start = dt.datetime(2000, 1, 3)
+    end = start + dt.timedelta(days=int(n_days * 7 / 5))
+    symbol_list = ['%06d' % (600000 + i) for i in range(n_symbols)]
+    store = SyntheticBarSource(seed=0, missing=0.02).load(symbol_list, start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+    columns = list(symbol_list) + ['cash', 'commission', 'total']
+
+    def run(execution_handler, tif):
+        backtest = Backtest('./', symbol_list, 10000000.0, 0.0, start, end, InMemoryBarSource(store), execution_handler,
+                            functools.partial(Portfolio, ledger=True), LimitOrderLadder, [levels, 0.005, tif], progress=ProgressSink())
+        backtest.simulate_trading()
+        return backtest
+
+    print("Limit order ladder of %d levels, %d symbols x %d bars:" % (levels, n_symbols, len(store)))
+    timings = {}
+    for tif in depths:
+        scan = run(_TimedScanBook, tif)
+        heap = run(_TimedHeapBook, tif)
+        assert (scan.orders, scan.fills, scan.cancels) == (heap.orders, heap.fills, heap.cancels)
+        assert np.allclose(scan.portfolio.holdings_frame()[columns].values, heap.portfolio.holdings_frame()[columns].values, rtol=1e-9, atol=1e-6)
+        # The orders still resting are exactly those the portfolio counts as queued
+        resting = np.zeros(n_symbols)
+        for entry in heap.execution_handler.resting.values():
+            resting[entry.col] += entry.remaining if entry.order.direction == 'BUY' else -entry.remaining
+        assert np.allclose(resting, heap.portfolio.queued)
+        entries = _check_books(heap.execution_handler)
+        t_scan, t_heap = scan.execution_handler.book_seconds, heap.execution_handler.book_seconds
+        print("  time in force %4d: %6d resting at the end, %6d heap entries, book time linear pass %7.3f s, heaps %7.3f s  (%.1fx)" % (
+            tif, len(heap.execution_handler.resting), entries, t_scan, t_heap, t_scan / t_heap))
+        timings[tif] = {'scan': t_scan, 'heap': t_heap}
+    return timings
+
+
+def _loop_drawdowns(pnl):
+    """
+    The former bar-by-bar create_drawdowns(), kept as the reference of bench_drawdowns().
+    """
+    hwm = [0]
+    idx = pnl.index
+    drawdown = pd.Series(index = idx, dtype=np.float64)
+    duration = pd.Series(index = idx, dtype=np.float64)
+    for t in range(1, len(idx)):
+        cur_hwm = max(hwm[t-1], pnl.iloc[t])
+        hwm.append(cur_hwm)
+        drawdown.iloc[t] = hwm[t] - pnl.iloc[t]
+        duration.iloc[t] = 0 if drawdown.iloc[t] == 0 else duration.iloc[t-1] + 1
+    return drawdown, drawdown.max(), duration.max()
+
+
+def bench_drawdowns(n_bars=20000, n_runs=100, repeat=3):
+    """
+    Compares the bar-by-bar drawdown loop with the vectorized create_drawdowns() on one curve,
+    and times performance_summary() scoring n_runs curves stacked as columns.
+    """
+    rng = np.random.RandomState(0)
+    curves = pd.DataFrame(np.cumprod(1.0 + rng.normal(0.0002, 0.01, (n_bars, n_runs)), axis=0),
+                          index=pd.date_range('2000-01-03', periods=n_bars, freq='min'))
+    pnl = curves[0]
+    t_old, old = _timeit(lambda: _loop_drawdowns(pnl), 1)
+    t_new, new = _timeit(lambda: create_drawdowns(pnl), repeat)
+    assert old[0].equals(new[0]) and old[1:] == new[1:]
+    t_batch, _ = _timeit(lambda: performance_summary(curves), repeat)
+    print("Drawdowns of a %d bar equity curve:" % n_bars)
+    print("  bar-by-bar loop:    %8.4f s" % t_old)
+    print("  vectorized:         %8.4f s  (%.0fx)" % (t_new, t_old / t_new))
+    print("  performance_summary of %d curves: %.4f s" % (n_runs, t_batch))
+    return {'loop': t_old, 'vectorized': t_new, 'summary': t_batch}
+
+
+def _with_db(args, func):
+    """
+    Runs func(db_path, tickers) against args.db, or against a temporary synthetic db if none is given.
+    """
+    if args.db:
+        con = sqlite3.connect(args.db)
+        tickers = [t[0] for t in con.execute("SELECT ticker FROM symbol ORDER BY id").fetchall()][:args.symbols]
+        con.close()
+        return func(args.db, tickers)
+    tmp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(tmp_dir, 'securities_master.db')
+    print("Building synthetic db with %d symbols x %d days..." % (args.symbols, args.days))
+    tickers = build_synthetic_db(db_path, n_symbols=args.symbols, n_days=args.days)
+    return func(db_path, tickers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Thanatos benchmarks")
+    parser.add_argument('benchmark', choices=['load', 'ingest', 'download', 'events', 'vectorized', 'sweep', 'walk_forward', 'ledger', 'drawdowns', 'indicators', 'cross_section', 'features', 'execution', 'limit_orders'])
+    parser.add_argument('--db', default=None, help="Path to an existing securities_master.db, a synthetic one is built if omitted")
+    parser.add_argument('--symbols', type=int, default=300)
+    parser.add_argument('--days', type=int, default=2500)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--processes', type=int, default=None, help="Worker processes of the sweep, defaults to the number of cores")
+    parser.add_argument('--start', default='2000-01-01 00:00:00')
+    parser.add_argument('--end', default='2030-01-01 00:00:00')
+    args = parser.parse_args()
+
+    if args.benchmark == 'load':
+        _with_db(args, lambda db, tickers: bench_universe_load(db, tickers, args.start, args.end, repeat=args.repeat))
+    elif args.benchmark == 'ingest':
+        bench_ingest(n_symbols=args.symbols, n_days=args.days)
+    elif args.benchmark == 'download':
+        bench_download(n_symbols=args.symbols)
+    elif args.benchmark == 'events':
+        bench_events(repeat=args.repeat)
+    elif args.benchmark == 'vectorized':
+        bench_vectorized(n_symbols=args.symbols, n_days=args.days)
+    elif args.benchmark == 'sweep':
+        bench_sweep(n_symbols=args.symbols, n_days=args.days, processes=args.processes)
+    elif args.benchmark == 'walk_forward':
+        _with_db(args, lambda db, tickers: bench_walk_forward(db, tickers, processes=args.processes))
+    elif args.benchmark == 'ledger':
+        bench_ledger(n_symbols=args.symbols, n_days=args.days)
+    elif args.benchmark == 'drawdowns':
+        bench_drawdowns(repeat=args.repeat)
+    elif args.benchmark == 'indicators':
+        bench_indicators(n_symbols=args.symbols, n_days=args.days)
+    elif args.benchmark == 'cross_section':
+        bench_cross_section(n_symbols=args.symbols, n_days=args.days)
+    elif args.benchmark == 'features':
+        bench_features(n_symbols=args.symbols, n_days=args.days, repeat=args.repeat)
+    elif args.benchmark == 'execution':
+        bench_execution(n_symbols=args.symbols, n_days=args.days)
+    elif args.benchmark == 'limit_orders':
+        bench_limit_orders()
+
+
+if __name__ == "__main__":
+    main()
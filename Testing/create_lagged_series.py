@@ -12,6 +12,8 @@ def create_lagged_series(symbol, start_date, end_date, lags=5, source='tu'):
     number of lagged returns from the prior trading days
     (lags defaults to 5 days). Trading volume, as well as
     the Direction from the previous day, are also included.
+    For a whole universe, features.build_features() computes
+    the same columns for all symbols at once from a BarStore.
 
     Parameters
     ----------
@@ -1,9 +1,6 @@
 from abc import ABCMeta, abstractmethod
-import os, os.path
-import numpy as np
-import pandas as pd
-from tu_share import TuShare
 from event import MarketEvent
+from bar_source import CSVBarSource, SQLiteBarSource, MySQLBarSource, MemmapBarSource
 
 class DataHandler(object):
     """
@@ -42,9 +39,10 @@ class DataHandler(object):
         raise NotImplementedError("Should implement get_latest_bar_value()")
 
     @abstractmethod
-    def get_latest_bars_values(self, symbol, val_type, N=1):
+    def get_latest_bars_values(self, symbol, val_type, N=1, copy=True):
         """
         Returns the last N bar values from the latest_symbol list, or N-k if less available.
+        With copy=False implementations may return a read-only view instead of a fresh array.
         """
         raise NotImplementedError("Should implement get_latest_bars_values()")
 
@@ -56,145 +54,130 @@ class DataHandler(object):
         raise NotImplementedError("Should implement update_bars()")
 
 
-class HistoricCSVDataHandler(DataHandler):
+class BarDataHandler(DataHandler):
     """
-    HistoricCSVDataHandler is designed to read CSV files for each requested symbol from disk and provide an interface to obtain the "latest" bar in a manner identical to a live trading interface.
+    BarDataHandler is the common core of the historic data handlers. It drips the bars of a BarStore, loaded once from a BarSource, into the backtest
+    and provides an interface to obtain the "latest" bar in a manner identical to a live trading interface.
+    Any BarSource (CSV, SQLite, MySQL, memmap cache, synthetic or third-party) can be plugged in without subclassing the handler.
     """
-    def __init__(self, events, csv_dir, symbol_list, startdate='2000-01-01 00:00:00', enddate='2020-01-01 00:00:00'):
+    # Bars are replayed from history, so Backtest does not pace them with the heartbeat
+    historical = True
+
+    def __init__(self, events, source, symbol_list, startdate='2000-01-01 00:00:00', enddate='2020-01-01 00:00:00'):
         """
-        Initialises the historic data handler by requesting the location of the CSV files and a list of symbols.
-        It will be assumed that all files are of the form 'symbol.csv', where symbol is a string in the list.
+        Initialises the handler and loads the bars from the source.
 
         Parameters:
         events - The Event Queue.
-        csv_dir - Absolute directory path to the CSV files.
-        symbol_list - A list of symbol strings.
+        source - A BarSource instance.
+        symbol_list - A list of symbol strings. e.g. ['601988','601000']
+        startdate: str, '2000-01-01 00:00:00'
+        enddate: str, '2020-01-01 00:00:00'
         """
         self.events = events
-        self.csv_dir = csv_dir
+        self.source = source
         self.symbol_list = symbol_list
-        self.startdate = startdate # Redundent, remain for compatibality
-        self.enddate = enddate # Redundent, remain for compatibality
-        self.symbol_data = {}
-        self.latest_symbol_data = {}
+        self.startdate = startdate
+        self.enddate = enddate
         self.continue_backtest = True
-        self._open_convert_csv_files()
-
-    def _open_convert_csv_files(self):
-        """
-        Opens the CSV files from the data directory, converting them into pandas DataFrames within a symbol dictionary.
-        For this handler it will be assumed that the data is taken from AlphaVantage. Thus its format will be respected.
-        """
-        comb_index = None
-        for s in self.symbol_list:
-            # Load the CSV file with no header information, indexed on date
-            self.symbol_data[s] = pd.read_csv(
-                os.path.join(self.csv_dir, '%s.csv' % s), header=0, index_col=0, parse_dates=True, names=[ 'price_date', 'ticker', 'open_price', 'high_price', 'low_price', 'close_price', 'volume','adj_factor']
-                )
-            self.symbol_data[s]['adj_close'] = self.symbol_data[s]['close_price'] * self.symbol_data[s]['adj_factor']
-            self.symbol_data[s].sort_index(inplace=True)
-        
-            # Combine the index to pad forward values
-            if comb_index is None:
-                comb_index = self.symbol_data[s].index
-            else:
-                comb_index = comb_index.union(self.symbol_data[s].index)
-
-            # Set the latest symbol_data to None
-            self.latest_symbol_data[s] = []
-
-        for s in self.symbol_list:
-            self.symbol_data[s] = self.symbol_data[s].reindex(index=comb_index, method='pad')
-            self.symbol_data[s].fillna(method='ffill',axis=0,inplace=True) # Be careful if the start day value is 0. Incorrect signal may be triggered in this case
-            self.symbol_data[s]["returns"] = self.symbol_data[s]["adj_close"].pct_change().dropna()
-            self.symbol_data[s] = self.symbol_data[s].iterrows()
-        # Output is generator of ('price_date', 'ticker', 'open_price', 'high_price', 'low_price', 'close_price', 'volume','adj_factor','adj_close','returns')
-
-    def _get_new_bar(self, symbol):
-        """
-        Returns the latest bar from the data feed via generator.
-        """
-        for b in self.symbol_data[symbol]:
-            yield b
-            
+        # Output fields are ('open_price', 'high_price', 'low_price', 'close_price', 'volume','adj_factor','adj_close','returns','traded')
+        self.bar_store = source.load(symbol_list, startdate, enddate)
+
     def get_latest_bar(self, symbol):
         """
-        Returns the last bar from the latest_symbol list.
+        Returns the last bar from the bar store as a (datetime, bar) tuple.
         """
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            return self.bar_store.latest_bar(symbol)
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
-        else:
-            return bars_list[-1]
 
     def get_latest_bars(self, symbol, N=1):
         """
-        Returns the last N bars from the latest_symbol list, or N-k if less available.
+        Returns the last N bars from the bar store, or N-k if less available.
         """
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            return self.bar_store.latest_bars(symbol, N)
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
-        else:
-            return bars_list[-N:]
 
     def get_latest_bar_datetime(self, symbol):
         """
         Returns a Python datetime object for the last bar.
         """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
+        if symbol not in self.bar_store.symbol_index:
             print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return bars_list[-1][0]
-    
+            raise KeyError(symbol)
+        return self.bar_store.latest_datetime()
+
     def get_latest_bar_value(self, symbol, val_type):
         """
-        Returns one of the Open, High, Low, Close, Volume or OI values from the Pandas Bar series object.
+        Returns one of the Open, High, Low, Close, Volume or OI values from the latest bar.
         """
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            return self.bar_store.latest_value(symbol, val_type)
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
-        else:
-            return getattr(bars_list[-1][1], val_type)
-        
-    def get_latest_bars_values(self, symbol, val_type, N=1):
+
+    def get_latest_bars_values(self, symbol, val_type, N=1, copy=True):
         """
-        Returns the last N bar values from the latest_symbol list, or N-k if less available.
+        Returns the last N bar values from the bar store, or N-k if less available.
+        If copy is False, a read-only view into the store is returned instead, so the cost does not depend on N.
         """
         try:
-            bars_list = self.get_latest_bars(symbol, N)
+            values = self.bar_store.latest_values(symbol, val_type, N)
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return np.array([getattr(b[1], val_type) for b in bars_list])
+            return values.copy() if copy else values
+
+    def get_latest_cross_section(self, val_type):
+        """
+        Returns a read-only array with the latest val_type value of every symbol, in symbol_list order.
+        """
+        return self.bar_store.latest_cross_section(val_type)
+
+    def get_latest_window(self, val_type, N=1):
+        """
+        Returns a read-only (N x symbols) array with the last N val_type values of every symbol, in symbol_list order, or N-k rows if less available.
+        """
+        return self.bar_store.latest_window(val_type, N)
 
     def update_bars(self):
         """
-        Pushes the latest bar to the latest_symbol_data structure for all symbols in the symbol list.
+        Advances the bar store cursor by one bar for all symbols in the symbol list.
         """
-        for s in self.symbol_list:
-            try:
-                bar = next(self._get_new_bar(s))
-            except StopIteration:
-                self.continue_backtest = False
-            else:
-                if bar is not None:
-                    self.latest_symbol_data[s].append(bar)
+        if not self.bar_store.advance():
+            self.continue_backtest = False
         self.events.put(MarketEvent())
 
 
-class SQLDataHandler(DataHandler):
+class HistoricCSVDataHandler(BarDataHandler):
+    """
+    HistoricCSVDataHandler is designed to read CSV files for each requested symbol from disk and provide an interface to obtain the "latest" bar in a manner identical to a live trading interface.
+    """
+    def __init__(self, events, csv_dir, symbol_list, startdate='2000-01-01 00:00:00', enddate='2020-01-01 00:00:00'):
+        """
+        Initialises the historic data handler by requesting the location of the CSV files and a list of symbols.
+        It will be assumed that all files are of the form 'symbol.csv', where symbol is a string in the list.
+
+        Parameters:
+        events - The Event Queue.
+        csv_dir - Absolute directory path to the CSV files.
+        symbol_list - A list of symbol strings.
+        """
+        self.csv_dir = csv_dir
+        # startdate and enddate are redundent for CSV files, remain for compatibality
+        BarDataHandler.__init__(self, events, CSVBarSource(csv_dir), symbol_list, startdate, enddate)
+
+
+class SQLDataHandler(BarDataHandler):
     """
-    Read data from DB in the form of Pandas DataFrame and provide a interface to obtain the latest bar in a manner identical to a live trading interface.
+    Read data from DB and provide a interface to obtain the latest bar in a manner identical to a live trading interface.
     This class is used to interact with a locally installed MySQL db.
     Work the same as HistoricCSVDataHandler().
     """
@@ -209,126 +192,16 @@ class SQLDataHandler(DataHandler):
         startdate: str, '2000-01-01 00:00:00'
         enddate: str, '2020-01-01 00:00:00'
         """
-        self.events = events
         self.csv_dir = csv_dir # Redundent, remain for compatibality
-        self.startdate = startdate
-        self.enddate = enddate
-        self.symbol_list = symbol_list
-        self.symbol_data = {}
-        self.latest_symbol_data = {}
-        self.continue_backtest = True
-        self._load_convert_sql_data()
-
-    def _load_convert_sql_data(self):
-        """
-        Read data from DB, converting it into pandas DataFrame within a symbol dictionary.
-        -------------------------------------
-        Output should in format: ('price_date', 'ticker', 'open_price', 'high_price', 'low_price', 'close_price', 'volume','adj_factor','adj_close','returns')
-        """
-        comb_index = None
-        tu = TuShare()
-        for s in self.symbol_list:
-            self.symbol_data[s] = tu.get_daily_data_sql(ticker=s, startdate=self.startdate, enddate=self.enddate)
-            self.symbol_data[s]['adj_close'] = self.symbol_data[s]['close_price'] * self.symbol_data[s]['adj_factor']
-            self.symbol_data[s].sort_index(inplace=True)
-            if comb_index is None:
-                comb_index = self.symbol_data[s].index
-            else:
-                comb_index = comb_index.union(self.symbol_data[s].index)
-            self.latest_symbol_data[s] = []
-        
-        for s in self.symbol_list:
-            self.symbol_data[s] = self.symbol_data[s].reindex(index=comb_index, method='pad')
-            self.symbol_data[s].fillna(method='ffill',axis=0,inplace=True) # Be careful if the start day value is 0. Incorrect signal may be triggered in this case
-            self.symbol_data[s]["returns"] = self.symbol_data[s]["adj_close"].pct_change().dropna()
-            self.symbol_data[s] = self.symbol_data[s].iterrows()
-
-    def _get_new_bar(self, symbol):
-        """
-        Returns the latest bar from the data feed via generator.
-        """
-        for b in self.symbol_data[symbol]:
-            yield b
-            
-    def get_latest_bar(self, symbol):
-        """
-        Returns the last bar from the latest_symbol list.
-        """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return bars_list[-1]
+        BarDataHandler.__init__(self, events, MySQLBarSource(), symbol_list, startdate, enddate)
 
-    def get_latest_bars(self, symbol, N=1):
-        """
-        Returns the last N bars from the latest_symbol list, or N-k if less available.
-        """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return bars_list[-N:]
 
-    def get_latest_bar_datetime(self, symbol):
-        """
-        Returns a Python datetime object for the last bar.
-        """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return bars_list[-1][0]
-    
-    def get_latest_bar_value(self, symbol, val_type):
-        """
-        Returns one of the Open, High, Low, Close, Volume or OI values from the Pandas Bar series object.
-        """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return getattr(bars_list[-1][1], val_type)
-        
-    def get_latest_bars_values(self, symbol, val_type, N=1):
-        """
-        Returns the last N bar values from the latest_symbol list, or N-k if less available.
-        """
-        try:
-            bars_list = self.get_latest_bars(symbol, N)
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return np.array([getattr(b[1], val_type) for b in bars_list])
-
-    def update_bars(self):
-        """
-        Pushes the latest bar to the latest_symbol_data structure for all symbols in the symbol list.
-        """
-        for s in self.symbol_list:
-            try:
-                bar = next(self._get_new_bar(s))
-            except StopIteration:
-                self.continue_backtest = False
-            else:
-                if bar is not None:
-                    self.latest_symbol_data[s].append(bar)
-        self.events.put(MarketEvent())
-
-
-class SQLiteDataHandler(DataHandler):
+class SQLiteDataHandler(BarDataHandler):
     """
     This Class is used to interact with SQLite. Sqlite library of Python is used for WSL2 support.
     """
+    db_source = "./Data/securities_master.db"
+
     def __init__(self, events, csv_dir, symbol_list, startdate='2000-01-01 00:00:00', enddate='2020-01-01 00:00:00'):
         """
         Initialize SQLiteDataHandler. Required *.db file should already be placed under path "csv_dir"
@@ -340,117 +213,28 @@ class SQLiteDataHandler(DataHandler):
         startdate: str, '2000-01-01 00:00:00'
         enddate: str, '2020-01-01 00:00:00'
         """
-        self.events = events
         self.csv_dir = csv_dir
-        self.startdate = startdate
-        self.enddate = enddate
-        self.symbol_list = symbol_list
-        self.symbol_data = {}
-        self.latest_symbol_data = {}
-        self.continue_backtest = True
-        self._load_convert_sql_data()
-
-    def _load_convert_sql_data(self):
-        """
-        Read data from DB, converting it into pandas DataFrame within a symbol dictionary.
-        -------------------------------------
-        Output should be in format: ('price_date', 'ticker', 'open_price', 'high_price', 'low_price', 'close_price', 'volume','adj_factor','adj_close','returns')
-        """
-        comb_index = None
-        tu = TuShare()
-        for s in self.symbol_list:
-            self.symbol_data[s] = tu.get_daily_data_sqlite(ticker=s, startdate=self.startdate, enddate=self.enddate)
-            self.symbol_data[s]['adj_close'] = self.symbol_data[s]['close_price'] * self.symbol_data[s]['adj_factor']
-            self.symbol_data[s].sort_index(inplace=True)
-            if comb_index is None:
-                comb_index = self.symbol_data[s].index
-            else:
-                comb_index = comb_index.union(self.symbol_data[s].index)
-            self.latest_symbol_data[s] = []
-        
-        for s in self.symbol_list:
-            self.symbol_data[s] = self.symbol_data[s].reindex(index=comb_index, method='pad')
-            self.symbol_data[s].fillna(method='ffill',axis=0,inplace=True) # Be careful if the start day value is 0. Incorrect signal may be triggered in this case
-            self.symbol_data[s]["returns"] = self.symbol_data[s]["adj_close"].pct_change().dropna()
-            self.symbol_data[s] = self.symbol_data[s].iterrows()
-
-    def _get_new_bar(self, symbol):
-        """
-        Returns the latest bar from the data feed via generator.
-        """
-        for b in self.symbol_data[symbol]:
-            yield b
+        BarDataHandler.__init__(self, events, SQLiteBarSource(self.db_source), symbol_list, startdate, enddate)
 
-    def get_latest_bar(self, symbol):
-        """
-        Returns the last bar from the latest_symbol list.
-        """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return bars_list[-1]
 
-    def get_latest_bars(self, symbol, N=1):
-        """
-        Returns the last N bars from the latest_symbol list, or N-k if less available.
-        """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return bars_list[-N:]
-
-    def get_latest_bar_datetime(self, symbol):
-        """
-        Returns a Python datetime object for the last bar.
-        """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return bars_list[-1][0]
-
-    def get_latest_bar_value(self, symbol, val_type):
-        """
-        Returns one of the Open, High, Low, Close, Volume or OI values from the Pandas Bar series object.
-        """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return getattr(bars_list[-1][1], val_type)
+class MemmapDataHandler(BarDataHandler):
+    """
+    Serves bars from the memory-mapped binary cache built by bar_cache.py from the SQLite securities_master db.
+    The cache is rebuilt automatically when the universe, the date range or the content of daily_price changes.
+    Repeated backtests and parallel worker processes open the same files and share pages through the OS page cache.
+    """
+    db_source = "./Data/securities_master.db"
 
-    def get_latest_bars_values(self, symbol, val_type, N=1):
-        """
-        Returns the last N bar values from the latest_symbol list, or N-k if less available.
+    def __init__(self, events, csv_dir, symbol_list, startdate='2000-01-01 00:00:00', enddate='2020-01-01 00:00:00'):
         """
-        try:
-            bars_list = self.get_latest_bars(symbol, N)
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return np.array([getattr(b[1], val_type) for b in bars_list])
+        Initialize MemmapDataHandler.
 
-    def update_bars(self):
-        """
-        Pushes the latest bar to the latest_symbol_data structure for all symbols in the symbol list.
+        Parameters:
+        events - The Event Queue.
+        csv_dir - Directory holding the bar caches. Name "csv_dir" is used to stay compatible with HistoricCSVDataHandler()
+        symbol_list - A list of symbol strings. e.g. ['601988','601000']
+        startdate: str, '2000-01-01 00:00:00'
+        enddate: str, '2020-01-01 00:00:00'
         """
-        for s in self.symbol_list:
-            try:
-                bar = next(self._get_new_bar(s))
-            except StopIteration:
-                self.continue_backtest = False
-            else:
-                if bar is not None:
-                    self.latest_symbol_data[s].append(bar)
-        self.events.put(MarketEvent())
+        self.csv_dir = csv_dir
+        BarDataHandler.__init__(self, events, MemmapBarSource(csv_dir, self.db_source), symbol_list, startdate, enddate)
@@ -1,23 +1,44 @@
+from collections import deque
+from enum import IntEnum
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class EventType(IntEnum):
+    """
+    Integer event types, also used as the index of the handler dispatch table of EventBus.
+    """
+    MARKET = 0
+    SIGNAL = 1
+    ORDER = 2
+    FILL = 3
+    TARGET = 4
+    CANCEL = 5
+
+
 class Event(object):
     """
     Event is base class providing an interface for all subsequent (inherited) events, that will trigger further events in the trading infrastructure.
+    Events are __slots__ classes carrying their EventType as class attribute, so creating one allocates no instance dict.
     """
-    pass
+    __slots__ = ()
 
 class MarketEvent(Event):
     """
     Handles the event of receiving a new market update with corresponding bars.
     """
-    def __init__(self):
-        """
-        Initialises the MarketEvent.
-        """
-        self.type = 'MARKET'
+    __slots__ = ()
+    type = EventType.MARKET
 
 class SignalEvent(Event):
     """
     Handles the event of sending a Signal from a Strategy object. This is received by a Portfolio object and acted upon.
     """
+    __slots__ = ('strategy_id', 'symbol', 'datetime', 'signal_type', 'strength', 'quantity')
+    type = EventType.SIGNAL
+
     def __init__(self, strategy_id, symbol, datetime, signal_type, strength, quantity=100):
         """
         Initialises the SignalEvent.
@@ -30,7 +51,6 @@ class SignalEvent(Event):
         strength - An adjustment factor "suggestion" used to scale quantity at the portfolio level. Useful for pairs strategies.
         quantity - Required order amount from strategy. Default as 100.
         """
-        self.type = 'SIGNAL'
         self.strategy_id = strategy_id
         self.symbol = symbol
         self.datetime = datetime
@@ -38,29 +58,65 @@ class SignalEvent(Event):
         self.strength = strength
         self.quantity = quantity
         
+class TargetEvent(Event):
+    """
+    Handles the event of sending the target portfolio of a cross-sectional strategy: one vector covering the whole universe,
+    received by a Portfolio object and turned into the orders that move the positions to the targets.
+    """
+    __slots__ = ('strategy_id', 'datetime', 'targets', 'kind')
+    type = EventType.TARGET
+
+    def __init__(self, strategy_id, datetime, targets, kind='WEIGHT'):
+        """
+        Initialises the TargetEvent.
+
+        Parameters:
+        strategy_id - The unique identifier for the strategy that generated the targets.
+        datetime - The timestamp at which the targets were generated.
+        targets - float array with one entry per symbol, in symbol_list order. NaN leaves the position of the symbol unchanged.
+        kind - 'WEIGHT' for fractions of the portfolio total or 'QUANTITY' for numbers of shares.
+        """
+        if kind not in ('WEIGHT', 'QUANTITY'):
+            raise ValueError("Target kind must be 'WEIGHT' or 'QUANTITY', got '%s'" % kind)
+        self.strategy_id = strategy_id
+        self.datetime = datetime
+        self.targets = targets
+        self.kind = kind
+
 class OrderEvent(Event):
     """
     Handles the event of sending an Order to an execution system. The order contains date, a symbol (e.g. GOOG), a type (market or limit), quantity and a direction.
+    A cancel order ('CXL') withdraws the resting order with the same order_id, a limit order reusing the order_id of a resting one replaces it.
     """
-    def __init__(self, timeindex, symbol, order_type, quantity, direction, smooth=0):
+    __slots__ = ('timeindex', 'symbol', 'order_type', 'quantity', 'direction', 'smooth', 'limit_price', 'time_in_force', 'order_id')
+    type = EventType.ORDER
+
+    def __init__(self, timeindex, symbol, order_type, quantity, direction, smooth=0, limit_price=None, time_in_force='GTC', order_id=None):
         """
         Initialises the order type, setting whether it is a Market order ('MKT') or Limit order ('LMT'), has a quantity (integral) and its direction ('BUY' or 'SELL').
 
         Parameters:
         timeindex - datetime - The timeindex of the order
         symbol - The instrument to trade.
-        order_type - 'MKT' or 'LMT' for Market or Limit.
-        quantity - Non-negative integer for quantity.
+        order_type - 'MKT', 'LMT' or 'CXL' for Market, Limit or Cancel.
+        quantity - Non-negative integer for quantity, ignored by a cancel.
         direction - 'BUY' or 'SELL' for long or short.
         smooth = int, count for smoothing days; if 0 then no smoothing; if > 0 then timeindex is initial order time.
+        limit_price - The worst price of a limit order, in adjusted prices as adj_close.
+        time_in_force - 'GTC' (until filled or cancelled), 'DAY' (the next bar only) or the number of bars a limit order rests.
+        order_id - Identifies the order for cancel and replace, the execution handler assigns one if None.
         """
-        self.type = 'ORDER'
         self.timeindex = timeindex
         self.symbol = symbol
         self.order_type = order_type
-        self.quantity = self._check_set_quantity_positive(quantity)
+        self.quantity = quantity if order_type == 'CXL' else self._check_set_quantity_positive(quantity)
         self.direction = direction
         self.smooth = smooth
+        if order_type == 'LMT' and limit_price is None:
+            raise ValueError("Limit order for %s has no limit_price" % symbol)
+        self.limit_price = limit_price
+        self.time_in_force = time_in_force
+        self.order_id = order_id
 
     def _check_set_quantity_positive(self, quantity):
         """
@@ -78,14 +134,17 @@ class OrderEvent(Event):
         Outputs the values within the Order.
         """
         print(
-            "Order: Symbol=%s, Type=%s, Quantity=%s, Direction=%s" %
-            (self.symbol, self.order_type, self.quantity, self.direction)
+            "Order: Symbol=%s, Type=%s, Quantity=%s, Direction=%s, Limit=%s" %
+            (self.symbol, self.order_type, self.quantity, self.direction, self.limit_price)
         )
 
 class FillEvent(Event):
     """
     Encapsulates the notion of a Filled Order, as returned from a brokerage. Stores the quantity of an instrument actually filled and at what price. In addition, stores the commission of the trade from the brokerage.
     """
+    __slots__ = ('timeindex', 'symbol', 'exchange', 'quantity', 'direction', 'fill_cost', 'commission')
+    type = EventType.FILL
+
     def __init__(self, timeindex, symbol, exchange, quantity,direction, fill_cost, commission=None):
         """
         Initialises the FillEvent object. Sets the symbol, exchange, quantity, direction, cost of fill and an optional commission.
@@ -100,7 +159,6 @@ class FillEvent(Event):
         fill_cost - The holdings value in dollars.
         commission - An optional commission sent from IB.
         """
-        self.type = 'FILL'
         self.timeindex = timeindex
         self.symbol = symbol
         self.exchange = exchange
@@ -127,3 +185,95 @@ class FillEvent(Event):
         else: # Greater than 500
             full_cost = max(1.3, 0.008 * self.quantity)
         return full_cost
+
+class CancelEvent(Event):
+    """
+    Reports that the unfilled remainder of an order has left the market: cancelled, replaced, expired or rejected.
+    The portfolio stops counting the quantity as queued.
+    """
+    __slots__ = ('timeindex', 'symbol', 'quantity', 'direction', 'order_id', 'reason')
+    type = EventType.CANCEL
+
+    def __init__(self, timeindex, symbol, quantity, direction, order_id, reason='CANCELLED'):
+        """
+        Parameters:
+        timeindex - The bar on which the order left the market.
+        symbol - The instrument of the order.
+        quantity - The unfilled quantity withdrawn.
+        direction - The direction of the order ('BUY' or 'SELL').
+        order_id - The order_id of the order.
+        reason - 'CANCELLED', 'REPLACED', 'EXPIRED' or 'REJECTED' by a handler that cannot execute the order type.
+        """
+        self.timeindex = timeindex
+        self.symbol = symbol
+        self.quantity = quantity
+        self.direction = direction
+        self.order_id = order_id
+        self.reason = reason
+
+
+class EventBus(object):
+    """
+    Single-threaded event queue for backtests, replacing queue.Queue where no other thread produces events.
+    Events are kept in a deque and dispatched through a table of handlers indexed by EventType, so there is no lock,
+    no queue.Empty exception per bar and no string comparison per event.
+    Components keep calling put(), handlers are registered with register().
+    """
+    def __init__(self):
+        self.queue = deque()
+        # Bound once, put() is then a plain deque.append
+        self.put = self.queue.append
+        self.handlers = [[] for _ in EventType]
+        self.counts = [0] * len(EventType)
+
+    def register(self, event_type, handler):
+        """
+        Appends handler to the handlers of event_type. Handlers of one type are called in registration order.
+
+        Parameters:
+        event_type - An EventType.
+        handler - Callable taking the event.
+        """
+        self.handlers[event_type].append(handler)
+
+    def handle(self, event):
+        """
+        Calls the registered handlers of a single event.
+        """
+        self.counts[event.type] += 1
+        for handler in self.handlers[event.type]:
+            handler(event)
+
+    def dispatch(self):
+        """
+        Dispatches events until the queue is empty, including the events put by the handlers themselves.
+        Returns the number of dispatched events.
+        """
+        events = self.queue
+        popleft = events.popleft
+        handlers = self.handlers
+        counts = self.counts
+        n = 0
+        while events:
+            event = popleft()
+            event_type = event.type
+            counts[event_type] += 1
+            for handler in handlers[event_type]:
+                handler(event)
+            n += 1
+        return n
+
+    def get(self, block=False):
+        """
+        Pops the next event, for code written against queue.Queue.get(False).
+        """
+        try:
+            return self.queue.popleft()
+        except IndexError:
+            raise queue.Empty
+
+    def empty(self):
+        return not self.queue
+
+    def qsize(self):
+        return len(self.queue)
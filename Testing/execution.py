@@ -1,11 +1,14 @@
 from abc import ABCMeta, abstractmethod
 import datetime
+import heapq
 try:
     import Queue as queue
 except ImportError:
     import queue
 
-from event import FillEvent, OrderEvent
+import numpy as np
+
+from event import CancelEvent, EventType, FillEvent, OrderEvent
 
 class ExecutionHandler(object):
     """
@@ -24,10 +27,18 @@ class ExecutionHandler(object):
         """
         raise NotImplementedError("Abstract Method supports no implement.")
 
+    def _reject(self, order):
+        """
+        Turns down an order the handler cannot execute with a CancelEvent, so the portfolio stops counting it as queued.
+        """
+        self.events.put(CancelEvent(timeindex=order.timeindex, symbol=order.symbol, quantity=order.quantity,
+                                    direction=order.direction, order_id=order.order_id, reason='REJECTED'))
+
 class SimulatedExecutionHandler(ExecutionHandler):
     """
     The simulated execution handler simply converts all order objects into their equivalent fill objects automatically without latency, slippage or fill-ratio issues.
     This allows a straightforward "first go" test of any strategy, before implementation with a more sophisticated execution handler.
+    Only market orders are filled: limit orders are rejected with a CancelEvent and cancel orders are ignored, nothing rests here.
     """
     def __init__(self, events):
         """
@@ -45,6 +56,420 @@ class SimulatedExecutionHandler(ExecutionHandler):
         Parameters:
         event - Contains an Event object with order information.
         """
-        if event.type == 'ORDER':
+        if event.type != EventType.ORDER or event.order_type == 'CXL':
+            return
+        if event.order_type == 'LMT':
+            self._reject(event)
+        else:
             fill_event = FillEvent( timeindex=datetime.datetime.utcnow(), symbol=event.symbol, exchange='ARCA', quantity=event.quantity, direction=event.direction, fill_cost=None, commission=None)
-            self.events.put(fill_event)       
\ No newline at end of file
+            self.events.put(fill_event)
+
+
+class RealisticExecutionHandler(ExecutionHandler):
+    """
+    Fills market orders against the bar they are sent on, within what the A-share market allows:
+    - the price is adj_close moved against the order by slippage plus impact times the share of the bar volume taken, kept within the adjusted low and high,
+    - at most participation of the bar volume is filled per symbol and bar, the rest is carried forward and filled first on the following bars,
+    - nothing is filled on a suspended bar, buys are not filled on a bar closing limit-up and sells not on a bar closing limit-down,
+    - a remainder still unfilled max_carry_bars bars after the order was sent is cancelled with a CancelEvent, so the portfolio stops counting it.
+    The limits of all symbols are computed once per bar with a few vector operations, an order then costs a handful of list lookups.
+    Only market orders are filled: limit orders are rejected with a CancelEvent, a cancel order withdraws the carried remainder of its order_id.
+    Requires a BarDataHandler, whose store provides the traded mask of suspended bars.
+    """
+    # Backtest passes the data handler as second argument
+    requires_bars = True
+
+    def __init__(self, events, bars, slippage=0.0005, impact=0.1, participation=0.1, limit=0.1, limit_tolerance=0.001, max_carry_bars=20):
+        """
+        Initialises the handler.
+
+        Parameters:
+        events - The Queue of Event objects.
+        bars - The BarDataHandler providing the bars.
+        slippage - Price fraction paid on every fill, e.g. 0.0005 for 5 basis points.
+        impact - Additional price fraction per unit of participation, e.g. taking 10% of the bar volume with impact 0.1 costs 1% more.
+        participation - Maximum fraction of the bar volume filled per symbol and bar, None for no limit.
+        limit - Daily price limit as a return, 0.1 on the main board, 0.05 for ST and 0.2 on ChiNext and STAR. None disables it.
+        limit_tolerance - A bar whose return is within this distance of the limit counts as closing at the limit.
+        max_carry_bars - Bars a remainder is carried forward before it expires, None to carry it until it is filled.
+        """
+        self.events = events
+        self.bars = bars
+        self.store = bars.bar_store
+        self.symbol_index = self.store.symbol_index
+        self.slippage = slippage
+        self.impact = impact
+        self.participation = participation
+        self.limit = limit
+        self.limit_tolerance = limit_tolerance
+        self.max_carry_bars = max_carry_bars
+        # Orders not completely filled, as [order, remaining quantity, last bar to fill on], oldest first
+        self.pending = []
+        self.row = None
+        self.datetime = None
+
+    def on_market(self, event):
+        """
+        Computes the limits of the new bar for the whole universe and fills the orders carried forward from earlier bars.
+        """
+        if event.type != EventType.MARKET:
+            return
+        row = self.store.cursor
+        # The replayed last bar gets no new volume
+        if row == self.row or row < 0:
+            return
+        self.row = row
+        self.datetime = self.store.latest_datetime()
+        fields = self.store.fields
+        adj_factor = fields['adj_factor'][row]
+        self.price = fields['adj_close'][row].tolist()
+        self.low = (fields['low_price'][row] * adj_factor).tolist()
+        self.high = (fields['high_price'][row] * adj_factor).tolist()
+        if 'traded' in fields:
+            traded = fields['traded'][row] > 0.0
+        else:
+            traded = fields['volume'][row] > 0.0
+        # Shares of the bar volume in the adjusted units of the portfolio
+        volume = np.where(traded, fields['volume'][row] / adj_factor, 0.0)
+        self.volume = volume.tolist()
+        if self.participation is None:
+            capacity = np.where(traded, np.inf, 0.0)
+        else:
+            capacity = self.participation * volume
+        self.capacity = capacity.tolist()
+        can_buy = traded.copy()
+        can_sell = traded.copy()
+        if self.limit is not None and row > 0:
+            returns = fields['returns'][row]
+            can_buy &= ~(returns >= self.limit - self.limit_tolerance)
+            can_sell &= ~(returns <= -self.limit + self.limit_tolerance)
+        self.can_buy = can_buy.tolist()
+        self.can_sell = can_sell.tolist()
+
+        pending, self.pending = self.pending, []
+        for order, remaining, deadline in pending:
+            if deadline is not None and row > deadline:
+                self.events.put(CancelEvent(timeindex=self.datetime, symbol=order.symbol, quantity=remaining,
+                                            direction=order.direction, order_id=order.order_id, reason='EXPIRED'))
+            else:
+                self._fill(order, remaining, deadline)
+
+    def _fill(self, order, quantity, deadline=None):
+        """
+        Fills as much of quantity as the current bar allows and carries the rest forward, until the bar deadline.
+        """
+        if deadline is None and self.max_carry_bars is not None:
+            deadline = (self.row or 0) + self.max_carry_bars
+        col = self.symbol_index[order.symbol]
+        buy = order.direction == 'BUY'
+        if (buy and not self.can_buy[col]) or (not buy and not self.can_sell[col]):
+            self.pending.append([order, quantity, deadline])
+            return
+        filled = min(quantity, self.capacity[col])
+        if filled < quantity:
+            self.pending.append([order, quantity - filled, deadline])
+        if filled <= 0.0:
+            return
+        self.capacity[col] -= filled
+        move = self.slippage
+        if self.impact and self.volume[col] > 0.0:
+            move += self.impact * filled / self.volume[col]
+        if buy:
+            price = min(self.price[col] * (1.0 + move), self.high[col])
+        else:
+            price = max(self.price[col] * (1.0 - move), self.low[col])
+        self.events.put(FillEvent(timeindex=self.datetime, symbol=order.symbol, exchange='SSE/SZSE', quantity=filled,
+                                  direction=order.direction, fill_cost=price * filled, commission=None))
+
+    def execute_order(self, event):
+        """
+        Fills the order within the limits of the current bar, the orders carried forward have been served first.
+
+        Parameters:
+        event - Contains an Event object with order information.
+        """
+        if event.type != EventType.ORDER:
+            return
+        if event.order_type == 'CXL':
+            self.cancel(event.order_id)
+        elif event.order_type == 'LMT':
+            self._reject(event)
+        else:
+            self._fill(event, event.quantity)
+
+    def cancel(self, order_id):
+        """
+        Withdraws the carried remainder of the order order_id and reports it with a CancelEvent.
+
+        Returns:
+        bool - False if no remainder of such an order is carried.
+        """
+        for i, (order, remaining, _) in enumerate(self.pending):
+            if order_id is not None and order.order_id == order_id:
+                del self.pending[i]
+                self.events.put(CancelEvent(timeindex=self.datetime, symbol=order.symbol, quantity=remaining,
+                                            direction=order.direction, order_id=order_id, reason='CANCELLED'))
+                return True
+        return False
+
+
+class _RestingOrder(object):
+    """
+    A limit order in the book. Withdrawing or filling it clears active, its heap entries are dropped lazily.
+    expires is the last bar it is matched on, None for an order without time limit or once it has left the expiry heap.
+    """
+    __slots__ = ('order', 'col', 'remaining', 'expires', 'active')
+
+    def __init__(self, order, col, expires):
+        self.order = order
+        self.col = col
+        self.remaining = order.quantity
+        self.expires = expires
+        self.active = True
+
+
+def _compact(heap):
+    """
+    Rebuilds a heap of (key, sequence, entry) from its active entries in place.
+    """
+    heap[:] = [item for item in heap if item[2].active]
+    heapq.heapify(heap)
+
+
+class LimitOrderExecutionHandler(ExecutionHandler):
+    """
+    Keeps limit orders ('LMT') resting in a book per symbol and side and matches them against the following bars:
+    - a buy is filled on the first bar whose adjusted low reaches its limit price, a sell on the first bar whose adjusted high does,
+      at the limit price, or at the adjusted open if the bar opens through the limit,
+    - orders of one symbol and side are matched best price first, then in the order they were sent,
+    - nothing is filled on a suspended bar, market orders ('MKT') are filled at once as by SimulatedExecutionHandler,
+    - a cancel order ('CXL') or a limit order reusing the order_id of a resting order withdraws it, as do cancel() and replace(),
+    - 'DAY' orders expire after the next bar and orders with an integer time_in_force after that many bars.
+    Withdrawn and expired remainders are reported with a CancelEvent.
+    The books are binary heaps keyed on the price. A withdrawn order stays in its heap as a dead entry until it reaches the top,
+    or until the dead entries of the heap outnumber the live ones and the heap is rebuilt from its live entries.
+    A heap thus never holds more than twice the resting orders, and sending, cancelling or filling an order costs amortised
+    O(log n) for n resting orders of the symbol. The best price of every book is also kept in a vector,
+    so a bar selects the symbols with something to match in one vector comparison.
+    Requires a BarDataHandler, whose store provides the open, high and low of the whole universe.
+    """
+    # Backtest passes the data handler as second argument
+    requires_bars = True
+
+    def __init__(self, events, bars):
+        """
+        Initialises the handler.
+
+        Parameters:
+        events - The Queue of Event objects.
+        bars - The BarDataHandler providing the bars.
+        """
+        self.events = events
+        self.bars = bars
+        self.store = bars.bar_store
+        self.symbol_index = self.store.symbol_index
+        n = len(self.store.symbol_list)
+        # Heaps of (-limit_price, sequence, order) for buys and (limit_price, sequence, order) for sells, with their dead entry counts
+        self.bids = [[] for _ in range(n)]
+        self.asks = [[] for _ in range(n)]
+        self.dead_bids = [0] * n
+        self.dead_asks = [0] * n
+        self.best_bid = np.full(n, -np.inf)
+        self.best_ask = np.full(n, np.inf)
+        # Resting orders by order_id and a heap of (expiry row, sequence, order)
+        self.resting = {}
+        self.expiry = []
+        self.dead_expiry = 0
+        self.sequence = 0
+        self.next_id = 0
+        self.row = None
+        self.datetime = None
+
+    def _push(self, order):
+        """
+        Puts a limit order into the book of its symbol, it is matched from the next bar on.
+        """
+        if order.order_id is None:
+            self.next_id += 1
+            order.order_id = self.next_id
+        elif order.order_id in self.resting:
+            self.cancel(order.order_id, reason='REPLACED')
+        tif = order.time_in_force
+        if tif == 'GTC' or tif is None:
+            expires = None
+        else:
+            bars = 1 if tif == 'DAY' else int(tif)
+            if bars < 1:
+                raise ValueError("time_in_force of order %s must be 'GTC', 'DAY' or at least 1 bar, got %s" % (order.order_id, tif))
+            # Sent after bar row, the order is matched against rows row + 1 .. row + bars
+            expires = self.store.cursor + bars
+        entry = _RestingOrder(order, self.symbol_index[order.symbol], expires)
+        self.sequence += 1
+        self._add(entry)
+        self.resting[order.order_id] = entry
+
+    def _add(self, entry):
+        col = entry.col
+        price = float(entry.order.limit_price)
+        if entry.order.direction == 'BUY':
+            heapq.heappush(self.bids[col], (-price, self.sequence, entry))
+            if price > self.best_bid[col]:
+                self.best_bid[col] = price
+        else:
+            heapq.heappush(self.asks[col], (price, self.sequence, entry))
+            if price < self.best_ask[col]:
+                self.best_ask[col] = price
+        if entry.expires is not None:
+            heapq.heappush(self.expiry, (entry.expires, self.sequence, entry))
+
+    def _retire(self, entry, in_book=True):
+        """
+        Marks an order as no longer resting and counts it as dead in the heaps still holding it,
+        rebuilding a heap once its dead entries outnumber the live ones.
+
+        Parameters:
+        in_book - False if the entry has already been popped from its book.
+        """
+        entry.active = False
+        if in_book:
+            col = entry.col
+            if entry.order.direction == 'BUY':
+                self.dead_bids[col] += 1
+                if 2 * self.dead_bids[col] > len(self.bids[col]):
+                    _compact(self.bids[col])
+                    self.dead_bids[col] = 0
+                    self.best_bid[col] = -self.bids[col][0][0] if self.bids[col] else -np.inf
+            else:
+                self.dead_asks[col] += 1
+                if 2 * self.dead_asks[col] > len(self.asks[col]):
+                    _compact(self.asks[col])
+                    self.dead_asks[col] = 0
+                    self.best_ask[col] = self.asks[col][0][0] if self.asks[col] else np.inf
+        if entry.expires is not None:
+            self.dead_expiry += 1
+            if 2 * self.dead_expiry > len(self.expiry):
+                _compact(self.expiry)
+                self.dead_expiry = 0
+
+    def cancel(self, order_id, reason='CANCELLED'):
+        """
+        Withdraws the resting order order_id and reports its remainder with a CancelEvent.
+
+        Returns:
+        bool - False if no such order is resting, e.g. because it has been filled.
+        """
+        entry = self.resting.pop(order_id, None)
+        if entry is None:
+            return False
+        self._retire(entry)
+        order = entry.order
+        self.events.put(CancelEvent(timeindex=self.datetime, symbol=order.symbol, quantity=entry.remaining,
+                                    direction=order.direction, order_id=order_id, reason=reason))
+        return True
+
+    def replace(self, order_id, limit_price=None, quantity=None):
+        """
+        Replaces the resting order order_id by one with a new limit price and/or quantity, which loses its time priority.
+        The new order is sent through the events queue, so the portfolio counts it as queued.
+
+        Returns:
+        bool - False if no such order is resting.
+        """
+        entry = self.resting.get(order_id)
+        if entry is None:
+            return False
+        order = entry.order
+        self.events.put(OrderEvent(
+            timeindex=self.datetime or order.timeindex, symbol=order.symbol, order_type='LMT',
+            quantity=entry.remaining if quantity is None else quantity, direction=order.direction,
+            limit_price=order.limit_price if limit_price is None else limit_price, time_in_force=order.time_in_force, order_id=order_id
+        ))
+        return True
+
+    def _top(self, book, dead, col):
+        """
+        Drops the dead entries from the top of a heap and returns the best entry, or None.
+        """
+        while book and not book[0][2].active:
+            heapq.heappop(book)
+            dead[col] -= 1
+        return book[0] if book else None
+
+    def _fill(self, entry, price):
+        order = entry.order
+        del self.resting[order.order_id]
+        self._retire(entry, in_book=False)
+        self.events.put(FillEvent(timeindex=self.datetime, symbol=order.symbol, exchange='ARCA', quantity=entry.remaining,
+                                  direction=order.direction, fill_cost=price * entry.remaining, commission=None))
+
+    def _expire(self, row):
+        """
+        Cancels the orders whose last bar is row or earlier.
+        """
+        expiry = self.expiry
+        while expiry and expiry[0][0] <= row:
+            entry = heapq.heappop(expiry)[2]
+            if entry.active:
+                # Popped already, so _retire() does not count it as dead in the expiry heap
+                entry.expires = None
+                self.cancel(entry.order.order_id, reason='EXPIRED')
+            else:
+                self.dead_expiry -= 1
+
+    def on_market(self, event):
+        """
+        Matches the books against the new bar and expires the orders whose time in force is over.
+        """
+        if event.type != EventType.MARKET:
+            return
+        row = self.store.cursor
+        # The replayed last bar is not matched twice
+        if row == self.row or row < 0:
+            return
+        self.row = row
+        self.datetime = self.store.latest_datetime()
+        fields = self.store.fields
+        adj_factor = fields['adj_factor'][row]
+        low = fields['low_price'][row] * adj_factor
+        high = fields['high_price'][row] * adj_factor
+        if 'traded' in fields:
+            traded = fields['traded'][row] > 0.0
+        else:
+            traded = fields['volume'][row] > 0.0
+        # NaN prices compare False, so a symbol without a bar is never selected
+        candidates = np.flatnonzero(traded & ((self.best_bid >= low) | (self.best_ask <= high)))
+        if len(candidates):
+            open_ = (fields['open_price'][row] * adj_factor)[candidates].tolist()
+            for col, bar_open, bar_low, bar_high in zip(candidates.tolist(), open_, low[candidates].tolist(), high[candidates].tolist()):
+                bids = self.bids[col]
+                top = self._top(bids, self.dead_bids, col)
+                while top is not None and -top[0] >= bar_low:
+                    heapq.heappop(bids)
+                    self._fill(top[2], min(-top[0], bar_open))
+                    top = self._top(bids, self.dead_bids, col)
+                self.best_bid[col] = -np.inf if top is None else -top[0]
+                asks = self.asks[col]
+                top = self._top(asks, self.dead_asks, col)
+                while top is not None and top[0] <= bar_high:
+                    heapq.heappop(asks)
+                    self._fill(top[2], max(top[0], bar_open))
+                    top = self._top(asks, self.dead_asks, col)
+                self.best_ask[col] = np.inf if top is None else top[0]
+        self._expire(row)
+
+    def execute_order(self, event):
+        """
+        Fills a market order at once, puts a limit order into the book and withdraws the order of a cancel.
+
+        Parameters:
+        event - Contains an Event object with order information.
+        """
+        if event.type != EventType.ORDER:
+            return
+        if event.order_type == 'LMT':
+            self._push(event)
+        elif event.order_type == 'CXL':
+            self.cancel(event.order_id)
+        else:
+            self.events.put(FillEvent(timeindex=self.datetime, symbol=event.symbol, exchange='ARCA', quantity=event.quantity,
+                                      direction=event.direction, fill_cost=None, commission=None))
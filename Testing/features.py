@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Bump whenever the features or the file layout change, so old caches get rebuilt
+FEATURE_VERSION = 2
+
+
+class FeatureMatrix(object):
+    """
+    The design matrix of a whole universe: one row per (bar, symbol) with complete features, ordered by bar and then by symbol,
+    so that a time-ordered split such as sklearn's TimeSeriesSplit never trains on a later bar than it tests.
+
+    X - float32 array (rows, features), the columns are named in columns.
+    y - int8 array, the Direction label (+1 or -1) of every row.
+    returns - float32 array, the Today return of every row in percent.
+    datetimes - datetime64 array, the bar of every row.
+    symbols - int array, the position of the symbol of every row in symbol_list.
+    """
+    def __init__(self, X, y, returns, datetimes, symbols, symbol_list, columns):
+        self.X = X
+        self.y = y
+        self.returns = returns
+        self.datetimes = datetimes
+        self.symbols = symbols
+        self.symbol_list = list(symbol_list)
+        self.columns = list(columns)
+
+    def __len__(self):
+        return len(self.X)
+
+    def to_frame(self):
+        """
+        Returns the rows as a DataFrame indexed on (datetime, symbol), with the columns of create_lagged_series() and the extra features.
+        """
+        index = pd.MultiIndex.from_arrays([self.datetimes, np.asarray(self.symbol_list)[self.symbols]], names=['datetime', 'symbol'])
+        frame = pd.DataFrame(self.X, index=index, columns=self.columns)
+        frame.insert(1, 'Today', self.returns)
+        frame['Direction'] = self.y
+        return frame
+
+    def save(self, path):
+        np.savez(path, X=self.X, y=self.y, returns=self.returns, datetimes=self.datetimes, symbols=self.symbols,
+                 symbol_list=np.array(self.symbol_list), columns=np.array(self.columns))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['X'], data['y'], data['returns'], data['datetimes'], data['symbols'], list(data['symbol_list']), list(data['columns']))
+
+
+def build_features(store, lags=5, volume_window=20, startdate=None):
+    """
+    Builds the features of create_lagged_series() for every symbol of store in one pass over the aligned matrices:
+    Volume, Lag1..LagN (percentage returns of the prior bars), the volume change in percent and the volume relative to its volume_window mean,
+    with the Today return and its Direction as labels. A Today return below 0.0001% is set to 0.0001, as in create_lagged_series().
+    As create_lagged_series() on the rows of a symbol, only the traded bars count: suspended and missing bars give no row,
+    and the returns, lags and volume windows skip them. The traded bars of every symbol are packed to the top of its column,
+    the lags are then strided views of the packed return matrix, nothing is computed per symbol or per lag.
+    Rows with a missing value, e.g. during the warm-up, are dropped.
+
+    Parameters:
+    store - The BarStore of the universe.
+    lags - Number of lagged returns.
+    volume_window - Lookback of the relative volume.
+    startdate - Optional datetime, earlier rows are dropped but still serve as lags.
+
+    Returns:
+    FeatureMatrix
+    """
+    if 'traded' in store.fields:
+        traded = store.fields['traded'] > 0.0
+    else:
+        traded = ~np.isnan(store.fields['adj_close']) & (store.fields['volume'] != 0.0)
+    # Row k of column j of the packed matrices is the k-th traded bar of symbol j, the padding below is NaN
+    position = np.cumsum(traded, axis=0) - 1
+    bar_rows, symbol_cols = np.nonzero(traded)
+    slots = (position[bar_rows, symbol_cols], symbol_cols)
+    n_symbols = traded.shape[1]
+    n_bars = int(traded.sum(axis=0).max()) if n_symbols else 0
+    if n_bars <= lags + 1:
+        raise ValueError("%d bars are not enough for %d lags" % (n_bars, lags))
+    close = np.full((n_bars, n_symbols), np.nan)
+    close[slots] = store.fields['adj_close'][bar_rows, symbol_cols]
+    volume = np.full((n_bars, n_symbols), np.nan)
+    volume[slots] = store.fields['volume'][bar_rows, symbol_cols]
+    bar_of = np.full((n_bars, n_symbols), -1, dtype=np.int64)
+    bar_of[slots] = bar_rows
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = (close[1:] / close[:-1] - 1.0) * 100.0
+        volume_change = (volume[1:] / volume[:-1] - 1.0) * 100.0
+        # Rolling sums as differences of cumulative sums, a window is complete once it holds volume_window prices
+        total = np.cumsum(np.nan_to_num(volume), axis=0)
+        count = np.cumsum(~np.isnan(volume), axis=0)
+        padding = np.zeros((volume_window, n_symbols))
+        window_sum = total - np.vstack([padding, total[:-volume_window]])
+        window_count = count - np.vstack([padding, count[:-volume_window]])
+        relative_volume = np.where(window_count == volume_window, volume / (window_sum / volume_window), np.nan)
+
+    # windows[i, :, k] is the return of bar i + 1 + k, the last one being Today of bar i + 1 + lags
+    windows = sliding_window_view(returns, lags + 1, axis=0)
+    first = lags + 1
+    columns = ['Volume'] + ['Lag%d' % (k + 1) for k in range(lags)] + ['VolumeChange', 'RelativeVolume']
+    X = np.empty((n_bars - first, n_symbols, len(columns)), dtype=np.float32)
+    X[:, :, 0] = volume[first:]
+    X[:, :, 1:lags + 1] = windows[:, :, lags - 1::-1] if lags > 0 else windows[:, :, :0]
+    X[:, :, lags + 1] = volume_change[first - 1:]
+    X[:, :, lags + 2] = relative_volume[first:]
+    today = windows[:, :, lags].copy()
+    today[np.abs(today) < 0.0001] = 0.0001
+
+    valid = ~(np.isnan(X).any(axis=2) | np.isnan(today) | np.isinf(X).any(axis=2))
+    bar = bar_of[first:]
+    if startdate is not None:
+        valid &= store.datetimes[bar] >= np.datetime64(pd.Timestamp(startdate))
+    # Back from the packed rows to the bar and then symbol order of the store
+    rows, symbol = np.nonzero(valid)
+    bar = bar[rows, symbol]
+    order = np.lexsort((symbol, bar))
+    rows, symbol, bar = rows[order], symbol[order], bar[order]
+    today = today[rows, symbol]
+    return FeatureMatrix(
+        X[rows, symbol], np.sign(today).astype(np.int8), today.astype(np.float32), store.datetimes[bar],
+        symbol, store.symbol_list, columns
+    )
+
+
+def feature_cache_key(store, lags, volume_window, startdate):
+    """
+    Hashes the parameters, the universe, the bar index and the price and volume matrices, so any change of the data gives a new key.
+    """
+    digest = hashlib.sha1()
+    digest.update(json.dumps([FEATURE_VERSION, lags, volume_window, str(startdate), store.symbol_list]).encode('utf-8'))
+    digest.update(np.ascontiguousarray(store.datetimes).tobytes())
+    for field in ('adj_close', 'volume'):
+        digest.update(np.ascontiguousarray(store.fields[field]).tobytes())
+    return digest.hexdigest()[:24]
+
+
+def load_features(store, cache_dir, lags=5, volume_window=20, startdate=None):
+    """
+    Returns the FeatureMatrix of build_features(), read from the .npz cache in cache_dir if it has been built from the same data and parameters.
+    The file is written under a temporary name and renamed, so concurrent readers never see a partial cache.
+    """
+    path = os.path.join(cache_dir, 'features-%s.npz' % feature_cache_key(store, lags, volume_window, startdate))
+    if os.path.exists(path):
+        return FeatureMatrix.load(path)
+    features = build_features(store, lags, volume_window, startdate)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=cache_dir)
+    with os.fdopen(fd, 'wb') as f:
+        features.save(f)
+    os.replace(tmp_path, path)
+    return features
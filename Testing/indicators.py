@@ -0,0 +1,283 @@
+from abc import ABCMeta, abstractmethod
+
+import numpy as np
+
+
+class Indicator(object):
+    """
+    Indicator is an abstract base class for streaming indicators over a whole universe.
+    update() takes the newest value of every symbol as a vector and costs O(1) per symbol and bar, independent of the window.
+    The result is NaN for a symbol until its window is filled, or while the window holds a missing (NaN) value.
+    """
+    __metaclass__ = ABCMeta
+
+    def __init__(self, n_symbols, window):
+        """
+        Parameters:
+        n_symbols - Number of symbols, the length of every input and output vector.
+        window - Lookback in bars.
+        """
+        if window < 1:
+            raise ValueError("window must be at least 1, got %s" % window)
+        self.n_symbols = n_symbols
+        self.window = window
+        self.count = 0
+        self.value = np.full(n_symbols, np.nan)
+
+    @abstractmethod
+    def update(self, values):
+        """
+        Adds the newest bar and returns the current indicator vector, also kept in self.value.
+        """
+        raise NotImplementedError("Should implement update()")
+
+    @property
+    def ready(self):
+        """
+        True once window bars have been seen.
+        """
+        return self.count >= self.window
+
+
+class RingBuffer(object):
+    """
+    Holds the last window vectors in a preallocated (window x n_symbols) array. Empty slots are NaN.
+    """
+    def __init__(self, window, n_symbols):
+        self.values = np.full((window, n_symbols), np.nan)
+        self.window = window
+        self.pos = 0
+
+    def push(self, values):
+        """
+        Stores values in place of the oldest row and returns that evicted row.
+        """
+        old = self.values[self.pos].copy()
+        self.values[self.pos] = values
+        self.pos = (self.pos + 1) % self.window
+        return old
+
+
+class SMA(Indicator):
+    """
+    Simple moving average, kept as a running sum over a ring buffer.
+    The running sum is recomputed from the buffer every resync bars, so rounding errors cannot accumulate over long runs.
+    """
+    def __init__(self, n_symbols, window, resync=None):
+        """
+        Parameters:
+        resync - Bars between two exact recomputations of the sums, defaults to 100 windows.
+        """
+        Indicator.__init__(self, n_symbols, window)
+        self.buffer = RingBuffer(window, n_symbols)
+        self.resync = resync or 100 * window
+        self.sum = np.zeros(n_symbols)
+        # The empty slots of the buffer count as missing values
+        self.missing = np.full(n_symbols, window)
+
+    def _push(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        old = self.buffer.push(values)
+        self.count += 1
+        new_nan = np.isnan(values)
+        old_nan = np.isnan(old)
+        self.missing += new_nan.astype(np.int64) - old_nan
+        if self.count % self.resync == 0:
+            self._resync()
+        else:
+            self._add(np.where(new_nan, 0.0, values), np.where(old_nan, 0.0, old))
+        return values
+
+    def _add(self, new, old):
+        self.sum += new - old
+
+    def _resync(self):
+        self.sum = np.nansum(self.buffer.values, axis=0)
+
+    def update(self, values):
+        self._push(values)
+        self.value = np.where(self.missing == 0, self.sum / self.window, np.nan)
+        return self.value
+
+
+class RollingStd(SMA):
+    """
+    Rolling standard deviation from running sums of the values and of their squares, also exposing the rolling mean.
+    """
+    def __init__(self, n_symbols, window, ddof=0, resync=None):
+        """
+        Parameters:
+        ddof - Delta degrees of freedom, 0 for the population standard deviation as in create_sharpe_ratio().
+        """
+        SMA.__init__(self, n_symbols, window, resync)
+        self.ddof = ddof
+        self.sum_sq = np.zeros(n_symbols)
+        self.mean = np.full(n_symbols, np.nan)
+
+    def _add(self, new, old):
+        self.sum += new - old
+        self.sum_sq += new * new - old * old
+
+    def _resync(self):
+        self.sum = np.nansum(self.buffer.values, axis=0)
+        self.sum_sq = np.nansum(self.buffer.values ** 2, axis=0)
+
+    def update(self, values):
+        self._push(values)
+        valid = self.missing == 0
+        self.mean = np.where(valid, self.sum / self.window, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = (self.sum_sq - self.sum * self.mean) / (self.window - self.ddof)
+        # Cancellation can leave a tiny negative variance for constant prices
+        self.value = np.where(valid, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+        return self.value
+
+
+class BollingerBands(RollingStd):
+    """
+    Rolling mean plus and minus k rolling standard deviations. update() returns the middle band, upper and lower are attributes.
+    """
+    def __init__(self, n_symbols, window=20, k=2.0, ddof=0, resync=None):
+        RollingStd.__init__(self, n_symbols, window, ddof, resync)
+        self.k = k
+        self.upper = np.full(n_symbols, np.nan)
+        self.lower = np.full(n_symbols, np.nan)
+
+    def update(self, values):
+        std = RollingStd.update(self, values)
+        self.upper = self.mean + self.k * std
+        self.lower = self.mean - self.k * std
+        self.value = self.mean
+        return self.value
+
+
+class EMA(Indicator):
+    """
+    Exponential moving average with alpha = 2 / (window + 1), seeded with the first value of every symbol.
+    A missing value leaves the average of its symbol unchanged.
+    """
+    def __init__(self, n_symbols, window, alpha=None):
+        """
+        Parameters:
+        alpha - Smoothing factor, overrides the one derived from window.
+        """
+        Indicator.__init__(self, n_symbols, window)
+        self.alpha = 2.0 / (window + 1.0) if alpha is None else alpha
+        self.average = np.full(n_symbols, np.nan)
+        self.seen = np.zeros(n_symbols, dtype=np.int64)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.count += 1
+        valid = ~np.isnan(values)
+        self.seen += valid
+        seed = valid & np.isnan(self.average)
+        self.average = np.where(seed, values, self.average)
+        step = valid & ~seed
+        self.average = np.where(step, self.average + self.alpha * (values - self.average), self.average)
+        self.value = np.where(self.seen >= self.window, self.average, np.nan)
+        return self.value
+
+
+class _WilderAverage(object):
+    """
+    Wilder's smoothing: the mean of the first window values, then avg += (value - avg) / window.
+    """
+    def __init__(self, n_symbols, window):
+        self.window = window
+        self.seen = np.zeros(n_symbols, dtype=np.int64)
+        self.sum = np.zeros(n_symbols)
+        self.average = np.full(n_symbols, np.nan)
+
+    def update(self, values):
+        valid = ~np.isnan(values)
+        warming = valid & (self.seen < self.window)
+        self.sum = np.where(warming, self.sum + values, self.sum)
+        smoothing = valid & (self.seen >= self.window)
+        self.average = np.where(smoothing, self.average + (values - self.average) / self.window, self.average)
+        self.seen += valid
+        self.average = np.where(warming & (self.seen == self.window), self.sum / self.window, self.average)
+        return self.average
+
+
+class RSI(Indicator):
+    """
+    Relative strength index with Wilder's smoothing of the gains and losses between consecutive values.
+    """
+    def __init__(self, n_symbols, window=14):
+        Indicator.__init__(self, n_symbols, window)
+        self.previous = np.full(n_symbols, np.nan)
+        self.gains = _WilderAverage(n_symbols, window)
+        self.losses = _WilderAverage(n_symbols, window)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.count += 1
+        change = values - self.previous
+        self.previous = np.where(np.isnan(values), self.previous, values)
+        gain = self.gains.update(np.where(np.isnan(change), np.nan, np.maximum(change, 0.0)))
+        loss = self.losses.update(np.where(np.isnan(change), np.nan, np.maximum(-change, 0.0)))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsi = 100.0 - 100.0 / (1.0 + gain / loss)
+        # No losses at all is an RSI of 100, a flat window is undefined
+        self.value = np.where((loss == 0.0) & (gain > 0.0), 100.0, rsi)
+        return self.value
+
+
+class ATR(Indicator):
+    """
+    Average true range with Wilder's smoothing. update() takes the high, low and close vectors of the bar.
+    """
+    def __init__(self, n_symbols, window=14):
+        Indicator.__init__(self, n_symbols, window)
+        self.previous_close = np.full(n_symbols, np.nan)
+        self.average = _WilderAverage(n_symbols, window)
+
+    def update(self, high, low, close):
+        high = np.asarray(high, dtype=np.float64)
+        low = np.asarray(low, dtype=np.float64)
+        close = np.asarray(close, dtype=np.float64)
+        self.count += 1
+        # fmax ignores the missing previous close of the first bar, the true range is then high - low
+        true_range = np.fmax(high - low, np.fmax(np.abs(high - self.previous_close), np.abs(low - self.previous_close)))
+        true_range = np.where(np.isnan(high - low), np.nan, true_range)
+        self.previous_close = np.where(np.isnan(close), self.previous_close, close)
+        self.value = self.average.update(true_range).copy()
+        return self.value
+
+
+class RollingMax(Indicator):
+    """
+    Rolling maximum in O(1) amortised time per bar for all symbols at once.
+    The deque of a monotonic-queue implementation is replaced by the two-stack (van Herk/Gil-Werman) scheme, which vectorizes across symbols:
+    the bars are cut into blocks of window bars, the maximum is the larger of the running maximum of the current block
+    and the suffix maximum of the previous block, and the suffix maxima are computed once per block.
+    """
+    reduce = staticmethod(np.maximum)
+
+    def __init__(self, n_symbols, window):
+        Indicator.__init__(self, n_symbols, window)
+        self.block = np.full((window, n_symbols), np.nan)
+        self.suffix = np.full((window, n_symbols), np.nan)
+        self.running = None
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        k = self.count % self.window
+        self.count += 1
+        self.block[k] = values
+        self.running = values.copy() if k == 0 else self.reduce(self.running, values)
+        if k + 1 < self.window:
+            self.value = self.reduce(self.suffix[k + 1], self.running)
+        else:
+            self.value = self.running
+            # The block is complete: its suffix extrema serve the next window bars
+            self.suffix = self.reduce.accumulate(self.block[::-1], axis=0)[::-1]
+        return self.value
+
+
+class RollingMin(RollingMax):
+    """
+    Rolling minimum, see RollingMax.
+    """
+    reduce = staticmethod(np.minimum)
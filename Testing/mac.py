@@ -1,9 +1,9 @@
-from strategy import Strategy, MovingAverageCrossStrategy
-from event import SignalEvent
+from strategy import MovingAverageCrossStrategy
 from backtest import Backtest
-from data import SQLDataHandler
+from data import HistoricCSVDataHandler
 from execution import SimulatedExecutionHandler
 from portfolio import Portfolio
+from reporting import Reporter
 
 from datetime import datetime as dt
 
@@ -15,5 +15,7 @@ if __name__ == "__main__":
     start_date = dt(2010, 2,20, 0, 0, 0)
     end_date = dt.now()
     backtest = Backtest(csv_dir=csv_dir, symbol_list=symbol_list, initial_capital=initial_capital, heartbeat=heartbeat, startdate=start_date, enddate=end_date, data_handler=HistoricCSVDataHandler, execution_handler=SimulatedExecutionHandler, portfolio=Portfolio, strategy=MovingAverageCrossStrategy, window=[30,90])
-    backtest.simulate_trading(frequency=252)
+    reporter = Reporter(path='EquityCurve', csv=True, plot=True)
+    backtest.simulate_trading(frequency=252, report=reporter)
+    reporter.wait()
     
@@ -11,6 +11,35 @@ def create_sharpe_ratio(returns, periods=252):
     """
     return np.sqrt(periods) * (np.mean(returns) / np.std(returns))
 
+def drawdown_matrix(pnl):
+    """
+    Vectorized drawdown and drawdown duration of one or many PnL curves, without looping over the bars.
+    The high water mark is the running maximum of the curve from the second element on, starting at 0;
+    the duration is the run length since the last bar without drawdown. Element 0 of both is NaN, as is a duration before the first such bar.
+
+    Parameters:
+    pnl - 1d or 2d (bars x curves) array-like of equity curves.
+
+    Returns:
+    drawdown, duration - float ndarrays of the same shape as pnl.
+    """
+    pnl = np.asarray(pnl, dtype=np.float64)
+    curves = pnl.reshape(len(pnl), -1)
+    n = len(curves)
+    drawdown = np.full(curves.shape, np.nan)
+    duration = np.full(curves.shape, np.nan)
+    if n > 1:
+        # fmax skips NaN like the high water mark did, the leading 0 is the initial mark
+        hwm = np.fmax.accumulate(np.vstack([np.zeros((1, curves.shape[1])), curves[1:]]), axis=0)[1:]
+        drawdown[1:] = hwm - curves[1:]
+        # Run-length encoding: every bar without drawdown resets the duration
+        rows = np.arange(n, dtype=np.float64)[:, None]
+        resets = np.where(drawdown == 0, rows, np.nan)
+        resets[0] = np.nan
+        last_reset = np.fmax.accumulate(resets, axis=0)
+        duration[1:] = (rows - last_reset)[1:]
+    return drawdown.reshape(pnl.shape), duration.reshape(pnl.shape)
+
 def create_drawdowns(pnl):
     """
     Calculate the largest peak-to-trough drawdown of the PnL curve as well as the duration of the drawdown. Requires that the pnl_returns is a Pandas Series.
@@ -21,17 +50,169 @@ def create_drawdowns(pnl):
     Returns:
     drawdown, duration - Highest peak-to-trough drawdown and duration.
     """
-    # Calculate the cumulative returns curve and set up the High Water Mark
-    hwm = [0]
+    drawdown, duration = drawdown_matrix(pnl.values)
+    drawdown = pd.Series(drawdown, index = pnl.index)
+    return drawdown, drawdown.max(), pd.Series(duration).max()
+
+def create_sortino_ratio(returns, periods=252, target=0.0):
+    """
+    Create the Sortino ratio: like the Sharpe ratio, but only returns below target count as risk.
+
+    Parameters:
+    returns - A Pandas Series representing period percentage returns.
+    periods - Daily (252), Hourly (252*6.5), Minutely(252*6.5*60) etc.
+    target - Minimum acceptable return per period.
+    """
+    excess = np.asarray(returns, dtype=np.float64) - target
+    downside = np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2, axis=0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(periods) * (np.mean(excess, axis=0) / downside)
+
+def create_calmar_ratio(pnl, periods=252):
+    """
+    Create the Calmar ratio: the annualised return divided by the largest drawdown of create_drawdowns().
+    The drawdown is measured in units of the equity curve, as everywhere in this module.
+
+    Parameters:
+    pnl - A Pandas Series of the equity curve, starting at 1.0.
+    periods - Daily (252), Hourly (252*6.5), Minutely(252*6.5*60) etc.
+    """
+    pnl = np.asarray(pnl, dtype=np.float64)
+    drawdown, _ = drawdown_matrix(pnl)
+    annual_return = (pnl[-1] / pnl[0]) ** (float(periods) / (len(pnl) - 1)) - 1.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return annual_return / np.nanmax(drawdown, axis=0)
+
+def create_rolling_sharpe(returns, window, periods=252):
+    """
+    Create the Sharpe ratio over a rolling window of bars, with the population standard deviation as create_sharpe_ratio().
+
+    Parameters:
+    returns - A Pandas Series (or DataFrame of several runs) of period percentage returns.
+    window - Number of bars per window. The first window - 1 values are NaN.
+    """
+    rolling = returns.rolling(window, min_periods=window)
+    return np.sqrt(periods) * rolling.mean() / rolling.std(ddof=0)
+
+def create_turnover(positions, prices, total):
+    """
+    Create the turnover per bar: the absolute value traded, as a fraction of the portfolio total.
+
+    Parameters:
+    positions - A Pandas DataFrame of the position of every symbol (bars x symbols), e.g. Portfolio.positions_frame().
+    prices - The prices the trades are valued at, with the same shape.
+    total - A Pandas Series of the portfolio total.
+    """
+    traded = np.abs(np.diff(np.asarray(positions, dtype=np.float64), axis=0, prepend=0.0)) * np.asarray(prices, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.Series(np.nansum(traded, axis=1) / np.asarray(total, dtype=np.float64), index=getattr(total, 'index', None))
+
+def create_hit_rate(returns):
+    """
+    Create the hit rate: the share of bars with a non-zero return whose return is positive.
+
+    Parameters:
+    returns - A Pandas Series (or 2d array of several runs) of period percentage returns.
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sum(returns > 0.0, axis=0) / np.sum((returns != 0.0) & ~np.isnan(returns), axis=0)
+
+def performance_summary(curves, periods=252):
+    """
+    Computes the metrics of many equity curves at once, e.g. every run of a parameter sweep stacked as columns.
+    Returns are derived as in Portfolio.create_equity_curve_dataframe(), with a 0 return on the first bar.
+
+    Parameters:
+    curves - A Pandas DataFrame of equity curves or portfolio totals (bars x runs).
+    periods - Daily (252), Hourly (252*6.5), Minutely(252*6.5*60) etc.
+
+    Returns:
+    DataFrame - One row per run with total return, Sharpe, Sortino and Calmar ratio, max drawdown, drawdown duration and hit rate.
+    """
+    values = np.asarray(curves, dtype=np.float64)
+    returns = np.zeros(values.shape)
+    returns[1:] = values[1:] / values[:-1] - 1.0
+    pnl = np.cumprod(1.0 + returns, axis=0)
+    drawdown, duration = drawdown_matrix(pnl)
+    max_drawdown = np.nanmax(drawdown, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.sqrt(periods) * (np.mean(returns, axis=0) / np.std(returns, axis=0))
+        annual_return = pnl[-1] ** (float(periods) / (len(pnl) - 1)) - 1.0
+        calmar = annual_return / max_drawdown
+    return pd.DataFrame({
+        'total_return': pnl[-1] - 1.0, 'sharpe_ratio': sharpe, 'sortino_ratio': create_sortino_ratio(returns, periods),
+        'calmar_ratio': calmar, 'max_drawdown': max_drawdown, 'drawdown_duration': np.nanmax(duration, axis=0),
+        'hit_rate': create_hit_rate(returns),
+    }, index=getattr(curves, 'columns', None))
+
+class OnlineStats(object):
+    """
+    Incremental performance statistics of an equity curve, updated in O(1) per bar and readable at any point of the run.
+    Follows the end-of-run definitions: returns start with a 0 for the initial row, the Sharpe ratio uses the population
+    standard deviation, and drawdown is measured on the equity curve (1.0 = initial capital) from a high water mark starting at 0.
+    """
+    def __init__(self, initial_value):
+        """
+        Parameters:
+        initial_value - The starting portfolio value, i.e. the initial capital.
+        """
+        self.value = initial_value
+        self.count = 1
+        # Welford accumulators of the returns, the initial row has a return of 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.equity = 1.0
+        self.high_water_mark = 0.0
+        self.drawdown = 0.0
+        self.max_drawdown = 0.0
+        self.duration = np.nan
+        self.max_duration = np.nan
+
+    def update(self, value):
+        """
+        Adds the portfolio value of the next bar.
+        """
+        ret = value / self.value - 1.0
+        self.value = value
+        self.count += 1
+        delta = ret - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (ret - self.mean)
+
+        self.equity *= 1.0 + ret
+        if self.equity > self.high_water_mark:
+            self.high_water_mark = self.equity
+        self.drawdown = self.high_water_mark - self.equity
+        self.duration = 0 if self.drawdown == 0 else self.duration + 1
+        if self.drawdown > self.max_drawdown:
+            self.max_drawdown = self.drawdown
+        if self.duration > self.max_duration or np.isnan(self.max_duration):
+            self.max_duration = self.duration
+
+    @property
+    def variance(self):
+        """
+        Population variance of the returns.
+        """
+        return self.m2 / self.count
+
+    @property
+    def total_return(self):
+        return self.equity - 1.0
 
-    # Create the drawdown and duration series
-    idx = pnl.index
-    drawdown = pd.Series(index = idx)
-    duration = pd.Series(index = idx)
+    def sharpe_ratio(self, periods=252):
+        """
+        Sharpe ratio of the returns so far, as create_sharpe_ratio().
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(periods) * (self.mean / np.sqrt(self.variance))
 
-    # Loop over the index range
-    for t in range(1, len(idx)):
-        hwm.append(max(hwm[t-1], pnl[t]))
-        drawdown[t]= (hwm[t]-pnl[t])
-        duration[t]= (0 if drawdown[t] == 0 else duration[t-1]+1)
-    return drawdown, drawdown.max(), duration.max()
+    def summary(self, periods=252):
+        """
+        Returns the current statistics as a dict.
+        """
+        return {
+            'bars': self.count, 'total_return': self.total_return, 'sharpe_ratio': self.sharpe_ratio(periods),
+            'drawdown': self.drawdown, 'max_drawdown': self.max_drawdown, 'duration': self.duration, 'max_duration': self.max_duration,
+        }
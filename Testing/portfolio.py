@@ -8,10 +8,88 @@ except ImportError:
 
 import numpy as np
 import pandas as pd
-from matplotlib import pyplot as plt
 
-from event import FillEvent, OrderEvent
-from performance import create_sharpe_ratio, create_drawdowns
+from event import EventType, FillEvent, OrderEvent
+from performance import create_drawdowns, OnlineStats
+
+# Share of an order executed on the bar of the signal and each following bar, the horizon is the number of weights
+SMOOTHING_WEIGHTS = (1/5, 1/5, 1/5, 1/5, 1/5)
+
+class OrderScheduler(object):
+    """
+    Calendar of smoothed orders, bucketed by the index of the bar they are due on.
+    Releasing the orders of a bar only touches that bar's bucket, whatever the number of pending orders, and the orders are never mutated.
+    """
+    def __init__(self, symbol_list):
+        self.buckets = {}
+        self.rank = dict((s, i) for i, s in enumerate(symbol_list))
+        # Signed quantity still scheduled for every symbol, in symbol_list order
+        self.outstanding = np.zeros(len(symbol_list))
+
+    def schedule(self, order, due):
+        """
+        Adds order to the bucket of bar index due.
+        """
+        self.outstanding[self.rank[order.symbol]] += order.quantity if order.direction == 'BUY' else -order.quantity
+        bucket = self.buckets.get(due)
+        if bucket is None:
+            self.buckets[due] = [order]
+        else:
+            bucket.append(order)
+
+    def pop_due(self, bar):
+        """
+        Removes and returns the orders due on bar index bar, ordered by symbol as in symbol_list and by scheduling time within a symbol.
+        """
+        orders = self.buckets.pop(bar, None)
+        if not orders:
+            return ()
+        rank = self.rank
+        orders.sort(key=lambda order: rank[order.symbol])
+        for order in orders:
+            self.outstanding[rank[order.symbol]] -= order.quantity if order.direction == 'BUY' else -order.quantity
+        return orders
+
+    def pending(self, symbol=None):
+        """
+        Returns the pending orders, optionally of one symbol only, in due order.
+        """
+        return [order for due in sorted(self.buckets) for order in self.buckets[due] if symbol is None or order.symbol == symbol]
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets.values())
+
+class SymbolArray(object):
+    """
+    Dict-like view mapping every symbol to one element of a float64 array, so that per-symbol code keeps working
+    (positions[symbol] += quantity) while whole-portfolio code uses the array directly.
+    """
+    __slots__ = ('symbol_index', 'values')
+
+    def __init__(self, symbol_list):
+        self.symbol_index = dict((s, i) for i, s in enumerate(symbol_list))
+        self.values = np.zeros(len(symbol_list))
+
+    def __getitem__(self, symbol):
+        return self.values[self.symbol_index[symbol]]
+
+    def __setitem__(self, symbol, value):
+        self.values[self.symbol_index[symbol]] = value
+
+    def __contains__(self, symbol):
+        return symbol in self.symbol_index
+
+    def __iter__(self):
+        return iter(self.symbol_index)
+
+    def __len__(self):
+        return len(self.symbol_index)
+
+    def keys(self):
+        return self.symbol_index.keys()
+
+    def items(self):
+        return [(s, self.values[i]) for s, i in self.symbol_index.items()]
 
 class Portfolio(object):
     """
@@ -21,7 +99,7 @@ class Portfolio(object):
 
     The holdings DataFrame stores the cash and total market holdings value of each symbol for a particular time-index, as well as the percentage change in portfolio total across bars.
     """
-    def __init__(self, bars, events, start_date, initial_capital=100000.0):
+    def __init__(self, bars, events, start_date, initial_capital=100000.0, ledger=False, smoothing_weights=SMOOTHING_WEIGHTS):
         """
         Initialises the portfolio with bars and an event queue. Also includes a starting datetime index and initial capital (USD unless otherwise stated).
 
@@ -30,6 +108,9 @@ class Portfolio(object):
         events - The Event Queue object.
         start_date - The start date (bar) of the portfolio.
         initial_capital - The starting capital in USD.
+        ledger - If True, positions and holdings are recorded in preallocated (bars x symbols) arrays instead of a dict per bar.
+            Pass functools.partial(Portfolio, ledger=True) to Backtest to enable it.
+        smoothing_weights - Share of every order executed on the bar of the signal and each following bar, e.g. (0.5, 0.3, 0.2). (1.0,) disables smoothing.
         """
         self.bars = bars
         self.events = events
@@ -37,14 +118,25 @@ class Portfolio(object):
         self.start_date = start_date
         self.initial_capital = initial_capital
         self.portfolio_date = datetime.datetime(2000,1,1)
-        # self.smooth_count = 3 # Used for portfolio adjustment smoothing
-        # Used for store historical OrderEvent for smoothing
-        self.order_queue = dict((k, v) for k, v in [(s, []) for s in self.symbol_list])
-
-        self.all_positions = self.construct_all_positions()
-        self.current_positions = dict( (k,v) for k, v in [(s, 0.0) for s in self.symbol_list] )
-
-        self.all_holdings = self.construct_all_holdings()
+        self.smoothing_weights = tuple(smoothing_weights)
+        # Orders of earlier signals waiting for their bar, see generate_smooth_order()
+        self.scheduler = OrderScheduler(self.symbol_list)
+        # Signed quantity of the orders sent and neither filled nor cancelled yet, in symbol_list order, counted by update_order().
+        # Orders an execution handler carries forward or keeps resting stay queued
+        self.queued = np.zeros(len(self.symbol_list))
+        # Index of the latest bar, counted by update_timeindex()
+        self.bar_index = -1
+        # Running Sharpe ratio and drawdown of the holdings total, updated by update_timeindex()
+        self.stats = OnlineStats(initial_capital)
+
+        self.ledger = ledger
+        if ledger:
+            self.current_positions = SymbolArray(self.symbol_list)
+            self.construct_ledger()
+        else:
+            self.all_positions = self.construct_all_positions()
+            self.current_positions = dict( (k,v) for k, v in [(s, 0.0) for s in self.symbol_list] )
+            self.all_holdings = self.construct_all_holdings()
         self.current_holdings = self.construct_current_holdings()
 
     def construct_all_positions(self):
@@ -66,6 +158,31 @@ class Portfolio(object):
         d['total'] = self.initial_capital
         return [d]
 
+    def construct_ledger(self, rows=None):
+        """
+        Preallocates the ledger: positions of shape (rows, symbols) and holdings of shape (rows, symbols + 3), whose last columns are cash, commission and total.
+        One row per bar plus the initial row and the replayed last bar, grown by doubling if the number of bars is unknown.
+        Row 0 holds the start_date and the initial capital.
+        """
+        if rows is None:
+            bar_store = getattr(self.bars, 'bar_store', None)
+            rows = 1024 if bar_store is None else len(bar_store) + 2
+        n = len(self.symbol_list)
+        self.ledger_positions = np.zeros((rows, n))
+        self.ledger_holdings = np.zeros((rows, n + 3))
+        self.ledger_datetimes = np.empty(rows, dtype='datetime64[ns]')
+        self.ledger_datetimes[0] = np.datetime64(self.start_date, 'ns')
+        self.ledger_holdings[0, n] = self.initial_capital
+        self.ledger_holdings[0, n + 2] = self.initial_capital
+        self.ledger_rows = 1
+        self.cross_section = getattr(self.bars, 'get_latest_cross_section', None)
+
+    def _grow_ledger(self):
+        rows = 2 * len(self.ledger_datetimes)
+        self.ledger_positions = np.concatenate([self.ledger_positions, np.zeros_like(self.ledger_positions)])[:rows]
+        self.ledger_holdings = np.concatenate([self.ledger_holdings, np.zeros_like(self.ledger_holdings)])[:rows]
+        self.ledger_datetimes = np.concatenate([self.ledger_datetimes, np.empty_like(self.ledger_datetimes)])[:rows]
+
     def construct_current_holdings(self):
         """
         This constructs the dictionary which will hold the instantaneous value of the portfolio across all symbols.
@@ -83,7 +200,11 @@ class Portfolio(object):
         """
         latest_datetime = self.bars.get_latest_bar_datetime(self.symbol_list[0])
         self.portfolio_date = latest_datetime
-        
+        self.bar_index += 1
+        if self.ledger:
+            self.update_ledger(latest_datetime)
+            return
+
         # Update positions
         # ================
         dp = dict( (k,v) for k, v in [(s, 0) for s in self.symbol_list] )
@@ -120,6 +241,54 @@ class Portfolio(object):
 
         # Append the current holdings
         self.all_holdings.append(dh)
+        self.stats.update(dh['total'])
+
+    def update_ledger(self, latest_datetime):
+        """
+        Records the current positions and holdings in the next ledger row, marking every symbol to market with one vectorized multiply.
+        As in update_timeindex(), short positions and missing prices are valued at 0.
+        """
+        row = self.ledger_rows
+        if row == len(self.ledger_datetimes):
+            self._grow_ledger()
+        n = len(self.symbol_list)
+        if self.cross_section is not None:
+            prices = self.cross_section("adj_close")
+        else:
+            prices = np.array([self.bars.get_latest_bar_value(s, "adj_close") for s in self.symbol_list])
+        positions = self.current_positions.values
+        np.maximum(positions, 0.0, out=self.ledger_positions[row])
+        holdings = self.ledger_holdings[row]
+        market_value = holdings[:n]
+        np.multiply(positions, prices, out=market_value)
+        market_value[~(market_value >= 0.0)] = 0.0
+        holdings[n] = self.current_holdings['cash']
+        holdings[n + 1] = self.current_holdings['commission']
+        holdings[n + 2] = self.current_holdings['cash'] + market_value.sum()
+        self.stats.update(holdings[n + 2])
+        self.ledger_datetimes[row] = np.datetime64(latest_datetime, 'ns')
+        self.ledger_rows = row + 1
+
+    def positions_frame(self):
+        """
+        Returns the recorded positions as a DataFrame with a datetime column, in either mode.
+        """
+        if not self.ledger:
+            return pd.DataFrame(self.all_positions)
+        frame = pd.DataFrame(self.ledger_positions[:self.ledger_rows], columns=self.symbol_list, copy=False)
+        frame['datetime'] = self.ledger_datetimes[:self.ledger_rows]
+        return frame
+
+    def holdings_frame(self):
+        """
+        Returns the recorded holdings as a DataFrame indexed on datetime, with one column per symbol and cash, commission and total.
+        In ledger mode the frame is a view on the ledger array, nothing is copied.
+        """
+        if not self.ledger:
+            return pd.DataFrame(self.all_holdings).set_index('datetime')
+        index = pd.DatetimeIndex(self.ledger_datetimes[:self.ledger_rows], name='datetime')
+        columns = list(self.symbol_list) + ['cash', 'commission', 'total']
+        return pd.DataFrame(self.ledger_holdings[:self.ledger_rows], index=index, columns=columns, copy=False)
 
     def update_positions_from_fill(self, fill):
         """
@@ -152,8 +321,12 @@ class Portfolio(object):
             fill_dir = -1
         
         # Update holdings list with new quantities
-        fill_cost = self.bars.get_latest_bar_value(fill.symbol, "adj_close")
-        cost = fill_dir * fill_cost * fill.quantity
+        if fill.fill_cost is not None:
+            # The execution handler priced the fill
+            cost = fill_dir * fill.fill_cost
+        else:
+            fill_cost = self.bars.get_latest_bar_value(fill.symbol, "adj_close")
+            cost = fill_dir * fill_cost * fill.quantity
         self.current_holdings[fill.symbol] += cost
         self.current_holdings['commission'] += fill.commission
         self.current_holdings['cash'] -= (cost + fill.commission)
@@ -163,9 +336,24 @@ class Portfolio(object):
         """
         Updates the portfolio current positions and holdings from a FillEvent.
         """
-        if event.type == 'FILL':
+        if event.type == EventType.FILL:
             self.update_positions_from_fill(event)
             self.update_holdings_from_fill(event)
+            self.queued[self.scheduler.rank[event.symbol]] -= event.quantity if event.direction == 'BUY' else -event.quantity
+
+    def update_order(self, event):
+        """
+        Counts an OrderEvent as queued until it is filled or cancelled, whether this portfolio or a strategy sent it.
+        """
+        if event.type == EventType.ORDER and event.order_type != 'CXL':
+            self.queued[self.scheduler.rank[event.symbol]] += event.quantity if event.direction == 'BUY' else -event.quantity
+
+    def update_cancel(self, event):
+        """
+        Stops counting the quantity of a CancelEvent as queued.
+        """
+        if event.type == EventType.CANCEL:
+            self.queued[self.scheduler.rank[event.symbol]] -= event.quantity if event.direction == 'BUY' else -event.quantity
 
     def generate_naive_order(self, signal):
         """
@@ -199,128 +387,136 @@ class Portfolio(object):
     def generate_smooth_order(self, signal):
         """
         Fill an Order object as a constant quantity sizing of the signal object, without risk management or position sizing considerations.
-        As default, an order will be implemented with a smooth window of 5 days.
+        The order is split into one slice per smoothing weight, by default 5 slices of 1/5 on the bar of the signal and the 4 following bars.
         :param signal: A SignalEvent, from self.update_signal().
-        :return: dict - An OrderEvent queue.
+        :return: list - The OrderEvents, order.smooth is the number of bars after the signal the slice is due.
         """
         orders = []
         symbol = signal.symbol
         init_order_date = signal.datetime
-        dd = datetime.timedelta(days=1)
         direction = signal.signal_type
-        strength = signal.strength
         mkt_quantity = signal.quantity
         cur_quantity = self.current_positions[symbol]
         order_type = 'MKT'
 
         if direction == 'LONG':
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*mkt_quantity, direction='BUY', smooth=0))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*mkt_quantity, direction='BUY', smooth=1))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*mkt_quantity, direction='BUY', smooth=2))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*mkt_quantity, direction='BUY', smooth=3))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*mkt_quantity, direction='BUY', smooth=4))
-        if direction == 'SHORT':
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*mkt_quantity, direction='SELL', smooth=0))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*mkt_quantity, direction='SELL', smooth=1))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*mkt_quantity, direction='SELL', smooth=2))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*mkt_quantity, direction='SELL', smooth=3))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*mkt_quantity, direction='SELL', smooth=4))
-        if direction == 'EXIT' and cur_quantity > 0:
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*abs(cur_quantity), direction='SELL', smooth=0))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*abs(cur_quantity), direction='SELL', smooth=1))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*abs(cur_quantity), direction='SELL', smooth=2))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*abs(cur_quantity), direction='SELL', smooth=3))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*abs(cur_quantity), direction='SELL', smooth=4))
-        if direction == 'EXIT' and cur_quantity < 0:
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*abs(cur_quantity), direction='BUY', smooth=0))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*abs(cur_quantity), direction='BUY', smooth=1))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*abs(cur_quantity), direction='BUY', smooth=2))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*abs(cur_quantity), direction='BUY', smooth=3))
-            orders.append(OrderEvent(timeindex=init_order_date, symbol=symbol, order_type=order_type, quantity=1/5*abs(cur_quantity), direction='BUY', smooth=4))
+            side, quantity = 'BUY', mkt_quantity
+        elif direction == 'SHORT':
+            side, quantity = 'SELL', mkt_quantity
+        elif direction == 'EXIT' and cur_quantity > 0:
+            side, quantity = 'SELL', abs(cur_quantity)
+        elif direction == 'EXIT' and cur_quantity < 0:
+            side, quantity = 'BUY', abs(cur_quantity)
+        else:
+            return orders
+
+        return self._slice_order(symbol, init_order_date, side, quantity, order_type)
+
+    def _slice_order(self, symbol, timeindex, side, quantity, order_type='MKT'):
+        """
+        Splits an order into one OrderEvent per non-zero smoothing weight.
+        """
+        orders = []
+        for smooth, weight in enumerate(self.smoothing_weights):
+            if weight > 0.0:
+                orders.append(OrderEvent(timeindex=timeindex, symbol=symbol, order_type=order_type, quantity=weight*quantity, direction=side, smooth=smooth))
+        return orders
 
-        self.order_queue[symbol] += orders
+    def _submit_orders(self, orders):
+        """
+        Sends the first slice at once and schedules the others on the bars they are due.
+        """
+        for order in orders:
+            if order.smooth == 0:
+                self.events.put(order)
+            else:
+                self.scheduler.schedule(order, self.bar_index + order.smooth)
 
     def update_signal(self, event):
         """
         Acts on a SignalEvent to generate new orders based on the portfolio logic.
+        The first slice is sent at once, the others are scheduled on the bars they are due.
         """
-        if event.type == 'SIGNAL':
-            if self.order_queue[event.symbol]:
-                for index, order in enumerate(self.order_queue[event.symbol]):
-                    # self.historical_signal() 已将smooth为1的symbol变为0
-                    # New SignalEvent的T+0 Order的smooth参数为0，需要先还原以避免order明天的交易
-                    self.order_queue[event.symbol][index].smooth += 1
-            self.generate_smooth_order(event) # 生成新的Order
-            if self.order_queue[event.symbol]:
-                order_queue = []
-                for order in self.order_queue[event.symbol]:
-                    if order.smooth == 0:
-                        self.events.put(order)
-                        # print(order.symbol + " " + order.direction)
-                    else:
-                        order.smooth -= 1 # 还原本函数之前对smooth-1的处理
-                        order_queue.append(order)
-                self.order_queue[event.symbol] = order_queue
+        if event.type == EventType.SIGNAL:
+            self._submit_orders(self.generate_smooth_order(event))
+
+    def _position_vector(self):
+        if self.ledger:
+            return self.current_positions.values.copy()
+        return np.array([self.current_positions[s] for s in self.symbol_list], dtype=np.float64)
+
+    def _price_vector(self):
+        cross_section = getattr(self.bars, 'get_latest_cross_section', None)
+        if cross_section is not None:
+            return cross_section("adj_close")
+        return np.array([self.bars.get_latest_bar_value(s, "adj_close") for s in self.symbol_list], dtype=np.float64)
+
+    def update_target(self, event):
+        """
+        Acts on a TargetEvent: every symbol is moved from its position, including the orders sent or scheduled but not filled, to its target in one pass over the vector.
+        Weights are turned into whole shares at the latest adj_close and the current total, short positions and missing prices valued at 0 as in update_timeindex().
+        The orders are smoothed as those of a SignalEvent.
+        """
+        if event.type != EventType.TARGET:
+            return
+        positions = self._position_vector()
+        targets = np.asarray(event.targets, dtype=np.float64)
+        if event.kind == 'WEIGHT':
+            prices = self._price_vector()
+            market_value = positions * prices
+            total = self.current_holdings['cash'] + market_value[market_value >= 0.0].sum()
+            with np.errstate(invalid='ignore', divide='ignore'):
+                targets = np.trunc(targets * total / prices)
+        delta = targets - (positions + self.queued + self.scheduler.outstanding)
+        # Missing targets or prices leave the symbol alone, rounding residues of the slices are not traded
+        delta[~(np.abs(delta) > 1e-6)] = 0.0
+        for col in np.flatnonzero(delta):
+            side = 'BUY' if delta[col] > 0.0 else 'SELL'
+            self._submit_orders(self._slice_order(self.symbol_list[col], event.datetime, side, abs(delta[col])))
 
     def historical_signal(self, event):
         """
         Act on remaining order from historical SignalEvent due to lag and smoothing of portfolio management.
+        Only the orders due on the current bar are touched.
         """
-        if event.type == 'MARKET':
-            for symbol in self.symbol_list:
-                if self.order_queue[symbol]:
-                    order_queue = []
-                    for order in self.order_queue[symbol]:
-                        if order.smooth > 0:
-                            order.smooth -= 1
-                            order_queue.append(order)
-                            print(order.symbol + ' ' + str(order.smooth + 1) + ' to ' + str(order.smooth))
-                        else:
-                            self.events.put(order)
-                            print(order.symbol + ' Order at '+ order.timeindex)  # If Sql Datahandaler used, order.timeindex here may be a str
-                    self.order_queue[symbol] = order_queue
+        if event.type == EventType.MARKET:
+            for order in self.scheduler.pop_due(self.bar_index):
+                self.events.put(order)
 
     def create_equity_curve_dataframe(self):
         """
-        Creates a Pandas DataFrame from the all_holdings list of dictionaries.
+        Creates a Pandas DataFrame from the all_holdings list of dictionaries, or from the ledger arrays.
         """
-        curve = pd.DataFrame(self.all_holdings)
-        curve.set_index('datetime', inplace=True)
+        curve = self.holdings_frame()
         #curve.fillna(method='ffill',axis=1,inplace=True)
         curve['returns'] = curve['total'].pct_change()
-        curve['returns'][0] = 0.0
+        curve.iloc[0, curve.columns.get_loc('returns')] = 0.0
         curve['equity_curve'] = (1.0+curve['returns']).cumprod()
         self.equity_curve = curve
 
-    def output_summary_stats(self, frequency = 252):
+    def output_summary_stats(self, frequency = 252, csv_path=None):
         """
         Creates a list of summary statistics for the portfolio.
-        """
-        total_return = self.equity_curve['equity_curve'][-1]
-        returns = self.equity_curve['returns']
-        pnl = self.equity_curve['equity_curve']
+        The figures are read from the running statistics in self.stats, the equity curve only gets its drawdown column.
 
-        sharpe_ratio = create_sharpe_ratio(returns, periods=frequency)
-        drawdown, max_dd, dd_duration = create_drawdowns(pnl)
-        self.equity_curve['drawdown'] = drawdown
-        self.equity_curve['drawdown'][0] = 0.0
+        Parameters:
+        frequency - Periods per year, used to annualise the Sharpe ratio.
+        csv_path - File the equity curve is written to, by default nothing is written. See reporting.Reporter for the binary formats.
+        """
+        drawdown, max_dd, dd_duration = create_drawdowns(self.equity_curve['equity_curve'])
+        drawdown.iloc[0] = 0.0
+        self.equity_curve['drawdown'] = drawdown.values
 
-        stats = [("Total Return", "%0.2f%%" %  ((total_return - 1.0) * 100.0)), 
-        ("Sharpe Ratio", "%0.2f" % sharpe_ratio), ("Max Drawdown", "%0.2f%%" % (max_dd * 100.0)), ("Drawdown Duration", "%d" % dd_duration)]
+        stats = [("Total Return", "%0.2f%%" %  (self.stats.total_return * 100.0)), 
+        ("Sharpe Ratio", "%0.2f" % self.stats.sharpe_ratio(frequency)), ("Max Drawdown", "%0.2f%%" % (self.stats.max_drawdown * 100.0)), ("Drawdown Duration", "%d" % self.stats.max_duration)]
 
-        self.equity_curve.to_csv('EquityCurve.csv')
+        if csv_path is not None:
+            self.equity_curve.to_csv(csv_path)
         return stats
 
-    def plot_summary(self):
-        plt.style.use('seaborn')
-        fig = plt.figure()
-        ax1 = fig.add_subplot(311, ylabel='Portfolio value')
-        self.equity_curve['equity_curve'].plot(ax=ax1, color="blue", lw=1.)
-        ax2 = fig.add_subplot(312, ylabel='Period returns')
-        self.equity_curve['returns'].plot(ax=ax2, color="black", lw=1.)
-        ax3 = fig.add_subplot(313, ylabel='Drawdowns, %')
-        (self.equity_curve['drawdown']*100).plot(ax=ax3, color="red", lw=1.)
-
-        plt.gcf().autofmt_xdate()
-        plt.tight_layout()
-        plt.savefig('EquityCurve.png')
+    def plot_summary(self, path='EquityCurve.png'):
+        """
+        Plots the equity curve in the current process, matplotlib is only imported on the first call.
+        """
+        from reporting import plot_equity_curve
+        return plot_equity_curve(self.equity_curve, path)
@@ -0,0 +1,139 @@
+from datetime import datetime as dt
+from itertools import repeat
+import time
+
+import numpy as np
+import pandas as pd
+
+# Column order of every row passed to upsert_daily_prices()
+PRICE_COLUMNS = (
+    "data_vendor_id", "symbol_id", "price_date", "created_date", "last_updated_date",
+    "open_price", "high_price", "low_price", "close_price", "volume", "adj_factor"
+)
+# Columns overwritten when a bar already exists; last_updated_date only moves if one of them changed
+VALUE_COLUMNS = ("data_vendor_id", "open_price", "high_price", "low_price", "close_price", "volume", "adj_factor")
+
+
+def upsert_sql(engine="SQLite"):
+    """
+    Returns the INSERT statement that inserts new bars and updates existing (symbol_id, price_date) bars in place.
+    Requires the unique index on daily_price (symbol_id, price_date), see Data/migrate_daily_price_index.py.
+
+    Parameters:
+    engine - "SQLite" (ON CONFLICT DO UPDATE, SQLite >= 3.24) or "MySQL" (ON DUPLICATE KEY UPDATE).
+    """
+    column_str = ", ".join(PRICE_COLUMNS)
+    if engine == "SQLite":
+        insert_str = ", ".join(["?"] * len(PRICE_COLUMNS))
+        set_str = ", ".join(["%s = excluded.%s" % (c, c) for c in VALUE_COLUMNS + ("last_updated_date",)])
+        changed_str = " OR ".join(["daily_price.%s IS NOT excluded.%s" % (c, c) for c in VALUE_COLUMNS])
+        return (
+            "INSERT INTO daily_price (%s) VALUES (%s) "
+            "ON CONFLICT (symbol_id, price_date) DO UPDATE SET %s WHERE %s" % (column_str, insert_str, set_str, changed_str)
+        )
+    elif engine == "MySQL":
+        insert_str = ", ".join(["%s"] * len(PRICE_COLUMNS))
+        unchanged_str = " AND ".join(["%s <=> VALUES(%s)" % (c, c) for c in VALUE_COLUMNS])
+        # MySQL assigns left to right, so last_updated_date has to be compared before the values are overwritten
+        set_str = ", ".join(
+            ["last_updated_date = IF(%s, last_updated_date, VALUES(last_updated_date))" % unchanged_str] +
+            ["%s = VALUES(%s)" % (c, c) for c in VALUE_COLUMNS]
+        )
+        return "INSERT INTO daily_price (%s) VALUES (%s) ON DUPLICATE KEY UPDATE %s" % (column_str, insert_str, set_str)
+    raise ValueError("Unsupported engine %s" % engine)
+
+
+def _max_id(cur):
+    cur.execute("SELECT MAX(id) FROM daily_price")
+    max_id = cur.fetchone()[0]
+    return 0 if max_id is None else max_id
+
+
+def _count_new(cur, max_id, engine):
+    placeholder = "?" if engine == "SQLite" else "%s"
+    cur.execute("SELECT COUNT(*) FROM daily_price WHERE id > %s" % placeholder, (max_id,))
+    return cur.fetchone()[0]
+
+
+def upsert_daily_prices(con, rows, engine="SQLite", batch_size=5000):
+    """
+    Inserts or updates daily bars in batched transactions, so re-running an ingestion only touches the rows that actually change.
+    Rows are tuples in the order of PRICE_COLUMNS.
+
+    Parameters:
+    con - Open sqlite3 or MySQLdb connection.
+    rows - Iterable of row tuples, may be a generator.
+    engine - "SQLite" or "MySQL".
+    batch_size - Number of rows committed per transaction.
+
+    Returns:
+    dict - inserted, updated and unchanged row counts, elapsed seconds and rows inserted/updated per second.
+    """
+    sql = upsert_sql(engine)
+    cur = con.cursor()
+    stats = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    start = time.perf_counter()
+    batch = []
+
+    def flush(batch):
+        max_id = _max_id(cur)
+        if engine == "SQLite":
+            changes_before = con.total_changes
+            cur.executemany(sql, batch)
+            changed = con.total_changes - changes_before
+            inserted = _count_new(cur, max_id, engine)
+            updated = changed - inserted
+        else:
+            cur.executemany(sql, batch)
+            inserted = _count_new(cur, max_id, engine)
+            # ON DUPLICATE KEY UPDATE reports 1 per inserted and 2 per updated row
+            updated = (cur.rowcount - inserted) // 2
+        con.commit()
+        stats['inserted'] += inserted
+        stats['updated'] += updated
+        stats['unchanged'] += len(batch) - inserted - updated
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    elapsed = time.perf_counter() - start
+    stats['seconds'] = elapsed
+    stats['inserted_per_second'] = stats['inserted'] / elapsed if elapsed > 0 else 0.0
+    stats['updated_per_second'] = stats['updated'] / elapsed if elapsed > 0 else 0.0
+    return stats
+
+
+def format_upsert_stats(stats):
+    """
+    Returns a one line summary of the dict returned by upsert_daily_prices().
+    """
+    return "%d inserted (%.0f rows/s), %d updated (%.0f rows/s), %d unchanged in %.2f s" % (
+        stats['inserted'], stats['inserted_per_second'], stats['updated'], stats['updated_per_second'],
+        stats['unchanged'], stats['seconds']
+    )
+
+
+def frame_to_price_rows(frame, data_vendor_id, symbol_id, now=None):
+    """
+    Builds the upsert rows of one symbol from a DataFrame with price_date, open_price, high_price, low_price, close_price, volume and adj_factor columns.
+    Every column is converted in one vectorized step and the rows are zipped together, no per-cell access.
+
+    Returns:
+    list - tuples in the order of PRICE_COLUMNS.
+    """
+    if now is None:
+        now = dt.utcnow()
+    n = len(frame)
+    return list(zip(
+        repeat(data_vendor_id, n), repeat(symbol_id, n),
+        # sqlite3 only adapts datetime objects, not pd.Timestamp
+        pd.to_datetime(frame['price_date']).dt.to_pydatetime(),
+        repeat(now, n), repeat(now, n),
+        frame['open_price'].tolist(), frame['high_price'].tolist(), frame['low_price'].tolist(), frame['close_price'].tolist(),
+        frame['volume'].astype(np.int64).tolist(), frame['adj_factor'].tolist()
+    ))
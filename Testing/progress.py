@@ -0,0 +1,159 @@
+import json
+import time
+
+
+class ProgressSink(object):
+    """
+    ProgressSink receives the progress of a backtest and the orders, fills and cancels it produces.
+    The base class is the quiet sink: everything is dropped. Subclasses override progress(), message(), order(), fill() and cancel().
+    bar() is called once per bar by Backtest and only forwards to progress() every every_bars bars or every_seconds seconds.
+    """
+    def __init__(self, every_bars=None, every_seconds=None):
+        """
+        Parameters:
+        every_bars - Report progress every N bars, None to disable.
+        every_seconds - Report progress at most every T seconds, None to disable.
+        """
+        self.every_bars = every_bars
+        self.every_seconds = every_seconds
+        self.bars = 0
+        self.datetime = None
+        self._next_bar = every_bars
+        self._next_time = None if every_seconds is None else time.monotonic() + every_seconds
+
+    def bar(self, i, datetime):
+        """
+        Records that bar i with timestamp datetime is about to be processed.
+        """
+        self.bars = i
+        self.datetime = datetime
+        if self._next_bar is not None and i >= self._next_bar:
+            self._next_bar = i + self.every_bars
+            self.progress(i, datetime)
+        elif self._next_time is not None:
+            now = time.monotonic()
+            if now >= self._next_time:
+                self._next_time = now + self.every_seconds
+                self.progress(i, datetime)
+
+    def progress(self, i, datetime):
+        pass
+
+    def message(self, text):
+        pass
+
+    def order(self, event):
+        pass
+
+    def fill(self, event):
+        pass
+
+    def cancel(self, event):
+        pass
+
+    def close(self):
+        pass
+
+
+class ConsoleProgress(ProgressSink):
+    """
+    Prints throttled progress and messages to stdout. By default at most one progress line per second.
+    """
+    def __init__(self, every_bars=None, every_seconds=1.0):
+        ProgressSink.__init__(self, every_bars, every_seconds)
+
+    def progress(self, i, datetime):
+        print("Bar %d: %s" % (i, datetime))
+
+    def message(self, text):
+        print(text)
+
+
+class CallbackProgress(ProgressSink):
+    """
+    Calls callback(i, datetime) at the throttled progress points, e.g. to drive a progress bar or a job scheduler.
+    """
+    def __init__(self, callback, every_bars=None, every_seconds=1.0):
+        ProgressSink.__init__(self, every_bars, every_seconds)
+        self.callback = callback
+
+    def progress(self, i, datetime):
+        self.callback(i, datetime)
+
+
+class JSONLLog(ProgressSink):
+    """
+    Writes every order and fill as one JSON object per line, stamped with the bar number and bar datetime:
+        {"event": "ORDER", "bar": 42, "datetime": "2016-03-01 00:00:00", "symbol": "601988", ...}
+    """
+    def __init__(self, path, every_bars=None, every_seconds=None):
+        """
+        Parameters:
+        path - File the records are written to, overwritten if it exists.
+        """
+        ProgressSink.__init__(self, every_bars, every_seconds)
+        self.path = path
+        self.file = open(path, 'w')
+
+    def _write(self, record):
+        self.file.write(json.dumps(record))
+        self.file.write('\n')
+
+    def order(self, event):
+        self._write({
+            'event': 'ORDER', 'bar': self.bars, 'datetime': str(self.datetime), 'timeindex': str(event.timeindex),
+            'symbol': event.symbol, 'order_type': event.order_type, 'direction': event.direction, 'quantity': event.quantity,
+            'limit_price': event.limit_price, 'order_id': event.order_id
+        })
+
+    def fill(self, event):
+        self._write({
+            'event': 'FILL', 'bar': self.bars, 'datetime': str(self.datetime), 'symbol': event.symbol, 'exchange': event.exchange,
+            'direction': event.direction, 'quantity': event.quantity, 'fill_cost': event.fill_cost, 'commission': event.commission
+        })
+
+    def cancel(self, event):
+        self._write({
+            'event': 'CANCEL', 'bar': self.bars, 'datetime': str(self.datetime), 'symbol': event.symbol, 'direction': event.direction,
+            'quantity': event.quantity, 'order_id': event.order_id, 'reason': event.reason
+        })
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class CompositeProgress(ProgressSink):
+    """
+    Forwards everything to several sinks, e.g. ConsoleProgress() together with JSONLLog('orders.jsonl').
+    Throttling is left to the individual sinks.
+    """
+    def __init__(self, *sinks):
+        ProgressSink.__init__(self)
+        self.sinks = sinks
+
+    def bar(self, i, datetime):
+        self.bars = i
+        self.datetime = datetime
+        for sink in self.sinks:
+            sink.bar(i, datetime)
+
+    def message(self, text):
+        for sink in self.sinks:
+            sink.message(text)
+
+    def order(self, event):
+        for sink in self.sinks:
+            sink.order(event)
+
+    def fill(self, event):
+        for sink in self.sinks:
+            sink.fill(event)
+
+    def cancel(self, event):
+        for sink in self.sinks:
+            sink.cancel(event)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
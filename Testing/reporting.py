@@ -0,0 +1,138 @@
+import multiprocessing
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+def save_results(equity_curve, path, format='npz'):
+    """
+    Writes an equity curve DataFrame to disk.
+
+    Parameters:
+    equity_curve - The DataFrame of Portfolio.create_equity_curve_dataframe().
+    path - File name without extension, the extension of the format is appended.
+    format - 'npz' (compressed NumPy arrays, no extra dependency), 'parquet' (needs pyarrow or fastparquet) or 'csv'.
+
+    Returns:
+    str - The path of the written file.
+    """
+    if format == 'npz':
+        path = path + '.npz'
+        np.savez_compressed(
+            path, index=pd.DatetimeIndex(equity_curve.index).values, columns=np.array([str(c) for c in equity_curve.columns]),
+            values=equity_curve.values.astype(np.float64)
+        )
+    elif format == 'parquet':
+        path = path + '.parquet'
+        frame = equity_curve.astype(np.float64)
+        frame.columns = [str(c) for c in frame.columns]
+        frame.to_parquet(path)
+    elif format == 'csv':
+        path = path + '.csv'
+        equity_curve.to_csv(path)
+    else:
+        raise ValueError("Unknown results format '%s', expected 'npz', 'parquet' or 'csv'" % format)
+    return path
+
+
+def load_results(path):
+    """
+    Reads an equity curve written by save_results() back into a DataFrame, the format is taken from the extension.
+    """
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            return pd.DataFrame(data['values'], index=pd.DatetimeIndex(data['index'], name='datetime'), columns=list(data['columns']))
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, index_col=0, parse_dates=True)
+
+
+def plot_equity_curve(equity_curve, path='EquityCurve.png'):
+    """
+    Renders the equity curve, the period returns and the drawdowns into path.
+    matplotlib is only imported here, with the non-interactive Agg backend unless a backend was already chosen,
+    so nothing that merely imports the backtester loads a plotting backend.
+    """
+    import matplotlib
+    if 'matplotlib.pyplot' not in sys.modules:
+        matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+
+    # The 'seaborn' style was renamed in matplotlib 3.6
+    for style in ('seaborn-v0_8', 'seaborn'):
+        if style in plt.style.available:
+            plt.style.use(style)
+            break
+    fig = plt.figure()
+    ax1 = fig.add_subplot(311, ylabel='Portfolio value')
+    equity_curve['equity_curve'].plot(ax=ax1, color="blue", lw=1.)
+    ax2 = fig.add_subplot(312, ylabel='Period returns')
+    equity_curve['returns'].plot(ax=ax2, color="black", lw=1.)
+    ax3 = fig.add_subplot(313, ylabel='Drawdowns, %')
+    (equity_curve['drawdown']*100).plot(ax=ax3, color="red", lw=1.)
+
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+class Reporter(object):
+    """
+    The opt-in reporting stage of Backtest.simulate_trading(): writes the equity curve and, if asked for, renders the plot.
+    The plot is rendered in a separate process, so the backtest neither waits for it nor loads matplotlib itself.
+    Call wait() to block until all plots are written. Every report() writes to the same path, so give each run its own Reporter
+    or path to keep the results of several runs.
+    """
+    def __init__(self, path='EquityCurve', format='npz', csv=False, plot=False, background=True):
+        """
+        Parameters:
+        path - File name of the results without extension, the plot goes to path + '.png'.
+        format - Binary results format, 'npz' or 'parquet', None to write no binary results.
+        csv - If True, the equity curve is written as CSV as well.
+        plot - If True, the equity curve is plotted.
+        background - If True, the plot is rendered in a separate process, otherwise in the current one.
+        """
+        self.path = path
+        self.format = format
+        self.csv = csv
+        self.plot = plot
+        self.background = background
+        self.written = []
+        self.workers = []
+
+    def report(self, portfolio):
+        """
+        Writes the results of portfolio, whose equity curve and summary stats have been created.
+        Returns the paths written by this call, self.written keeps those of all calls.
+        """
+        curve = portfolio.equity_curve
+        written = []
+        if self.format is not None:
+            written.append(save_results(curve, self.path, self.format))
+        if self.csv:
+            written.append(save_results(curve, self.path, 'csv'))
+        if self.plot:
+            columns = ['equity_curve', 'returns', 'drawdown']
+            path = self.path + '.png'
+            if self.background:
+                worker = multiprocessing.Process(target=plot_equity_curve, args=(curve[columns], path))
+                worker.start()
+                self.workers.append(worker)
+            else:
+                plot_equity_curve(curve[columns], path)
+            written.append(path)
+        self.written.extend(written)
+        return written
+
+    def wait(self):
+        """
+        Waits for the background plots. Raises RuntimeError if one of them failed.
+        """
+        workers, self.workers = self.workers, []
+        for worker in workers:
+            worker.join()
+            if worker.exitcode != 0:
+                raise RuntimeError("Plotting process exited with code %s" % worker.exitcode)
@@ -7,7 +7,8 @@ except ImportError:
 
 import numpy as np
 import pandas as pd
-from event import SignalEvent
+from event import EventType, SignalEvent, TargetEvent
+from indicators import SMA
 
 class Strategy(object):
     """
@@ -23,3 +24,214 @@ class Strategy(object):
         Provides the mechanisms to calculate the list of signals.
         """
         raise NotImplementedError("Abstract method supports no implement.")
+
+
+class MovingAverageCrossStrategy(Strategy):
+    """
+    Holds quantity shares of a symbol while its short simple moving average of adj_close is above the long one, nothing otherwise.
+    The averages of all symbols are streaming indicators updated once per bar, instead of recomputing np.mean over the window for every symbol.
+    The event-driven twin of VectorizedMovingAverageCross.
+    """
+    def __init__(self, bars, events, window=(30, 90), quantity=100):
+        """
+        Parameters:
+        bars - The DataHandler object that provides bar information.
+        events - The Event Queue object.
+        window - The short and long lookback, e.g. [30, 90].
+        quantity - Shares bought when the short average crosses above the long one, and sold when it crosses back below.
+        """
+        self.bars = bars
+        self.events = events
+        self.symbol_list = self.bars.symbol_list
+        self.short_window, self.long_window = window[0], window[1]
+        self.quantity = quantity
+        self.short_sma = SMA(len(self.symbol_list), self.short_window)
+        self.long_sma = SMA(len(self.symbol_list), self.long_window)
+        self.invested = np.zeros(len(self.symbol_list), dtype=bool)
+        self.latest_datetime = None
+
+    def _latest_prices(self):
+        if hasattr(self.bars, 'get_latest_cross_section'):
+            return self.bars.get_latest_cross_section('adj_close')
+        return np.array([self.bars.get_latest_bar_value(s, 'adj_close') for s in self.symbol_list], dtype=np.float64)
+
+    def calculate_signals(self, event):
+        if event.type != EventType.MARKET:
+            return
+        # The feed replays its last bar once it is exhausted, which must not enter the averages twice
+        bar_datetime = self.bars.get_latest_bar_datetime(self.symbol_list[0])
+        if bar_datetime == self.latest_datetime:
+            return
+        self.latest_datetime = bar_datetime
+
+        prices = self._latest_prices()
+        # NaN during the warm-up compares as False
+        above = self.short_sma.update(prices) > self.long_sma.update(prices)
+        for col in np.flatnonzero(above != self.invested):
+            s = self.symbol_list[col]
+            signal_type = 'LONG' if above[col] else 'SHORT'
+            self.events.put(SignalEvent(1, s, self.bars.get_latest_bar_datetime(s), signal_type, 1.0, self.quantity))
+        self.invested = above
+
+
+class CrossSectionalStrategy(Strategy):
+    """
+    CrossSectionalStrategy is an abstract base class for strategies deciding on the whole universe at once, e.g. ranking or factor strategies.
+    Once per bar generate_targets() gets the last lookback bars of every field in fields as (bars x symbols) arrays and returns one target per symbol.
+    The vector is sent to the portfolio as a single TargetEvent instead of one SignalEvent per symbol. Requires a BarDataHandler.
+    """
+    __metaclass__ = ABCMeta
+
+    # Fields handed to generate_targets()
+    fields = ('adj_close',)
+    # 'WEIGHT' for fractions of the portfolio total, 'QUANTITY' for numbers of shares
+    kind = 'WEIGHT'
+
+    def __init__(self, bars, events, lookback):
+        """
+        Parameters:
+        bars - The BarDataHandler object that provides bar information.
+        events - The Event Queue object.
+        lookback - Number of bars in the arrays given to generate_targets().
+        """
+        self.bars = bars
+        self.events = events
+        self.symbol_list = self.bars.symbol_list
+        self.lookback = lookback
+        self.bar = 0
+        self.latest_datetime = None
+
+    @abstractmethod
+    def generate_targets(self, window):
+        """
+        Returns a float array with the target of every symbol in symbol_list order, NaN to leave a symbol unchanged, or None to send nothing on this bar.
+
+        Parameters:
+        window - dict of field name to a read-only (lookback x symbols) array whose last row is the latest bar, fewer rows during the first bars.
+        """
+        raise NotImplementedError("Abstract method supports no implement.")
+
+    def calculate_signals(self, event):
+        if event.type != EventType.MARKET:
+            return
+        # The feed replays its last bar once it is exhausted
+        bar_datetime = self.bars.get_latest_bar_datetime(self.symbol_list[0])
+        if bar_datetime == self.latest_datetime:
+            return
+        self.latest_datetime = bar_datetime
+        self.bar += 1
+
+        window = dict((field, self.bars.get_latest_window(field, self.lookback)) for field in self.fields)
+        targets = self.generate_targets(window)
+        if targets is not None:
+            self.events.put(TargetEvent(1, bar_datetime, targets, self.kind))
+
+
+class CrossSectionalMomentum(CrossSectionalStrategy):
+    """
+    Every rebalance bars, holds the top_n symbols by adj_close return over the last lookback bars with equal weights, nothing in the others.
+    Symbols without a price over the whole lookback are not ranked.
+    """
+    def __init__(self, bars, events, window=(60, 10, 20)):
+        """
+        Parameters:
+        window - The lookback, the number of symbols held and the bars between two rebalances, e.g. [60, 10, 20].
+        """
+        self.momentum_window, self.top_n, self.rebalance = window[0], window[1], window[2]
+        CrossSectionalStrategy.__init__(self, bars, events, self.momentum_window + 1)
+
+    def generate_targets(self, window):
+        close = window['adj_close']
+        if len(close) < self.lookback or (self.bar - self.lookback) % self.rebalance != 0:
+            return None
+        momentum = close[-1] / close[0] - 1.0
+        ranked = np.flatnonzero(~np.isnan(momentum))
+        top = ranked[np.argsort(-momentum[ranked], kind='stable')[:self.top_n]]
+        targets = np.zeros(len(self.symbol_list))
+        if len(top):
+            targets[top] = 1.0 / len(top)
+        return targets
+
+
+class VectorizedStrategy(object):
+    """
+    VectorizedStrategy is an abstract base class for strategies whose signals depend only on past bars, so they can be computed for the whole data set at once.
+    Instead of SignalEvents it returns a bars x symbols matrix of target positions, which is run by VectorizedBacktest
+    or, bar by bar, by the event-driven Backtest through TargetPositionStrategy.
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def generate_targets(self, bars):
+        """
+        Returns a float ndarray of shape (len(bars), len(bars.symbol_list)) holding the target position of every symbol after every bar.
+        Row t may only use the bars up to and including t.
+
+        Parameters:
+        bars - The BarStore with the aligned bar matrices.
+        """
+        raise NotImplementedError("Abstract method supports no implement.")
+
+
+class VectorizedMovingAverageCross(VectorizedStrategy):
+    """
+    Holds quantity shares of a symbol while its short simple moving average of adj_close is above the long one, nothing otherwise.
+    """
+    def __init__(self, short_window=30, long_window=90, quantity=100):
+        """
+        Parameters:
+        short_window - Lookback of the short moving average.
+        long_window - Lookback of the long moving average.
+        quantity - Target position while the short average is above the long one.
+        """
+        self.short_window = short_window
+        self.long_window = long_window
+        self.quantity = quantity
+
+    def generate_targets(self, bars):
+        close = pd.DataFrame(bars.fields['adj_close'])
+        short_mavg = close.rolling(self.short_window, min_periods=self.short_window).mean().values
+        long_mavg = close.rolling(self.long_window, min_periods=self.long_window).mean().values
+        # NaN during the warm-up compares as False, so no position is held
+        return np.where(short_mavg > long_mavg, float(self.quantity), 0.0)
+
+
+class TargetPositionStrategy(Strategy):
+    """
+    Runs a VectorizedStrategy inside the event-driven Backtest: after every bar it sends the change of the target position as a LONG or SHORT signal.
+    Used to check VectorizedBacktest against Backtest on the same data, requires a BarDataHandler.
+    By default the targets of all bars are computed once from the whole store. With causal=True the targets of every bar are computed
+    from the bars up to it only, which costs O(bars^2) but turns any look-ahead of the strategy into an AssertionError.
+    """
+    def __init__(self, bars, events, window, causal=False):
+        """
+        Parameters:
+        bars - The BarDataHandler object that provides bar information.
+        events - The Event Queue object.
+        window - The VectorizedStrategy instance.
+        causal - If True, recompute the targets on every bar from the bars seen so far and check them against the precomputed ones.
+        """
+        self.bars = bars
+        self.events = events
+        self.symbol_list = self.bars.symbol_list
+        self.vectorized = window
+        self.causal = causal
+        self.targets = None
+        self.current = np.zeros(len(self.symbol_list))
+
+    def calculate_signals(self, event):
+        store = self.bars.bar_store
+        if self.targets is None:
+            self.targets = np.nan_to_num(np.asarray(self.vectorized.generate_targets(store), dtype=np.float64))
+        row = self.targets[store.cursor]
+        if self.causal:
+            seen = np.nan_to_num(np.asarray(self.vectorized.generate_targets(store.slice(0, store.cursor + 1)), dtype=np.float64))[-1]
+            if not np.array_equal(seen, row):
+                raise AssertionError("Targets of bar %s depend on later bars: %s from the bars so far, %s from all bars" % (
+                    store.latest_datetime(), seen, row))
+        for col, s in enumerate(self.symbol_list):
+            delta = row[col] - self.current[col]
+            if delta != 0.0:
+                signal_type = 'LONG' if delta > 0.0 else 'SHORT'
+                self.events.put(SignalEvent(1, s, self.bars.get_latest_bar_datetime(s), signal_type, 1.0, abs(delta)))
+                self.current[col] = row[col]
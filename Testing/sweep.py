@@ -0,0 +1,177 @@
+from itertools import product
+from multiprocessing import Pool, shared_memory
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest import Backtest
+from bar_source import BarSource, InMemoryBarSource
+from bar_store import BarStore
+from performance import performance_summary
+from progress import ProgressSink
+
+
+def product_grid(*axes):
+    """
+    Returns the cartesian product of the parameter axes as a list of windows, e.g.
+    product_grid([10, 20], [60, 90]) -> [[10, 60], [10, 90], [20, 60], [20, 90]]
+    """
+    return [list(window) for window in product(*axes)]
+
+
+def share_store(store):
+    """
+    Copies every field matrix of store into its own multiprocessing.shared_memory block.
+
+    Returns:
+    spec - Picklable description passed to attach_store() in the worker processes.
+    blocks - The SharedMemory objects, to be closed and unlinked by the caller once the workers are done.
+    """
+    blocks = []
+    fields = {}
+    for field, values in store.fields.items():
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        shared = np.ndarray(values.shape, dtype=np.float64, buffer=block.buf, order='F')
+        shared[...] = values
+        blocks.append(block)
+        fields[field] = (block.name, values.shape)
+    spec = {'index': store.datetimes, 'symbol_list': store.symbol_list, 'fields': fields}
+    return spec, blocks
+
+
+def attach_store(spec):
+    """
+    Returns a BarStore whose matrices are the shared memory blocks described by spec, without copying, and the attached blocks.
+    The blocks have to be kept referenced as long as the store is used.
+    """
+    blocks = []
+    fields = {}
+    for field, (name, shape) in spec['fields'].items():
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        fields[field] = np.ndarray(shape, dtype=np.float64, buffer=block.buf, order='F')
+    return BarStore(spec['index'], spec['symbol_list'], fields), blocks
+
+
+# Per-process state of the pool workers, set by init_worker()
+_worker = {}
+
+
+def init_worker(spec, settings):
+    """
+    Pool initializer: attaches the store shared by share_store() and keeps it with settings for the tasks of this process.
+    """
+    store, blocks = attach_store(spec)
+    _worker['store'] = store
+    _worker['blocks'] = blocks
+    _worker['settings'] = settings
+
+
+def worker_store():
+    """
+    Returns the BarStore attached by init_worker() in this pool process.
+    """
+    return _worker['store']
+
+
+def _parse_stat(value):
+    """
+    Turns a formatted summary statistic such as '12.30%' back into a float.
+    """
+    try:
+        return float(value.rstrip('%'))
+    except (AttributeError, ValueError):
+        return value
+
+
+def run_window(store, window, settings, keep_curve=False):
+    """
+    Runs one quiet Backtest over store with the given strategy window. Returns a dict with the window,
+    the summary stats of Portfolio.output_summary_stats() as numbers (percentages stay in percent) and the event counts.
+    If keep_curve is True, the 'total' column of the equity curve is returned as well.
+    """
+    start = time.perf_counter()
+    backtest = Backtest(
+        './', store.symbol_list, settings['initial_capital'], 0.0, settings['startdate'], settings['enddate'],
+        InMemoryBarSource(store), settings['execution_handler'], settings['portfolio'], settings['strategy'], window,
+        progress=ProgressSink()
+    )
+    stats = backtest.simulate_trading(frequency=settings['frequency'])
+    result = {'window': window}
+    for name, value in stats:
+        result[name] = _parse_stat(value)
+    result.update({'Signals': backtest.signals, 'Orders': backtest.orders, 'Fills': backtest.fills,
+                   'Seconds': time.perf_counter() - start})
+    if keep_curve:
+        result['total'] = backtest.portfolio.equity_curve['total'].values
+    return result
+
+
+def _run_worker(task):
+    window, keep_curve = task
+    return run_window(worker_store(), window, _worker['settings'], keep_curve=keep_curve)
+
+
+class ParameterSweep(object):
+    """
+    Runs the same Backtest for every window of a parameter grid across a process pool.
+    The universe is loaded once in the parent process and its bar matrices are placed in shared memory,
+    so every worker maps the same pages instead of reloading or unpickling the data.
+    """
+    def __init__(self, symbol_list, initial_capital, startdate, enddate, data, execution_handler, portfolio, strategy, windows,
+                 processes=None, frequency=252, keep_curves=False):
+        """
+        Initialises the sweep.
+
+        Parameters:
+        symbol_list - The list of symbol strings.
+        initial_capital - The starting capital for the portfolio.
+        startdate - The start datetime of the strategy.
+        enddate - The end datetime of the strategy.
+        data - A BarStore, or a BarSource the universe is loaded from once.
+        execution_handler - (Class) Handles the orders/fills for trades.
+        portfolio - (Class) Keeps track of portfolio current and prior positions.
+        strategy - (Class) Generates signals based on market data.
+        windows - The list of strategy windows to run, e.g. from product_grid().
+        processes - Number of worker processes, defaults to the number of cores. 1 runs in the current process.
+        frequency - Periods per year, passed to output_summary_stats().
+        keep_curves - If True, the portfolio totals of all runs are kept as the columns of self.equity_curves
+                      and the batch metrics of performance_summary() are added to the results table.
+        """
+        self.symbol_list = symbol_list
+        self.windows = windows
+        self.processes = processes or os.cpu_count() or 1
+        self.keep_curves = keep_curves
+        self.settings = {
+            'initial_capital': initial_capital, 'startdate': startdate, 'enddate': enddate,
+            'execution_handler': execution_handler, 'portfolio': portfolio, 'strategy': strategy, 'frequency': frequency,
+        }
+        if isinstance(data, BarSource):
+            data = data.load(symbol_list, startdate.strftime('%Y-%m-%d %H:%M:%S'), enddate.strftime('%Y-%m-%d %H:%M:%S'))
+        self.bars = data
+
+    def run(self):
+        """
+        Runs every window and returns the results table: one row per window, sorted in grid order.
+        """
+        if self.processes == 1:
+            results = [run_window(self.bars, window, self.settings, keep_curve=self.keep_curves) for window in self.windows]
+        else:
+            spec, blocks = share_store(self.bars)
+            try:
+                with Pool(self.processes, initializer=init_worker, initargs=(spec, self.settings)) as pool:
+                    results = pool.map(_run_worker, [(window, self.keep_curves) for window in self.windows], chunksize=1)
+            finally:
+                for block in blocks:
+                    block.close()
+                    block.unlink()
+        self.results = pd.DataFrame(results)
+        if self.keep_curves:
+            # Every run covers the same bars, so the curves stack into one matrix scored in a single pass
+            self.equity_curves = pd.DataFrame(np.column_stack([r['total'] for r in results]))
+            self.results = self.results.drop(columns=['total'])
+            metrics = performance_summary(self.equity_curves, periods=self.settings['frequency'])
+            self.results = pd.concat([self.results, metrics.reset_index(drop=True)], axis=1)
+        return self.results
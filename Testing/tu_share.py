@@ -9,6 +9,7 @@ import sqlite3
 
 
 COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'AdjFacotr']
+UNIVERSE_COLUMNS = ['ticker', 'price_date', 'open_price', 'high_price', 'low_price', 'close_price', 'volume', 'adj_factor']
 class TuShare(object):
     """
     Encapsulates calls to the TuShare API with a provided API key.
@@ -125,6 +126,72 @@ class TuShare(object):
         otpt = pd.read_sql_query(sql, con=con, index_col='price_date')
         return otpt
 
+    def _query_daily_universe(self, con, tickers, startdate, enddate, placeholder, chunk_size):
+        """
+        Runs the universe query on an open connection, one parameterized IN (...) query per chunk of tickers.
+        Returns a long-format DataFrame with one row per (ticker, price_date).
+        """
+        tickers = list(tickers)
+        frames = []
+        for i in range(0, len(tickers), chunk_size):
+            chunk = tickers[i:i + chunk_size]
+            sql = (
+                "SELECT sym.ticker, dp.price_date, dp.open_price, dp.high_price, dp.low_price, dp.close_price, dp.volume, dp.adj_factor "
+                "FROM daily_price AS dp INNER JOIN symbol AS sym ON sym.id = dp.symbol_id "
+                "WHERE sym.ticker IN (" + ", ".join([placeholder] * len(chunk)) + ") "
+                "AND dp.price_date BETWEEN " + placeholder + " AND " + placeholder + " "
+                "ORDER BY sym.ticker, dp.price_date ASC;"
+            )
+            frames.append(pd.read_sql_query(sql, con=con, params=chunk + [startdate, enddate]))
+        if not frames:
+            return pd.DataFrame(columns=UNIVERSE_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def get_daily_universe_sql(self, tickers, startdate, enddate, chunk_size=500):
+        """
+        Use DATABASE securities_master to query data for a whole list of tickers over one connection.
+        This method is used for RDBMS like MySQL.
+        Parameters
+        ----------
+        tickers : 'list', The ticker symbols, e.g. ['601988', '601388']
+        start_date : str, '%Y-%m-%d %H:%M:%S', The starting date to obtain pricing for
+        end_date : str, '%Y-%m-%d %H:%M:%S', The ending date to obtain pricing for
+        chunk_size : int, Maximum number of tickers bound into a single query
+        Returns
+        -------
+        'pd.DataFrame', The long-format frame of OHLCV prices and volumes, one row per ticker and date
+        """
+        DB_HOST = 'localhost'
+        DB_USER = 'sec_user'
+        DB_PASS = 'YOUR_PSWORD_HERE'
+        DB_NAME = 'securities_master'
+        con = mdb.connect(DB_HOST, DB_USER, DB_PASS, DB_NAME)
+        try:
+            return self._query_daily_universe(con, tickers, startdate, enddate, '%s', chunk_size)
+        finally:
+            con.close()
+
+    def get_daily_universe_sqlite(self, tickers, startdate, enddate, source="./Data/securities_master.db", chunk_size=500):
+        """
+        Use DATABASE securities_master to query data for a whole list of tickers over one connection.
+        This method is used for RDBMS like SQLite.
+        Parameters
+        ----------
+        tickers : 'list', The ticker symbols, e.g. ['601988', '601388']
+        start_date : str, '%Y-%m-%d %H:%M:%S', The starting date to obtain pricing for
+        end_date : str, '%Y-%m-%d %H:%M:%S', The ending date to obtain pricing for
+        source : str, The place for SQLite *.db file
+        chunk_size : int, Maximum number of tickers bound into a single query, SQLite limits host parameters to 999 by default
+        Returns
+        -------
+        'pd.DataFrame', The long-format frame of OHLCV prices and volumes, one row per ticker and date
+        """
+        con = sqlite3.connect(source)
+        try:
+            return self._query_daily_universe(con, tickers, startdate, enddate, '?', chunk_size)
+        finally:
+            con.close()
+
     def get_daily_data_sql_to_csv(self, ticker, startdate, enddate, path='./', engine="MySQL"):
         """
         Export data from DB into csv file.
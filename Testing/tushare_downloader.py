@@ -0,0 +1,285 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime as dt
+import random
+import threading
+import time
+import zlib
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import numpy as np
+import pandas as pd
+
+from price_ingest import upsert_daily_prices
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket. Tokens refill continuously at rate per second up to capacity, every API call takes one.
+    """
+    def __init__(self, rate, capacity=1):
+        """
+        Parameters:
+        rate - Sustained number of calls per second.
+        capacity - Maximum burst of calls.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until tokens are available and takes them.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+                self.timestamp = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TushareApi(object):
+    """
+    Thin adapter over the tushare package exposing the two endpoints used for daily bars.
+    Tushare Pro token should be preset.
+    """
+    def __init__(self):
+        import tushare as ts
+        self.ts = ts
+        self.pro = ts.pro_api()
+
+    def pro_bar(self, ts_code, start_date, end_date):
+        return self.ts.pro_bar(ts_code=ts_code, start_date=start_date, end_date=end_date, adj=None)
+
+    def adj_factor(self, ts_code, start_date, end_date):
+        return self.pro.adj_factor(ts_code=ts_code, start_date=start_date, end_date=end_date)
+
+
+class LocalTushareApi(object):
+    """
+    Offline stand-in for TushareApi returning random-walk bars in the Tushare frame layout after a simulated latency.
+    Used to test the downloader and to measure its throughput without network access or API quota.
+    """
+    def __init__(self, latency=0.05, failure_rate=0.0, seed=0, gap_rate=0.0, broken_tickers=()):
+        """
+        Parameters:
+        latency - Seconds every call sleeps to imitate the round trip.
+        failure_rate - Probability that a call raises, to exercise the retries.
+        gap_rate - Probability that adj_factor returns None or an empty frame, and share of the bars without volume.
+        broken_tickers - Tickers whose pro_bar frame lacks the vol column, so they cannot be converted.
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.gap_rate = gap_rate
+        self.broken_tickers = set(broken_tickers)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def _call(self, ts_code, start_date, end_date):
+        with self.lock:
+            self.calls += 1
+            fail = self.random.random() < self.failure_rate
+        time.sleep(self.latency)
+        if fail:
+            raise IOError("Simulated Tushare failure for %s" % ts_code)
+        # Tushare returns the most recent bar first
+        days = pd.bdate_range(pd.Timestamp(start_date), pd.Timestamp(end_date))[::-1]
+        rng = np.random.RandomState(zlib.crc32(ts_code.encode('utf-8')))
+        return days, rng
+
+    def pro_bar(self, ts_code, start_date, end_date):
+        days, rng = self._call(ts_code, start_date, end_date)
+        close = 10.0 * np.exp(np.cumsum(rng.normal(0.0, 0.02, len(days))))
+        volume = rng.randint(1000, 100000, len(days)).astype(float)
+        volume[rng.random_sample(len(days)) < self.gap_rate] = np.nan
+        frame = pd.DataFrame({
+            'ts_code': ts_code, 'trade_date': days.strftime('%Y%m%d'), 'open': close * 0.995, 'high': close * 1.01,
+            'low': close * 0.99, 'close': close, 'vol': volume
+        })
+        if ts_code in self.broken_tickers:
+            del frame['vol']
+        return frame
+
+    def adj_factor(self, ts_code, start_date, end_date):
+        days, rng = self._call(ts_code, start_date, end_date)
+        if rng.random_sample() < self.gap_rate:
+            return None if rng.random_sample() < 0.5 else pd.DataFrame()
+        return pd.DataFrame({'ts_code': ts_code, 'trade_date': days.strftime('%Y%m%d'), 'adj_factor': 1.0})
+
+
+def tushare_frames_to_rows(bars, factors):
+    """
+    Merges the pro_bar and adj_factor frames of one ticker into (price_date, open, high, low, close, volume, adj_factor) tuples.
+    Prices are non-adjusted, volume is converted from lots to shares. Bars without volume are dropped.
+    A missing or empty adj_factor frame counts as no adjustment, the factor is then 1.0.
+    """
+    if bars is None or len(bars) == 0:
+        return []
+    data = bars[['trade_date', 'open', 'high', 'low', 'close', 'vol']]
+    data = data[data['vol'].notna()]
+    if factors is not None and 'adj_factor' in factors.columns and len(factors) > 0:
+        data = pd.merge(data, factors[['trade_date', 'adj_factor']], how='left', on='trade_date')
+    else:
+        data = data.assign(adj_factor=np.nan)
+    data = data.sort_values('trade_date')
+    data['adj_factor'] = data['adj_factor'].ffill().fillna(1.0)
+    return list(zip(
+        pd.to_datetime(data['trade_date']).dt.to_pydatetime(),
+        data['open'].tolist(), data['high'].tolist(), data['low'].tolist(), data['close'].tolist(),
+        (data['vol'] * 100).astype(np.int64).tolist(), data['adj_factor'].tolist()
+    ))
+
+
+class ConcurrentDownloader(object):
+    """
+    Downloads daily bars for many tickers with a thread pool, sharing one token bucket across all API calls.
+    pro_bar and adj_factor of a ticker run concurrently, every call is retried with exponential backoff,
+    and a single writer thread commits the merged rows to the db in batches.
+    """
+    def __init__(self, api, connect, rate=1.3, burst=2, max_workers=4, max_retries=3, backoff=1.0,
+                 engine="MySQL", data_vendor_id=2, batch_size=5000):
+        """
+        Parameters:
+        api - TushareApi, LocalTushareApi or any object with pro_bar() and adj_factor().
+        connect - Callable returning a new db connection, called inside the writer thread.
+        rate - Sustained API calls per second.
+        burst - Token bucket capacity.
+        max_workers - Number of concurrent API calls.
+        max_retries - Retries per call before the ticker is given up.
+        backoff - Initial backoff in seconds, doubled on every retry.
+        engine - "MySQL" or "SQLite", passed to upsert_daily_prices().
+        data_vendor_id - Vendor id stored with every bar.
+        batch_size - Rows per db transaction.
+        """
+        self.api = api
+        self.connect = connect
+        self.bucket = TokenBucket(rate, burst)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.engine = engine
+        self.data_vendor_id = data_vendor_id
+        self.batch_size = batch_size
+        self.failed = []
+        # API calls made by run(), retries included
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def _fetch(self, endpoint, tick, start_date, end_date):
+        """
+        Calls one endpoint under the rate limit, retrying with backoff.
+        """
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            with self.calls_lock:
+                self.calls += 1
+            try:
+                return getattr(self.api, endpoint)(tick, start_date, end_date)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                print("Retrying %s for %s in %.1fs (%s)" % (endpoint, tick, delay, e))
+                time.sleep(delay)
+                attempt += 1
+
+    def _writer(self, rows_queue, stats):
+        """
+        Drains rows_queue into the db in batches until the None sentinel arrives.
+        """
+        totals = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        con = None
+        batch = []
+        while True:
+            rows = rows_queue.get()
+            if rows is not None and 'error' not in stats:
+                batch.extend(rows)
+            if batch and (rows is None or len(batch) >= self.batch_size):
+                try:
+                    if con is None:
+                        con = self.connect()
+                    result = upsert_daily_prices(con, batch, engine=self.engine, batch_size=self.batch_size)
+                except Exception as e:
+                    # Keep draining so the downloads are not blocked, run() raises once they finished
+                    stats['error'] = e
+                else:
+                    for k in totals:
+                        totals[k] += result[k]
+                batch = []
+            if rows is None:
+                break
+        if con is not None:
+            con.close()
+        stats.update(totals)
+
+    def run(self, todo, end_date):
+        """
+        Downloads and stores the bars of every (symbol_id, ticker, start_date) in todo up to end_date.
+
+        Returns:
+        dict - tickers downloaded, failed tickers, api calls, db row counts and elapsed seconds.
+        """
+        start = time.perf_counter()
+        self.failed = []
+        self.calls = 0
+        stats = {}
+        rows_queue = queue.Queue(maxsize=4 * self.max_workers)
+        writer = threading.Thread(target=self._writer, args=(rows_queue, stats))
+        writer.start()
+
+        pending = {}
+        done = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {}
+                for symbol_id, tick, start_date in todo:
+                    pending[tick] = {}
+                    for endpoint in ('pro_bar', 'adj_factor'):
+                        future = pool.submit(self._fetch, endpoint, tick, start_date, end_date)
+                        futures[future] = (symbol_id, tick, endpoint)
+                for future in as_completed(futures):
+                    symbol_id, tick, endpoint = futures[future]
+                    if tick not in pending:
+                        continue  # The other endpoint of this ticker already failed
+                    # A failed call or frames that cannot be converted give up this ticker only
+                    try:
+                        pending[tick][endpoint] = future.result()
+                        rows = None
+                        if len(pending[tick]) == 2:
+                            frames = pending.pop(tick)
+                            now = dt.utcnow()
+                            rows = [
+                                (self.data_vendor_id, symbol_id, d[0], now, now, d[1], d[2], d[3], d[4], d[5], d[6])
+                                for d in tushare_frames_to_rows(frames['pro_bar'], frames['adj_factor'])
+                            ]
+                    except Exception as e:
+                        print("Could not download Tushare data for %s ticker (%s)...skipping." % (tick, e))
+                        self.failed.append(tick)
+                        pending.pop(tick, None)
+                        continue
+                    if rows is not None:
+                        rows_queue.put(rows)
+                        done += 1
+        finally:
+            rows_queue.put(None)
+            writer.join()
+        if 'error' in stats:
+            raise stats.pop('error')
+
+        elapsed = time.perf_counter() - start
+        stats.update({
+            'tickers': done, 'failed': list(self.failed), 'api_calls': self.calls, 'seconds': elapsed,
+            'tickers_per_second': done / elapsed if elapsed > 0 else 0.0
+        })
+        return stats
@@ -7,6 +7,8 @@ except ImportError:
 import sqlite3
 import tushare as ts
 import pandas as pd
+from price_ingest import upsert_daily_prices, format_upsert_stats
+from tushare_downloader import ConcurrentDownloader, TushareApi, tushare_frames_to_rows
 
 
 def obtain_db_connection(source="MySQL", path="./Data/securities_master.db"):
@@ -74,63 +76,107 @@ def tushare_data(tick, start_date, end_date):
         errList.append(tick)
         return []
     else:
-        data = pd.merge(data0[['ts_code','trade_date','open','high','low','close','vol']],
-                        data1[['trade_date','adj_factor']], how='left', left_on='trade_date', right_on='trade_date')
-        data.vol = data.vol.apply(lambda x: int(x * 100))
-        data.trade_date = pd.to_datetime(data.trade_date)
-        data['adj_factor'].fillna(method='pad',inplace=True)
-        prices = []
-        for i, day in enumerate(data.trade_date):
-            prices.append(
-                (
-                    data.iat[i,1].to_pydatetime(), # d0, trade_date, change into datetime object rather than pd.TimeStamp Object
-                    data.iat[i,2], # d1, open_price
-                    data.iat[i,3], # d2, high_price
-                    data.iat[i,4], # d3, low_price
-                    data.iat[i,5], # d4, close_price
-                    int(data.iat[i,6]), # d5, volume
-                    data.iat[i,7] # d6, adj_factor
-                ))
-        return prices
-
-
-def insert_daily_data_into_db(data_vendor_id, symbol_id, daily_data, engine="MySQL"):
-    """
-    Takes a list of tuples of daily_data and adds it to the MySQL database. Appends the vendor ID and symbol ID to the data.
+        # Merge both frames and build the rows column by column; nothing new since start_date gives an empty list
+        return tushare_frames_to_rows(data0, data1)
+
+
+def insert_daily_data_into_db(data_vendor_id, symbol_id, daily_data, engine="MySQL", batch_size=5000):
+    """
+    Takes a list of tuples of daily_data and upserts it into the database. Appends the vendor ID and symbol ID to the data.
+    Bars already stored for the same symbol and date are updated in place, so re-running a download does not create duplicates.
+    Returns the dict of row counts and rates from price_ingest.upsert_daily_prices().
     """
     # Amend the data to include the vendor ID and symbol ID
+    now = dt.utcnow()
     daily_data = [
-        (data_vendor_id, symbol_id, d[0], dt.utcnow(), dt.utcnow(), d[1], d[2], d[3], d[4], d[5], d[6]) for d in daily_data
+        (data_vendor_id, symbol_id, d[0], now, now, d[1], d[2], d[3], d[4], d[5], d[6]) for d in daily_data
     ]
-    # Create the insert strings
-    column_str = (
-        "data_vendor_id, symbol_id, price_date, created_date, last_updated_date, open_price, high_price, low_price, close_price, volume, adj_factor"
-    )
-    insert_str = ("%s, " * 11)[:-2]
-    if engine == "SQLite":  # Support for sqlite3
-        insert_str = ("?, " * 11)[:-2]
-    final_str = ("INSERT INTO daily_price (%s) VALUES (%s)" % (column_str, insert_str))
-    # Using the MySQL connection, carry out an INSERT INTO for every symbol
-    cur = con.cursor()
-    cur.executemany(final_str, daily_data)
-    con.commit()
+    # Using the db connection, carry out batched INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE for every symbol
+    return upsert_daily_prices(con, daily_data, engine=engine, batch_size=batch_size)
+
+
+def obtain_latest_price_dates(connection):
+    """
+    Obtains the date of the latest stored bar of every symbol in one grouped query.
+    This function works the same on mdb or sqlite3 cursor
+    :return: dict - symbol_id to pd.Timestamp
+    """
+    cur = connection.cursor()
+    cur.execute("SELECT symbol_id, MAX(price_date) FROM daily_price GROUP BY symbol_id")
+    data = cur.fetchall()
+    return dict((d[0], pd.Timestamp(d[1])) for d in data if d[1] is not None)
+
+
+def sync_tickers(tickers, latest_dates, end_date, initial_start_date='20000101'):
+    """
+    Works out the missing tail of history for every ticker.
+    :param tickers: output from tushare_ticker(), list of [symbol_id, ticker]
+    :param latest_dates: output from obtain_latest_price_dates()
+    :param end_date: str, '%Y%m%d', last date to download
+    :param initial_start_date: str, '%Y%m%d', start date for symbols without any stored bar
+    :return: list of (symbol_id, ticker, start_date) for the tickers that are not up to date
+    """
+    todo = []
+    for symbol_id, tick in tickers:
+        last = latest_dates.get(symbol_id)
+        if last is None:
+            start_date = initial_start_date
+        else:
+            start_date = (last + pd.Timedelta(days=1)).strftime('%Y%m%d')
+        if start_date <= end_date:
+            todo.append((symbol_id, tick, start_date))
+    return todo
+
+
+def download_and_store(todo, end_date, data_vendor_id=2, engine="MySQL", wait=1.5):
+    """
+    Downloads and upserts the bars of every (symbol_id, ticker, start_date) in todo, waiting between API calls.
+    """
+    lentodo = len(todo)
+    for i, (symbol_id, tick, start_date) in enumerate(todo):
+        print("Adding data for %s from %s: %s out of %s" % (tick, start_date, i+1, lentodo))
+        ts_data = tushare_data(tick, start_date=start_date, end_date=end_date)
+        stats = insert_daily_data_into_db(data_vendor_id, symbol_id, ts_data, engine=engine)
+        print(format_upsert_stats(stats))
+        time.sleep(wait)
 
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Download Tushare daily bars into securities_master")
+    parser.add_argument('--mode', choices=['full', 'sync'], default='full', help="'sync' only fetches the bars after the latest stored one of each symbol")
+    parser.add_argument('--start', default='20000101', help="Start date of 'full' mode, or of symbols without bars in 'sync' mode")
+    parser.add_argument('--end', default=None, help="End date, defaults to today in 'sync' mode and to 20100103 in 'full' mode")
+    parser.add_argument('--engine', choices=['MySQL', 'SQLite'], default='MySQL')
+    parser.add_argument('--path', default="Z:/DB/securities_master.db", help="Path of the SQLite db")
+    parser.add_argument('--workers', type=int, default=1, help="Concurrent API calls, more than 1 uses tushare_downloader.ConcurrentDownloader")
+    parser.add_argument('--rate', type=float, default=1.3, help="API calls per second allowed with --workers")
+    args = parser.parse_args()
     # Please set Tushare Pro API before use this
     # Adjust how frequently the API is called (second)
     WAIT_TIME_IN_SECONDS = 1.5
     errList = []
     # warnings.filterwarnings('ignore')
-    con = obtain_db_connection(source="MySQL", path="Z:/DB/securities_master.db")
+    con = obtain_db_connection(source=args.engine, path=args.path)
     ticker_list = obtain_list_of_db_tickers(connection=con)
     tickers = tushare_ticker(ticker_list, ric=True)  # DB stores RIC as ticker; if not, set 'ric' to False
-    lentickers = len(tickers)
-    for i, t in enumerate(tickers):
-        print("Adding data for %s: %s out of %s" % (t[1], i+1, lentickers))
-        ts_data = tushare_data(t[1],start_date='20000101',end_date='20100103')
-        insert_daily_data_into_db(2, t[0], ts_data)
-        time.sleep(WAIT_TIME_IN_SECONDS)
+    if args.mode == 'sync':
+        end_date = args.end or dt.now().strftime('%Y%m%d')
+        todo = sync_tickers(tickers, obtain_latest_price_dates(con), end_date, initial_start_date=args.start)
+        print("%s out of %s tickers need new bars" % (len(todo), len(tickers)))
+    else:
+        end_date = args.end or '20100103'
+        todo = [(t[0], t[1], args.start) for t in tickers]
+    if args.workers > 1:
+        downloader = ConcurrentDownloader(
+            TushareApi(), lambda: obtain_db_connection(source=args.engine, path=args.path),
+            rate=args.rate, max_workers=args.workers, engine=args.engine, data_vendor_id=2
+        )
+        stats = downloader.run(todo, end_date)
+        print("%s tickers in %.1f s, %s rows inserted, %s updated" % (stats['tickers'], stats['seconds'], stats['inserted'], stats['updated']))
+        errList = stats['failed']
+    else:
+        download_and_store(todo, end_date, data_vendor_id=2, engine=args.engine, wait=WAIT_TIME_IN_SECONDS)
     errList = pd.Series(errList)
     errList.to_csv('ErrorList.csv',header=False,index=False,encoding='UTF-8')
     print("Successfully added TuSharePro pricing data to DB.")
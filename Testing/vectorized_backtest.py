@@ -0,0 +1,203 @@
+import functools
+
+import numpy as np
+import pandas as pd
+
+from backtest import Backtest
+from bar_source import BarSource, InMemoryBarSource, SyntheticBarSource
+from execution import SimulatedExecutionHandler
+from performance import create_sharpe_ratio, create_drawdowns
+from portfolio import Portfolio, SMOOTHING_WEIGHTS
+from progress import ProgressSink
+from strategy import TargetPositionStrategy, VectorizedMovingAverageCross
+
+
+def ib_commission(quantity):
+    """
+    Vectorized FillEvent.calculate_ib_commission(): the commission of every (positive) fill quantity in the array.
+    """
+    quantity = np.asarray(quantity, dtype=np.float64)
+    return np.where(quantity <= 500, np.maximum(1.3, 0.013 * quantity), np.maximum(1.3, 0.008 * quantity))
+
+
+class VectorizedBacktest(object):
+    """
+    Runs a VectorizedStrategy on the whole bar matrices at once, reproducing the accounting of the event-driven Backtest
+    with Portfolio and SimulatedExecutionHandler:
+    - a change of the target position is split into slices executed on the bar of the signal and the following bars,
+    - every slice is filled at the adj_close of its bar and charged the IB commission,
+    - holdings are recorded at the start of every bar, short positions and missing prices are valued at 0,
+    - the data feed replays the last bar once more after the data is exhausted, which adds a last holdings row.
+    """
+    def __init__(self, symbol_list, initial_capital, startdate, enddate, data, strategy, weights=SMOOTHING_WEIGHTS):
+        """
+        Initialises the vectorized backtest.
+
+        Parameters:
+        symbol_list - The list of symbol strings.
+        initial_capital - The starting capital for the portfolio.
+        startdate - The start datetime of the strategy.
+        enddate - The end datetime of the strategy.
+        data - A BarStore, or a BarSource the bars are loaded from.
+        strategy - A VectorizedStrategy instance.
+        weights - Share of every order executed on the bar of the signal and each following bar.
+        """
+        self.symbol_list = symbol_list
+        self.initial_capital = initial_capital
+        self.start_date = startdate
+        self.end_date = enddate
+        self.strategy = strategy
+        self.weights = weights
+        if isinstance(data, BarSource):
+            data = data.load(symbol_list, startdate.strftime('%Y-%m-%d %H:%M:%S'), enddate.strftime('%Y-%m-%d %H:%M:%S'))
+        self.bars = data
+
+        self.signals = 0
+        self.orders = 0
+        self.fills = 0
+
+    def run(self):
+        """
+        Computes the fills, positions, holdings and equity curve. Returns the equity curve DataFrame.
+        """
+        n = len(self.bars)
+        # The extra MarketEvent at the end of the feed replays the last bar
+        prices = np.vstack([self.bars.fields['adj_close'], self.bars.fields['adj_close'][-1:]])
+        targets = np.nan_to_num(np.asarray(self.strategy.generate_targets(self.bars), dtype=np.float64))
+        targets = np.vstack([targets, targets[-1:]])
+        deltas = np.diff(targets, axis=0, prepend=0.0)
+
+        trades = np.zeros(prices.shape)
+        commission = np.zeros(n + 1)
+        self.signals = int(np.count_nonzero(deltas))
+        self.orders = 0
+        for k, w in enumerate(self.weights[:n + 1]):
+            quantity = w * deltas[:n + 1 - k]
+            traded = quantity != 0.0
+            trades[k:] += quantity
+            commission[k:] += np.where(traded, ib_commission(np.abs(quantity)), 0.0).sum(axis=1)
+            self.orders += int(np.count_nonzero(traded))
+        self.fills = self.orders
+
+        # A symbol without a price yet is only NaN in cash if it actually trades, as in the event-driven portfolio
+        cost = np.where(trades != 0.0, trades * prices, 0.0).sum(axis=1) + commission
+        # Holdings are recorded before the fills of their bar
+        positions = np.vstack([np.zeros((1, len(self.symbol_list))), np.cumsum(trades, axis=0)[:-1]])
+        cash = self.initial_capital - np.concatenate([[0.0], np.cumsum(cost)[:-1]])
+        paid = np.concatenate([[0.0], np.cumsum(commission)[:-1]])
+        market_value = positions * prices
+        market_value = np.where(market_value >= 0.0, market_value, 0.0)
+
+        index = [self.start_date] + list(self.bars.index) + [self.bars.index[-1]]
+        positions = np.where(positions >= 0.0, positions, 0.0)
+        self.positions = pd.DataFrame(np.vstack([np.zeros((1, len(self.symbol_list))), positions]), columns=self.symbol_list)
+        self.positions.insert(len(self.symbol_list), 'datetime', index)
+
+        holdings = pd.DataFrame(np.vstack([np.zeros((1, len(self.symbol_list))), market_value]), columns=self.symbol_list)
+        holdings['datetime'] = index
+        holdings['cash'] = np.concatenate([[self.initial_capital], cash])
+        holdings['commission'] = np.concatenate([[0.0], paid])
+        holdings['total'] = np.concatenate([[self.initial_capital], cash + market_value.sum(axis=1)])
+        self.holdings = holdings
+
+        curve = holdings.set_index('datetime')
+        returns = curve['total'].pct_change()
+        returns.iloc[0] = 0.0
+        curve['returns'] = returns
+        curve['equity_curve'] = (1.0 + curve['returns']).cumprod()
+        self.equity_curve = curve
+        return curve
+
+    def output_summary_stats(self, frequency=252):
+        """
+        Creates a list of summary statistics for the portfolio, as Portfolio.output_summary_stats().
+        """
+        total_return = self.equity_curve['equity_curve'].iloc[-1]
+        returns = self.equity_curve['returns']
+        pnl = self.equity_curve['equity_curve']
+
+        sharpe_ratio = create_sharpe_ratio(returns, periods=frequency)
+        drawdown, max_dd, dd_duration = create_drawdowns(pnl)
+        drawdown.iloc[0] = 0.0
+        self.equity_curve['drawdown'] = drawdown.values
+
+        return [("Total Return", "%0.2f%%" % ((total_return - 1.0) * 100.0)),
+        ("Sharpe Ratio", "%0.2f" % sharpe_ratio), ("Max Drawdown", "%0.2f%%" % (max_dd * 100.0)), ("Drawdown Duration", "%d" % dd_duration)]
+
+
+def check_parity(data, symbol_list, strategy, startdate, enddate, initial_capital=1000000.0, weights=SMOOTHING_WEIGHTS, rtol=1e-9, causal=True):
+    """
+    Runs strategy through VectorizedBacktest and, wrapped in TargetPositionStrategy, through the event-driven Backtest on the same bars.
+    With causal, the event-driven run recomputes the targets of every bar from the bars up to it, so a strategy looking ahead fails the check.
+    Raises AssertionError if the targets look ahead, or if the signal, order or fill counts, the positions or the holdings differ.
+
+    Parameters:
+    data - A BarStore or a BarSource.
+    strategy - A VectorizedStrategy instance.
+    weights - Smoothing weights of both engines.
+    rtol - Relative tolerance of the holdings, both engines sum the fills in a different order.
+    causal - If False, the targets are computed once from all bars, which only checks the accounting but times the event-driven engine fairly.
+
+    Returns:
+    dict - The largest absolute holdings difference and the run time of both engines.
+    """
+    import time
+    if isinstance(data, BarSource):
+        data = data.load(symbol_list, startdate.strftime('%Y-%m-%d %H:%M:%S'), enddate.strftime('%Y-%m-%d %H:%M:%S'))
+
+    start = time.perf_counter()
+    vectorized = VectorizedBacktest(symbol_list, initial_capital, startdate, enddate, data.view(), strategy, weights)
+    vectorized.run()
+    t_vectorized = time.perf_counter() - start
+
+    start = time.perf_counter()
+    backtest = Backtest('./', symbol_list, initial_capital, 0.0, startdate, enddate, InMemoryBarSource(data), SimulatedExecutionHandler,
+                        functools.partial(Portfolio, smoothing_weights=weights), functools.partial(TargetPositionStrategy, causal=causal), strategy,
+                        progress=ProgressSink())
+    backtest.simulate_trading()
+    t_event = time.perf_counter() - start
+
+    for name in ('signals', 'orders', 'fills'):
+        assert getattr(backtest, name) == getattr(vectorized, name), \
+            "%s: event-driven %d, vectorized %d" % (name, getattr(backtest, name), getattr(vectorized, name))
+    columns = list(symbol_list) + ['cash', 'commission', 'total']
+    expected = backtest.portfolio.holdings_frame()
+    assert len(expected) == len(vectorized.holdings), "holdings rows: event-driven %d, vectorized %d" % (len(expected), len(vectorized.holdings))
+    assert list(expected.index) == list(vectorized.holdings['datetime'])
+    np.testing.assert_allclose(vectorized.holdings[columns].values, expected[columns].values.astype(np.float64), rtol=rtol, atol=1e-6)
+    positions = backtest.portfolio.positions_frame()
+    np.testing.assert_allclose(vectorized.positions[list(symbol_list)].values, positions[list(symbol_list)].values.astype(np.float64), rtol=rtol, atol=1e-9)
+
+    return {
+        'max_abs_diff': float(np.nanmax(np.abs(vectorized.holdings[columns].values - expected[columns].values.astype(np.float64)))),
+        'event_driven': t_event, 'vectorized': t_vectorized,
+    }
+
+
+def parity_suite():
+    """
+    Checks VectorizedBacktest against Backtest on synthetic data: several seeds, windows and universe sizes, with and without missing bars.
+    """
+    from datetime import datetime
+    cases = [
+        # seed, missing bar fraction, symbols, short and long window, quantity, smoothing weights
+        (0, 0.0, 1, 5, 20, 100, SMOOTHING_WEIGHTS),
+        (1, 0.0, 5, 10, 30, 1000, SMOOTHING_WEIGHTS),
+        (2, 0.05, 10, 10, 40, 250, SMOOTHING_WEIGHTS),
+        (3, 0.2, 3, 3, 7, 600, SMOOTHING_WEIGHTS),
+        (4, 0.05, 5, 5, 20, 700, (1.0,)),
+        (5, 0.05, 5, 5, 20, 700, (0.5, 0.0, 0.3, 0.2)),
+    ]
+    for seed, missing, n_symbols, short_window, long_window, quantity, weights in cases:
+        symbol_list = ['%06d' % (600000 + i) for i in range(n_symbols)]
+        result = check_parity(
+            SyntheticBarSource(seed=seed, missing=missing), symbol_list, VectorizedMovingAverageCross(short_window, long_window, quantity),
+            datetime(2012, 1, 1), datetime(2016, 1, 1), weights=weights
+        )
+        print("seed %d, missing %.2f, %2d symbols, MA %d/%d, %d slices: max diff %.2e, event-driven %.3f s, vectorized %.4f s" % (
+            seed, missing, n_symbols, short_window, long_window, len(weights), result['max_abs_diff'], result['event_driven'], result['vectorized']))
+    print("Parity OK")
+
+
+if __name__ == "__main__":
+    parity_suite()
@@ -0,0 +1,158 @@
+from multiprocessing import Pool
+import os
+
+import numpy as np
+import pandas as pd
+
+from bar_source import BarSource
+from performance import create_sharpe_ratio, create_drawdowns
+from sweep import init_worker, run_window, share_store, worker_store
+
+
+def run_fold(store, start, stop, window, settings, keep_curve=False):
+    """
+    Runs window over the bars [start, stop) of store. The slice is a view, no bar is copied.
+    """
+    bars = store.slice(start, stop)
+    settings = dict(settings, startdate=bars.index[0].to_pydatetime(), enddate=bars.index[-1].to_pydatetime())
+    return run_window(bars, window, settings, keep_curve=keep_curve)
+
+
+def _run_fold_worker(task):
+    return run_fold(worker_store(), *task)
+
+
+class WalkForward(object):
+    """
+    Rolling in-sample/out-of-sample evaluation of a strategy over one preloaded, aligned universe.
+    Every fold picks the window with the best in-sample objective on its train bars and runs it on the following test bars.
+    The out-of-sample returns of all folds are stitched into one equity curve.
+
+    The universe is loaded and placed in shared memory once, and a single process pool serves all folds:
+    the in-sample runs of every fold and window are dispatched together, then the out-of-sample runs.
+    Folds only differ by a [start, stop) view of the shared matrices.
+    """
+    def __init__(self, symbol_list, initial_capital, data, execution_handler, portfolio, strategy, windows,
+                 train_bars, test_bars, warmup=0, step=None, objective='Sharpe Ratio', processes=None, frequency=252,
+                 startdate=None, enddate=None):
+        """
+        Initialises the walk-forward run.
+
+        Parameters:
+        symbol_list - The list of symbol strings.
+        initial_capital - The starting capital of every fold.
+        data - A BarStore, or a BarSource the universe is loaded from once between startdate and enddate.
+        execution_handler - (Class) Handles the orders/fills for trades.
+        portfolio - (Class) Keeps track of portfolio current and prior positions.
+        strategy - (Class) Generates signals based on market data.
+        windows - The candidate strategy windows, e.g. from product_grid().
+        train_bars - Number of in-sample bars of every fold.
+        test_bars - Number of out-of-sample bars of every fold.
+        warmup - Bars before the test bars replayed to warm up the strategy, their returns are not counted. At most train_bars.
+        step - Bars between the starts of two folds, defaults to test_bars so the test windows do not overlap.
+        objective - Column of the summary stats maximised in sample, e.g. 'Sharpe Ratio' or 'Total Return'.
+        processes - Number of worker processes, defaults to the number of cores. 1 runs in the current process.
+        frequency - Periods per year, passed to the summary stats.
+        startdate, enddate - datetime, only used to load data from a BarSource.
+        """
+        if warmup > train_bars:
+            raise ValueError("warmup (%d) cannot exceed train_bars (%d)" % (warmup, train_bars))
+        if isinstance(data, BarSource):
+            data = data.load(symbol_list, startdate.strftime('%Y-%m-%d %H:%M:%S'), enddate.strftime('%Y-%m-%d %H:%M:%S'))
+        self.bars = data
+        self.symbol_list = symbol_list
+        self.windows = windows
+        self.train_bars = train_bars
+        self.test_bars = test_bars
+        self.warmup = warmup
+        self.step = step or test_bars
+        self.objective = objective
+        self.processes = processes or os.cpu_count() or 1
+        self.frequency = frequency
+        self.settings = {
+            'initial_capital': initial_capital, 'startdate': None, 'enddate': None,
+            'execution_handler': execution_handler, 'portfolio': portfolio, 'strategy': strategy, 'frequency': frequency,
+        }
+
+    def folds(self):
+        """
+        Returns the (train_start, train_stop, test_start, test_stop) bar positions of every fold.
+        """
+        folds = []
+        start = 0
+        while start + self.train_bars + self.test_bars <= len(self.bars):
+            train_stop = start + self.train_bars
+            folds.append((start, train_stop, train_stop, train_stop + self.test_bars))
+            start += self.step
+        return folds
+
+    def _map(self, run, tasks):
+        if run is None:
+            return [run_fold(self.bars, *task) for task in tasks]
+        return run(_run_fold_worker, tasks, chunksize=1)
+
+    def run(self):
+        """
+        Runs all folds. Returns the stitched out-of-sample equity curve DataFrame, the per-fold table is kept in self.results.
+        """
+        folds = self.folds()
+        if not folds:
+            raise ValueError("%d bars are not enough for one fold of %d + %d bars" % (len(self.bars), self.train_bars, self.test_bars))
+
+        pool = None
+        blocks = []
+        if self.processes > 1:
+            spec, blocks = share_store(self.bars)
+            pool = Pool(self.processes, initializer=init_worker, initargs=(spec, self.settings))
+        try:
+            run = None if pool is None else pool.map
+            # In-sample: every window of every fold at once
+            train_tasks = [(train_start, train_stop, window, self.settings) for train_start, train_stop, _, _ in folds for window in self.windows]
+            in_sample = self._map(run, train_tasks)
+            best = []
+            for i in range(len(folds)):
+                scores = [r[self.objective] for r in in_sample[i * len(self.windows):(i + 1) * len(self.windows)]]
+                scores = [-np.inf if not isinstance(v, float) or np.isnan(v) else v for v in scores]
+                best.append(int(np.argmax(scores)))
+            # Out-of-sample: the best window of every fold, preceded by the warm-up bars
+            test_tasks = [(test_start - self.warmup, test_stop, self.windows[best[i]], self.settings, True)
+                          for i, (_, _, test_start, test_stop) in enumerate(folds)]
+            out_of_sample = self._map(run, test_tasks)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+        rows = []
+        returns = []
+        for i, (train_start, train_stop, test_start, test_stop) in enumerate(folds):
+            # Drop the replayed last bar, keep the initial capital row in front of the first bar
+            total = out_of_sample[i].pop('total')[:-1]
+            fold_returns = total[self.warmup + 1:] / total[self.warmup:-1] - 1.0
+            returns.append(pd.Series(fold_returns, index=self.bars.index[test_start:test_stop]))
+            row = {
+                'fold': i, 'train_start': self.bars.index[train_start], 'train_end': self.bars.index[train_stop - 1],
+                'test_start': self.bars.index[test_start], 'test_end': self.bars.index[test_stop - 1],
+                'window': self.windows[best[i]], 'in_sample_%s' % self.objective: in_sample[i * len(self.windows) + best[i]][self.objective],
+                'out_of_sample_return': (np.prod(1.0 + fold_returns) - 1.0) * 100.0,
+            }
+            rows.append(row)
+        self.results = pd.DataFrame(rows)
+
+        curve = pd.DataFrame({'returns': pd.concat(returns)})
+        curve['equity_curve'] = (1.0 + curve['returns']).cumprod()
+        self.equity_curve = curve
+        return curve
+
+    def output_summary_stats(self):
+        """
+        Creates a list of summary statistics of the stitched out-of-sample equity curve.
+        """
+        total_return = self.equity_curve['equity_curve'].iloc[-1]
+        sharpe_ratio = create_sharpe_ratio(self.equity_curve['returns'], periods=self.frequency)
+        drawdown, max_dd, dd_duration = create_drawdowns(self.equity_curve['equity_curve'])
+        return [("Total Return", "%0.2f%%" % ((total_return - 1.0) * 100.0)),
+        ("Sharpe Ratio", "%0.2f" % sharpe_ratio), ("Max Drawdown", "%0.2f%%" % (max_dd * 100.0)), ("Drawdown Duration", "%d" % dd_duration)]